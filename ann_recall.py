@@ -0,0 +1,109 @@
+"""
+Measure the local ANN index's recall against brute-force search
+
+Exports every entry embedding, picks a sample of entries as queries and
+compares the index's top-k (excluding the query entry itself) with the exact
+top-k for several nprobe settings, reporting recall and query latency.
+
+Uses the backend's own ANN index when it keeps one (ANN_INDEX_DIR), otherwise
+builds a throwaway index from the exported embeddings. --rebuild with
+--precision compares float32, float16 and int8 codes on the same data.
+
+Usage: python ann_recall.py [--k 10] [--queries 200] [--nprobe 1,4,8,16,32]
+       python ann_recall.py --rebuild --precision int8 [--no-rerank]
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+import numpy as np
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from diary.storage import create_database
+from diary.ann_index import IVFIndex
+from diary.quantization import PRECISIONS
+from diary.similarity import normalize_rows
+
+
+async def measure(args):
+    db = create_database()
+    await db.connect()
+
+    try:
+        ids = []
+        blocks = []
+        async for batch_ids, batch_vectors in db.export_embeddings(args.batch_size):
+            ids.extend(batch_ids)
+            blocks.append(batch_vectors)
+        if not ids:
+            print("[INFO] No embedded entries found, nothing to measure")
+            return
+        vectors = normalize_rows(np.vstack(blocks))
+        print(f"Loaded {len(ids)} embeddings")
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            index = getattr(db, "ann_index", None)
+            if index is None or args.rebuild:
+                print("Building a temporary ANN index...")
+                index = IVFIndex(
+                    tmp_dir,
+                    dim=vectors.shape[1],
+                    nlist=args.nlist,
+                    precision=args.precision,
+                    rerank=not args.no_rerank
+                )
+                index.open()
+                index.add_many(ids, vectors, retrain=False)
+                index.train()
+            print(
+                f"Index: {len(index)} vectors in {len(index.lists)} buckets, "
+                f"{index.precision}{' + float32 re-rank' if index.rerank else ''}"
+            )
+
+            rng = np.random.default_rng(args.seed)
+            sample = rng.choice(len(ids), min(args.queries, len(ids)), replace=False)
+
+            # Exact neighbours, excluding the query entry itself
+            exact = []
+            started = time.perf_counter()
+            for i in sample:
+                scores = vectors @ vectors[i]
+                scores[i] = -np.inf
+                top = np.argpartition(-scores, args.k)[:args.k]
+                exact.append({ids[j] for j in top})
+            brute_ms = (time.perf_counter() - started) * 1000 / len(sample)
+            print(f"Brute force: {brute_ms:.2f} ms/query")
+
+            for nprobe in [int(n) for n in args.nprobe.split(",")]:
+                recalls = []
+                latencies = []
+                for i, truth in zip(sample, exact):
+                    started = time.perf_counter()
+                    hits = index.search(vectors[i], args.k + 1, nprobe=nprobe)
+                    latencies.append((time.perf_counter() - started) * 1000)
+                    found = [entry_id for entry_id, _ in hits if entry_id != ids[i]][:args.k]
+                    recalls.append(len(truth.intersection(found)) / len(truth))
+                print(
+                    f"  nprobe={nprobe:<4} recall@{args.k}={np.mean(recalls):.3f} "
+                    f"mean={np.mean(latencies):.2f} ms p95={np.percentile(latencies, 95):.2f} ms"
+                )
+    finally:
+        await db.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure ANN index recall against brute force")
+    parser.add_argument("--k", type=int, default=10, help="Neighbours compared per query")
+    parser.add_argument("--queries", type=int, default=200, help="Number of sampled query entries")
+    parser.add_argument("--nprobe", default="1,4,8,16,32", help="Comma-separated nprobe values to test")
+    parser.add_argument("--nlist", type=int, default=None, help="Buckets for a rebuilt index (default 4*sqrt(n))")
+    parser.add_argument("--rebuild", action="store_true", help="Measure a freshly trained temporary index")
+    parser.add_argument("--precision", choices=PRECISIONS, default=os.getenv("EMBEDDING_PRECISION", "float32"),
+                        help="Code precision for a rebuilt index")
+    parser.add_argument("--no-rerank", action="store_true", help="Rebuilt index skips the exact re-rank")
+    parser.add_argument("--batch-size", type=int, default=5000, help="Rows per export batch")
+    parser.add_argument("--seed", type=int, default=0, help="Query sampling seed")
+    asyncio.run(measure(parser.parse_args()))
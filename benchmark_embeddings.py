@@ -0,0 +1,109 @@
+"""
+Compare embedding backends: torch, ONNX float32 and ONNX int8
+
+Each backend runs in a fresh process so its import and load cost is
+measured from scratch. Reports startup time, single-text latency (p50/p95,
+the search path) and batch throughput (the ingest path), plus peak memory.
+
+Usage: python benchmark_embeddings.py --model-dir ./models/all-MiniLM-L6-v2 [--queries 200] [--batch-size 32]
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+WORDS = (
+    "today I walked to the park with my sister and we talked about work family travel "
+    "plans music the weather dinner friends the new job feeling tired but grateful happy "
+    "anxious excited calm morning evening coffee book movie beach mountain city"
+).split()
+
+
+def sample_texts(count: int, min_words: int, max_words: int, seed: int = 0) -> list:
+    rng = random.Random(seed)
+    return [
+        " ".join(rng.choice(WORDS) for _ in range(rng.randint(min_words, max_words)))
+        for _ in range(count)
+    ]
+
+
+def measure(backend: str, model_dir: str, queries: int, batch_texts: int, batch_size: int, threads: int) -> dict:
+    """Load one backend and time it (runs in its own process)"""
+    import resource
+    import numpy as np
+
+    started = time.perf_counter()
+    if backend == "torch":
+        from sentence_transformers import SentenceTransformer
+        model = SentenceTransformer(model_dir, device="cpu")
+        if threads:
+            import torch
+            torch.set_num_threads(threads)
+    else:
+        from diary.onnx_encoder import OnnxEncoder
+        model = OnnxEncoder(model_dir, quantized=backend == "onnx-int8", threads=threads, batch_size=batch_size)
+    model.encode(["warm-up"], convert_to_numpy=True)
+    startup = time.perf_counter() - started
+
+    latencies = []
+    for text in sample_texts(queries, 3, 15, seed=1):
+        started = time.perf_counter()
+        model.encode(text, convert_to_numpy=True)
+        latencies.append((time.perf_counter() - started) * 1000)
+
+    texts = sample_texts(batch_texts, 20, 200, seed=2)
+    started = time.perf_counter()
+    model.encode(texts, batch_size=batch_size, convert_to_numpy=True)
+    throughput = len(texts) / (time.perf_counter() - started)
+
+    return {
+        "startup_s": startup,
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p95_ms": float(np.percentile(latencies, 95)),
+        "texts_per_s": throughput,
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    }
+
+
+def run(args):
+    from diary.onnx_encoder import onnx_model_path
+
+    backends = ["torch"]
+    if os.path.exists(onnx_model_path(args.model_dir)):
+        backends.append("onnx")
+    if os.path.exists(onnx_model_path(args.model_dir, quantized=True)):
+        backends.append("onnx-int8")
+    if len(backends) == 1:
+        print("[WARN] No ONNX export found - run export_onnx.py first")
+
+    print(f"{args.queries} single-text queries, {args.batch_texts} texts in batches of {args.batch_size}\n")
+    print(f"  {'backend':<10} {'startup':>9} {'p50':>9} {'p95':>9} {'throughput':>14} {'peak RSS':>10}")
+    context = multiprocessing.get_context("spawn")
+    for backend in backends:
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+            result = pool.submit(
+                measure, backend, args.model_dir, args.queries, args.batch_texts, args.batch_size, args.threads
+            ).result()
+        print(
+            f"  {backend:<10} {result['startup_s']:8.2f}s {result['p50_ms']:7.2f}ms {result['p95_ms']:7.2f}ms "
+            f"{result['texts_per_s']:9.1f} txt/s {result['peak_rss_mb']:8.0f}MB"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare embedding backend latency and throughput")
+    parser.add_argument("--model-dir", default=os.getenv("EMBED_MODEL_DIR"), help="Model bundle (see bundle_model.py)")
+    parser.add_argument("--queries", type=int, default=200, help="Single-text encodes for the latency figures")
+    parser.add_argument("--batch-texts", type=int, default=512, help="Texts encoded for the throughput figure")
+    parser.add_argument("--batch-size", type=int, default=32, help="Batch size for the throughput figure")
+    parser.add_argument("--threads", type=int, default=0, help="Intra-op threads (default: library default)")
+    args = parser.parse_args()
+    if not args.model_dir:
+        parser.error("--model-dir (or EMBED_MODEL_DIR) is required")
+    run(args)
@@ -0,0 +1,87 @@
+"""
+Benchmark graph extraction throughput
+
+Runs GraphProcessor.process_entry over long synthetic entries (or the text
+files in a directory) and reports documents per second, single-threaded and
+through process_entry_texts in a process pool.
+
+Usage: python benchmark_graph.py [--docs 500] [--words 1500] [--dir ~/journals]
+"""
+import argparse
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from diary.graph_processor import GraphProcessor, process_entry_texts
+
+FILLER = (
+    "the day started slowly and I made coffee before reading the news then we went to "
+    "the market with Sarah Jones to buy vegetables for dinner I felt grateful for the "
+    "quiet morning after a stressful week at work where the project deadline kept moving "
+    "later I visited the museum in New York and talked with an old friend about music "
+    "painting and travel plans for the summer \"slow living\" is what she called it"
+).split()
+
+
+def synthetic_entries(count: int, words: int, seed: int = 0) -> list:
+    rng = random.Random(seed)
+    vocabulary = FILLER + sorted(GraphProcessor.EMOTION_KEYWORDS | GraphProcessor.ACTIVITY_KEYWORDS)
+    entries = []
+    for _ in range(count):
+        sentence = [rng.choice(vocabulary) for _ in range(words)]
+        sentence[0] = sentence[0].capitalize()
+        entries.append(" ".join(sentence))
+    return entries
+
+
+def load_entries(directory: str) -> list:
+    entries = []
+    for dirpath, _, filenames in os.walk(directory):
+        for filename in sorted(filenames):
+            if filename.endswith((".txt", ".md")):
+                with open(os.path.join(dirpath, filename), "r", encoding="utf-8", errors="replace") as f:
+                    entries.append(f.read())
+    return entries
+
+
+def report(label: str, docs: int, words: int, seconds: float):
+    print(f"  {label:<28} {docs / seconds:8.1f} docs/s  {words / seconds / 1000:8.1f}k words/s")
+
+
+def run(args):
+    texts = load_entries(args.dir) if args.dir else synthetic_entries(args.docs, args.words)
+    if not texts:
+        print("[INFO] No entries to benchmark")
+        return
+    words = sum(len(text.split()) for text in texts)
+    print(f"Benchmarking {len(texts)} entries ({words / len(texts):.0f} words on average)")
+
+    processor = GraphProcessor()
+    processor.process_entry(texts[0])  # warm up regex caches
+
+    started = time.perf_counter()
+    for text in texts:
+        processor.process_entry(text)
+    report("process_entry", len(texts), words, time.perf_counter() - started)
+
+    started = time.perf_counter()
+    processor.process_entries(texts)
+    report("process_entries", len(texts), words, time.perf_counter() - started)
+
+    workers = args.workers or os.cpu_count() or 1
+    chunk_size = max(1, -(-len(texts) // workers))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        list(pool.map(process_entry_texts, [texts[:1]] * workers))  # start the workers
+        started = time.perf_counter()
+        list(pool.map(process_entry_texts, [texts[i:i + chunk_size] for i in range(0, len(texts), chunk_size)]))
+        report(f"process pool ({workers} workers)", len(texts), words, time.perf_counter() - started)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark graph extraction throughput")
+    parser.add_argument("--docs", type=int, default=500, help="Number of synthetic entries")
+    parser.add_argument("--words", type=int, default=1500, help="Words per synthetic entry")
+    parser.add_argument("--dir", default=None, help="Benchmark the .txt/.md files in this directory instead")
+    parser.add_argument("--workers", type=int, default=None, help="Process pool size (default: CPU count)")
+    run(parser.parse_args())
@@ -0,0 +1,51 @@
+"""
+Write the embedding model to a pinned local bundle for offline hosts
+
+Downloads the model once (or copies it from the local Hugging Face cache),
+saves it to --output together with a bundle.json manifest of file sizes and
+checksums, and checks that the saved copy loads and encodes. Point
+EMBED_MODEL_DIR at the directory; the backend then starts without contacting
+the Hugging Face hub. --verify re-hashes an existing bundle instead.
+
+Usage: python bundle_model.py --output ./models/all-MiniLM-L6-v2 [--verify]
+"""
+import argparse
+import os
+import time
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from diary.model_bundle import verify_bundle, write_manifest
+
+
+def bundle(args):
+    if args.verify:
+        manifest = verify_bundle(args.output, full=True)
+        print(f"[OK] Bundle of {manifest['model_name']} verified ({len(manifest['files'])} files)")
+        return
+
+    from sentence_transformers import SentenceTransformer
+
+    started = time.time()
+    model = SentenceTransformer(args.model)
+    os.makedirs(args.output, exist_ok=True)
+    model.save(args.output)
+    manifest = write_manifest(args.output, args.model)
+    size = sum(entry["size"] for entry in manifest["files"].values())
+    print(f"[OK] Saved {args.model} to {args.output} ({size / 1e6:.0f} MB) in {time.time() - started:.1f}s")
+
+    # Load the bundle the way the backend will, with the hub switched off
+    os.environ["HF_HUB_OFFLINE"] = "1"
+    os.environ["TRANSFORMERS_OFFLINE"] = "1"
+    embedding = SentenceTransformer(args.output).encode("Hello world")
+    print(f"[OK] Bundle loads offline (embedding dimension {embedding.shape[0]})")
+    print(f"[INFO] Set EMBED_MODEL_DIR={args.output}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Save the embedding model as an offline bundle")
+    parser.add_argument("--output", required=True, help="Bundle directory")
+    parser.add_argument("--model", default=os.getenv("EMBED_MODEL_NAME", "all-MiniLM-L6-v2"), help="Model to bundle")
+    parser.add_argument("--verify", action="store_true", help="Re-hash an existing bundle instead of writing one")
+    bundle(parser.parse_args())
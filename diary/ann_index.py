@@ -0,0 +1,411 @@
+"""
+In-process approximate nearest-neighbour index (IVF) over entry embeddings
+"""
+
+import json
+import os
+from typing import Dict, List, Optional, Set, Tuple
+
+import numpy as np
+
+from diary.locking import OwnerLock
+from diary.quantization import CODE_DTYPES, check_precision, dequantize, quantize
+
+INDEX_FILES = (
+    "vectors.f32", "vectors.f16", "vectors.i8", "scales.f32", "rerank.f32",
+    "clusters.i32", "ids.txt", "empty.txt", "centroids.npy", "meta.json"
+)
+
+
+def spherical_kmeans(vectors: np.ndarray, k: int, iterations: int = 10, seed: int = 0) -> np.ndarray:
+    """Cluster unit vectors by cosine similarity, returning unit centroids"""
+    rng = np.random.default_rng(seed)
+    k = min(k, len(vectors))
+    centroids = vectors[rng.choice(len(vectors), k, replace=False)].copy()
+
+    for _ in range(iterations):
+        assignments = assign_clusters(vectors, centroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignments, vectors)
+        counts = np.bincount(assignments, minlength=k)
+
+        # Re-seed empty clusters from random points
+        empty = counts == 0
+        if empty.any():
+            sums[empty] = vectors[rng.choice(len(vectors), int(empty.sum()))]
+
+        norms = np.linalg.norm(sums, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        centroids = (sums / norms).astype(np.float32)
+
+    return centroids
+
+
+def assign_clusters(vectors: np.ndarray, centroids: np.ndarray, block_size: int = 8192) -> np.ndarray:
+    """Nearest centroid for each vector, computed in blocks to bound memory"""
+    assignments = np.empty(len(vectors), dtype=np.int32)
+    for start in range(0, len(vectors), block_size):
+        block = np.asarray(vectors[start:start + block_size], dtype=np.float32)
+        assignments[start:start + block_size] = np.argmax(block @ centroids.T, axis=1)
+    return assignments
+
+
+class IVFIndex:
+    """
+    Inverted-file index: vectors are bucketed by their nearest k-means
+    centroid and a query scans only the `nprobe` closest buckets
+
+    Vectors and their bucket assignments are stored in memory-mapped files and
+    ids in an append-only text file, so opening the index reads ids and
+    assignments but never the vectors themselves. Until `min_train` vectors
+    exist the index is a single bucket (exact search); it is (re)trained once
+    the collection has grown 4x since the last training. Training is split in
+    two so a server can run the slow part off its event loop: fit_centroids()
+    only reads vectors, and apply_centroids() swaps the new buckets in at once,
+    placing rows that were added or removed in the meantime.
+
+    With float16 or int8 `precision` the buckets are scanned on the compact
+    codes; if `rerank` is set the best candidates are then re-scored against
+    a float32 copy that is only read for those few rows.
+
+    Row positions are counted in memory, so only one process may have the
+    index open: open() takes an owner lock and raises LockHeld otherwise.
+    Zero vectors cannot be searched; their ids are recorded in `empty` so
+    the index can still be compared with the number of stored embeddings.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        dim: int = 384,
+        nlist: Optional[int] = None,
+        nprobe: int = 8,
+        min_train: int = 2048,
+        precision: str = "float32",
+        rerank: bool = True,
+        rerank_factor: int = 4
+    ):
+        self.directory = directory
+        self.dim = dim
+        self.nlist_setting = nlist
+        self.nprobe = nprobe
+        self.min_train = min_train
+        self.precision = check_precision(precision)
+        self.rerank = rerank and self.precision != "float32"
+        self.rerank_factor = rerank_factor
+
+        self.codes = None
+        self.scales = None
+        self.full = None
+        self.clusters = None
+        self.capacity = 0
+        self.size = 0
+        self.ids: List[str] = []
+        self.rows: Dict[str, int] = {}
+        self.empty: Set[str] = set()
+        self.centroids = np.zeros((1, dim), dtype=np.float32)
+        self.trained_size = 0
+        self.lists: List[List[int]] = [[]]
+        self.generation = 0  # bumped by reset(), so stale training results are dropped
+
+        os.makedirs(directory, exist_ok=True)
+        suffix = {"float32": "f32", "float16": "f16", "int8": "i8"}[self.precision]
+        self.codes_path = os.path.join(directory, f"vectors.{suffix}")
+        self.scales_path = os.path.join(directory, "scales.f32")
+        self.full_path = os.path.join(directory, "rerank.f32")
+        self.clusters_path = os.path.join(directory, "clusters.i32")
+        self.ids_path = os.path.join(directory, "ids.txt")
+        self.empty_path = os.path.join(directory, "empty.txt")
+        self.centroids_path = os.path.join(directory, "centroids.npy")
+        self.meta_path = os.path.join(directory, "meta.json")
+        self.lock = OwnerLock(os.path.join(directory, "owner.lock"))
+
+    def open(self):
+        """Open (or create) the on-disk index; an index of another precision is discarded"""
+        self.lock.acquire()
+        meta = {}
+        if os.path.exists(self.meta_path):
+            with open(self.meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+        if meta.get("precision", "float32") != self.precision or meta.get("rerank", False) != self.rerank:
+            self.reset()
+            return
+
+        if os.path.exists(self.ids_path):
+            with open(self.ids_path, "r", encoding="utf-8") as f:
+                self.ids = f.read().split()
+        self.size = len(self.ids)
+        self._map(max(1024, self.size))
+        if os.path.exists(self.empty_path):
+            with open(self.empty_path, "r", encoding="utf-8") as f:
+                self.empty = set(f.read().split())
+
+        self.trained_size = meta.get("trained_size", 0)
+        if self.trained_size and os.path.exists(self.centroids_path):
+            self.centroids = np.load(self.centroids_path)
+
+        clusters = np.asarray(self.clusters[:self.size])
+        self._rebuild_lists(clusters)
+        self.rows = {
+            entry_id: row for row, entry_id in enumerate(self.ids) if clusters[row] >= 0
+        }
+
+    def _files(self):
+        """(attribute, path, dtype, row width) for every memory-mapped file"""
+        files = [
+            ("codes", self.codes_path, CODE_DTYPES[self.precision], self.dim),
+            ("clusters", self.clusters_path, np.int32, 1),
+        ]
+        if self.precision == "int8":
+            files.append(("scales", self.scales_path, np.float32, 1))
+        if self.rerank:
+            files.append(("full", self.full_path, np.float32, self.dim))
+        return files
+
+    def _map(self, capacity: int):
+        """Memory-map the index files with room for `capacity` rows"""
+        for attr, path, dtype, width in self._files():
+            row_bytes = np.dtype(dtype).itemsize * width
+            if not os.path.exists(path) or os.path.getsize(path) < capacity * row_bytes:
+                with open(path, "ab") as f:
+                    f.truncate(capacity * row_bytes)
+        capacity = os.path.getsize(self.clusters_path) // 4
+        for attr, path, dtype, width in self._files():
+            shape = (capacity, width) if width > 1 else (capacity,)
+            setattr(self, attr, np.memmap(path, dtype=dtype, mode="r+", shape=shape))
+        self.capacity = capacity
+
+    def _write_meta(self):
+        with open(self.meta_path, "w", encoding="utf-8") as f:
+            json.dump({
+                "dim": self.dim,
+                "precision": self.precision,
+                "rerank": self.rerank,
+                "trained_size": self.trained_size,
+                "nlist": len(self.centroids)
+            }, f)
+
+    def _rebuild_lists(self, clusters: np.ndarray):
+        """Group live rows by bucket"""
+        self.lists = [[] for _ in range(len(self.centroids))]
+        live = np.flatnonzero(clusters >= 0)
+        if len(live):
+            order = live[np.argsort(clusters[live], kind="stable")]
+            bounds = np.searchsorted(clusters[order], np.arange(len(self.centroids) + 1))
+            for cluster in range(len(self.centroids)):
+                self.lists[cluster] = order[bounds[cluster]:bounds[cluster + 1]].tolist()
+
+    def vectors(self, rows: np.ndarray) -> np.ndarray:
+        """Decoded float32 vectors for the given rows"""
+        if self.full is not None:
+            return np.asarray(self.full[rows])
+        if self.scales is not None:
+            return dequantize(self.codes[rows], self.scales[rows])
+        return np.asarray(self.codes[rows], dtype=np.float32)
+
+    def add(self, entry_id: str, vector: np.ndarray):
+        """Insert or replace one vector"""
+        self.add_many([entry_id], np.asarray(vector, dtype=np.float32).reshape(1, -1))
+
+    def add_many(self, entry_ids: List[str], vectors: np.ndarray, retrain: bool = True):
+        """
+        Insert or replace a batch of vectors
+
+        With `retrain` the index is retrained in place once it has outgrown its
+        buckets; callers that cannot block pass False and check needs_training.
+        """
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(len(entry_ids), self.dim)
+        norms = np.linalg.norm(vectors, axis=1)
+        keep = norms > 0
+        empty = [entry_id for entry_id, ok in zip(entry_ids, keep) if not ok]
+        if empty:
+            for entry_id in empty:
+                self.remove(entry_id)
+            self.empty.update(empty)
+            self._write_empty()
+        entry_ids = [entry_id for entry_id, ok in zip(entry_ids, keep) if ok]
+        vectors = vectors[keep] / norms[keep, None]
+        if not entry_ids:
+            return
+
+        for entry_id in entry_ids:
+            self.remove(entry_id)
+
+        while self.size + len(entry_ids) > self.capacity:
+            self.flush()
+            self._map(self.capacity * 2)
+
+        rows = np.arange(self.size, self.size + len(entry_ids))
+        clusters = assign_clusters(vectors, self.centroids) if self.trained_size else np.zeros(len(rows), dtype=np.int32)
+        codes, scales = quantize(vectors, self.precision)
+        self.codes[rows] = codes
+        if self.scales is not None:
+            self.scales[rows] = scales
+        if self.full is not None:
+            self.full[rows] = vectors
+        self.clusters[rows] = clusters
+        with open(self.ids_path, "a", encoding="utf-8") as f:
+            f.write("".join(entry_id + "\n" for entry_id in entry_ids))
+
+        for entry_id, row, cluster in zip(entry_ids, rows.tolist(), clusters.tolist()):
+            self.ids.append(entry_id)
+            self.rows[entry_id] = row
+            self.lists[cluster].append(row)
+        self.size += len(entry_ids)
+
+        if retrain and self.needs_training:
+            self.train()
+
+    def remove(self, entry_id: str) -> bool:
+        """Drop a vector; its row stays allocated until the index is rebuilt"""
+        if entry_id in self.empty:
+            self.empty.discard(entry_id)
+            self._write_empty()
+            return True
+        row = self.rows.pop(entry_id, None)
+        if row is None:
+            return False
+        cluster = int(self.clusters[row])
+        self.clusters[row] = -1
+        if 0 <= cluster < len(self.lists):
+            self.lists[cluster].remove(row)
+        return True
+
+    def _write_empty(self):
+        with open(self.empty_path, "w", encoding="utf-8") as f:
+            f.write("".join(entry_id + "\n" for entry_id in sorted(self.empty)))
+
+    @property
+    def stored(self) -> int:
+        """Ids the index accounts for, searchable or not"""
+        return len(self.rows) + len(self.empty)
+
+    @property
+    def needs_training(self) -> bool:
+        """Whether the collection has grown 4x since the last training"""
+        return len(self.rows) >= self.min_train and len(self.rows) >= 4 * self.trained_size
+
+    def train(self, iterations: int = 10, sample_size: int = 50000):
+        """Re-cluster all live vectors and reassign them to the new buckets"""
+        fitted = self.fit_centroids(iterations, sample_size)
+        if fitted is not None:
+            self.apply_centroids(fitted)
+
+    def fit_centroids(self, iterations: int = 10, sample_size: int = 50000) -> Optional[Dict]:
+        """
+        Cluster the live vectors without changing the index
+
+        Only reads rows that exist when it starts (rows are never rewritten),
+        so it can run on a worker thread while the index keeps serving.
+        Returns what apply_centroids() needs, or None if there is too little data.
+        """
+        live = np.array(sorted(self.rows.values()), dtype=np.int64)
+        if len(live) < 2:
+            return None
+        nlist = self.nlist_setting or int(4 * np.sqrt(len(live)))
+        nlist = max(1, min(nlist, 4096, len(live)))
+
+        rng = np.random.default_rng(0)
+        sample = live if len(live) <= sample_size else np.sort(rng.choice(live, sample_size, replace=False))
+        centroids = spherical_kmeans(self.vectors(sample), nlist, iterations)
+
+        clusters = np.full(len(live), -1, dtype=np.int32)
+        for start in range(0, len(live), sample_size):
+            clusters[start:start + sample_size] = assign_clusters(
+                self.vectors(live[start:start + sample_size]), centroids
+            )
+        return {"centroids": centroids, "rows": live, "clusters": clusters, "generation": self.generation}
+
+    def apply_centroids(self, fitted: Dict):
+        """Switch to centroids from fit_centroids(); rows added since are assigned, removed ones dropped"""
+        if fitted["generation"] != self.generation:
+            return  # the index was reset while the centroids were fitted
+        centroids = fitted["centroids"]
+        clusters = np.full(self.size, -1, dtype=np.int32)
+        clusters[fitted["rows"]] = fitted["clusters"]
+        live = np.zeros(self.size, dtype=bool)
+        live[list(self.rows.values())] = True
+        clusters[~live] = -1
+        fitted_rows = np.zeros(self.size, dtype=bool)
+        fitted_rows[fitted["rows"]] = True
+        added = np.flatnonzero(live & ~fitted_rows)
+        if len(added):
+            clusters[added] = assign_clusters(self.vectors(added), centroids)
+
+        self.centroids = centroids
+        self.clusters[:self.size] = clusters
+        self.clusters.flush()
+        self.trained_size = int(live.sum())
+        self._rebuild_lists(clusters)
+
+        np.save(self.centroids_path + ".tmp.npy", self.centroids)
+        os.replace(self.centroids_path + ".tmp.npy", self.centroids_path)
+        self._write_meta()
+
+    def search(self, query: np.ndarray, k: int = 10, nprobe: Optional[int] = None) -> List[Tuple[str, float]]:
+        """(entry_id, cosine similarity) for approximate nearest neighbours, best first"""
+        query = np.asarray(query, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if norm == 0 or not self.rows:
+            return []
+        query = query / norm
+
+        nprobe = min(nprobe or self.nprobe, len(self.lists))
+        if nprobe < len(self.lists):
+            probe = np.argpartition(-(self.centroids @ query), nprobe - 1)[:nprobe]
+        else:
+            probe = range(len(self.lists))
+        candidates = np.fromiter(
+            (row for cluster in probe for row in self.lists[cluster]), dtype=np.int64
+        )
+        if not len(candidates):
+            return []
+
+        # Coarse scores on the stored codes
+        scores = np.asarray(self.codes[candidates], dtype=np.float32) @ query
+        if self.scales is not None:
+            scores *= self.scales[candidates]
+
+        if self.full is not None:
+            # Exact re-rank of the best few candidates
+            shortlist = min(k * self.rerank_factor, len(candidates))
+            best = np.argpartition(-scores, shortlist - 1)[:shortlist]
+            candidates = candidates[best]
+            scores = np.asarray(self.full[candidates]) @ query
+
+        k = min(k, len(candidates))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(self.ids[candidates[i]], float(scores[i])) for i in top]
+
+    def reset(self):
+        """Discard every vector, e.g. before rebuilding from the database"""
+        self.codes = self.scales = self.full = self.clusters = None
+        for name in INDEX_FILES:
+            path = os.path.join(self.directory, name)
+            if os.path.exists(path):
+                os.remove(path)
+        self.ids = []
+        self.rows = {}
+        self.empty = set()
+        self.size = 0
+        self.centroids = np.zeros((1, self.dim), dtype=np.float32)
+        self.trained_size = 0
+        self.lists = [[]]
+        self.generation += 1
+        self._map(1024)
+        self._write_meta()
+
+    def flush(self):
+        for attr, _, _, _ in self._files():
+            mapped = getattr(self, attr)
+            if mapped is not None:
+                mapped.flush()
+
+    def close(self):
+        """Flush and give up ownership of the index"""
+        self.flush()
+        self.lock.release()
+
+    def __len__(self):
+        return len(self.rows)
@@ -3,15 +3,24 @@ Neo4j database interface for diary entries
 """
 
 from neo4j import AsyncGraphDatabase
+import asyncio
 import os
 import json
 import numpy as np
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Tuple
 from datetime import datetime
 from diary.graph_processor import GraphProcessor
+from diary.metrics import span, timed
+from diary.text_index import InvertedIndex
+from diary.ann_index import IVFIndex
+from diary.locking import LockHeld
+from diary.quantization import check_precision, decode_embedding, encode_embedding
+from diary.similarity import normalize_rows
+from diary.segments import merge_segment_hits, segment_id, with_segment
+from diary.storage import DiaryStorage, encode_cursor, decode_cursor
 
 
-class DiaryDatabase:
+class DiaryDatabase(DiaryStorage):
     """Neo4j database manager for diary entries"""
     
     def __init__(self):
@@ -21,12 +30,52 @@ class DiaryDatabase:
         self.database = os.getenv("NEO4J_DATABASE", "neo4j")
         self.driver = None
         self.graph_processor = GraphProcessor()
+        
+        # Vector search settings
+        self.vector_index_name = "entry_embedding"
+        self.vector_index_available = False
+        self.search_overfetch = int(os.getenv("VECTOR_SEARCH_OVERFETCH", 4))
+        self.min_similarity = float(os.getenv("VECTOR_SEARCH_MIN_SIMILARITY", 0.5))
+        
+        # Local ANN index answering vector searches without shipping vectors over Bolt
+        # (set ANN_INDEX_DIR to an empty string to disable it)
+        self.ann_index_dir = os.getenv("ANN_INDEX_DIR", "./data/ann_index")
+        self.ann_index: Optional[IVFIndex] = None
+        # Retraining clusters every vector, so it runs on a worker thread, one per index
+        self.retrain_tasks: Dict[str, asyncio.Task] = {}
+        
+        # Segments of long entries are searched alongside whole entries
+        self.segment_index_name = "segment_embedding"
+        self.segment_index_available = False
+        self.segment_ann_index: Optional[IVFIndex] = None
+        self.segment_overfetch = int(os.getenv("SEGMENT_SEARCH_OVERFETCH", 3))
+        
+        # float32 keeps the indexable `embedding` property; float16 and int8 store
+        # compact bytes (`embedding_q`, plus `embedding_scale` for int8) instead,
+        # which the Neo4j vector index cannot use, so they need the local ANN index
+        self.embedding_precision = check_precision(os.getenv("EMBEDDING_PRECISION", "float32"))
+        if self.embedding_precision != "float32" and not self.ann_index_dir:
+            raise ValueError(f"EMBEDDING_PRECISION={self.embedding_precision} requires the local ANN index (ANN_INDEX_DIR)")
+        
+        # Keyword search: Neo4j full-text index, or an in-process BM25 index
+        self.fulltext_index_name = "entry_fulltext"
+        self.fulltext_index_available = False
+        self.text_index: Optional[InvertedIndex] = None
+        # Off when several API workers share the database (set by serve.py): each
+        # worker's index would only see the writes that worker handled
+        self.in_process_text_index = os.getenv("IN_PROCESS_TEXT_INDEX", "1") == "1"
+        
+        # SIMILAR_TO maintenance settings
+        self.similarity_top_k = int(os.getenv("SIMILARITY_TOP_K", 10))
+        self.similarity_threshold = float(os.getenv("SIMILARITY_THRESHOLD", 0.85))
     
     async def connect(self):
         """Connect to Neo4j database"""
         self.driver = AsyncGraphDatabase.driver(
             self.uri,
-            auth=(self.user, self.password)
+            auth=(self.user, self.password),
+            # Managed transactions are retried on transient errors for up to this long
+            max_transaction_retry_time=float(os.getenv("NEO4J_MAX_RETRY_TIME", 15))
         )
         
         # Verify connectivity
@@ -39,6 +88,9 @@ class DiaryDatabase:
         
         # Create constraints and indexes
         await self._setup_schema()
+        
+        if self.ann_index_dir:
+            await self._open_ann_index()
     
     async def _setup_schema(self):
         """Set up database schema, constraints, and indexes"""
@@ -71,6 +123,10 @@ class DiaryDatabase:
                     "CREATE CONSTRAINT place_name IF NOT EXISTS "
                     "FOR (pl:Place) REQUIRE pl.name IS UNIQUE"
                 )
+                await session.run(
+                    "CREATE CONSTRAINT segment_id IF NOT EXISTS "
+                    "FOR (s:Segment) REQUIRE s.id IS UNIQUE"
+                )
             except Exception as e:
                 print(f"[INFO] Some constraints may already exist: {e}")
             
@@ -108,214 +164,845 @@ class DiaryDatabase:
                     "FOR (e:Entry) ON e.embedding "
                     "OPTIONS {indexConfig: {`vector.dimensions`: 384, `vector.similarity_function`: 'cosine'}}"
                 )
+                await session.run(
+                    "CREATE VECTOR INDEX segment_embedding IF NOT EXISTS "
+                    "FOR (s:Segment) ON s.embedding "
+                    "OPTIONS {indexConfig: {`vector.dimensions`: 384, `vector.similarity_function`: 'cosine'}}"
+                )
             except Exception as e:
                 print(f"Note: Vector index may not be available: {e}")
+            
+            # Full-text index for relevance-ranked keyword search
+            try:
+                await session.run(
+                    "CREATE FULLTEXT INDEX entry_fulltext IF NOT EXISTS "
+                    "FOR (e:Entry) ON EACH [e.title, e.text]"
+                )
+            except Exception as e:
+                print(f"Note: Full-text index may not be available: {e}")
+        
+        await self._probe_vector_index()
+        await self._probe_fulltext_index()
+    
+    async def _probe_vector_index(self) -> bool:
+        """Check whether the entry_embedding vector index can serve kNN queries"""
+        self.vector_index_available = False
+        try:
+            async with self.driver.session(database=self.database) as session:
+                # Wait for the index to come online (it may still be populating)
+                await session.run(
+                    "CALL db.awaitIndex($name, 30)", name=self.vector_index_name
+                )
+                result = await session.run(
+                    "SHOW INDEXES YIELD name, type, state "
+                    "WHERE name = $name RETURN type, state",
+                    name=self.vector_index_name
+                )
+                record = await result.single()
+                if record and record["type"] == "VECTOR" and record["state"] == "ONLINE":
+                    # Make sure the query procedure itself is callable
+                    result = await session.run(
+                        "CALL db.index.vector.queryNodes($name, 1, $vector) "
+                        "YIELD node RETURN count(node) AS n",
+                        name=self.vector_index_name,
+                        vector=[1.0] + [0.0] * 383
+                    )
+                    await result.consume()
+                    self.vector_index_available = True
+        except Exception as e:
+            print(f"[INFO] Vector index unavailable, semantic search will scan entries: {e}")
+        
+        if self.vector_index_available:
+            print("[OK] Vector index online, semantic search uses kNN")
+            self.segment_index_available = await self._index_online(self.segment_index_name, "VECTOR")
+        return self.vector_index_available
+    
+    async def _index_online(self, name: str, index_type: str) -> bool:
+        """Whether the named index exists, has the given type and is ONLINE"""
+        try:
+            async with self.driver.session(database=self.database) as session:
+                await session.run("CALL db.awaitIndex($name, 30)", name=name)
+                result = await session.run(
+                    "SHOW INDEXES YIELD name, type, state "
+                    "WHERE name = $name RETURN type, state",
+                    name=name
+                )
+                record = await result.single()
+                return bool(record and record["type"] == index_type and record["state"] == "ONLINE")
+        except Exception:
+            return False
+    
+    async def _probe_fulltext_index(self) -> bool:
+        """Check for the entry_fulltext index, building the in-process index otherwise"""
+        self.fulltext_index_available = False
+        try:
+            async with self.driver.session(database=self.database) as session:
+                await session.run(
+                    "CALL db.awaitIndex($name, 30)", name=self.fulltext_index_name
+                )
+                result = await session.run(
+                    "SHOW INDEXES YIELD name, type, state "
+                    "WHERE name = $name RETURN type, state",
+                    name=self.fulltext_index_name
+                )
+                record = await result.single()
+                self.fulltext_index_available = bool(
+                    record and record["type"] == "FULLTEXT" and record["state"] == "ONLINE"
+                )
+        except Exception as e:
+            print(f"[INFO] Full-text index unavailable: {e}")
+        
+        if self.fulltext_index_available:
+            print("[OK] Full-text index online, keyword search uses it")
+            self.text_index = None
+        elif self.in_process_text_index:
+            await self._build_text_index()
+        else:
+            print("[WARN] No full-text index and the in-process keyword index is off; keyword search scans entries")
+        return self.fulltext_index_available
+    
+    async def _build_text_index(self, batch_size: int = 5000):
+        """Load every entry into the in-process keyword index"""
+        index = InvertedIndex()
+        last_id = ""
+        async with self.driver.session(database=self.database) as session:
+            while True:
+                result = await session.run(
+                    """
+                    MATCH (e:Entry)
+                    WHERE e.id > $last_id
+                    RETURN e.id as id, e.title as title, e.text as text
+                    ORDER BY e.id
+                    LIMIT $batch_size
+                    """,
+                    last_id=last_id,
+                    batch_size=batch_size
+                )
+                records = [record async for record in result]
+                if not records:
+                    break
+                for record in records:
+                    index.add(record["id"], record["title"], record["text"])
+                last_id = records[-1]["id"]
+        
+        self.text_index = index
+        print(f"[OK] Built in-process keyword index over {len(index)} entries")
+    
+    async def _open_ann_index(self):
+        """Open the local ANN indexes (entries, and segments in a subdirectory)"""
+        self.ann_index = await self._load_ann_index(self.ann_index_dir, "Entry")
+        print(f"[OK] Local ANN index loaded ({len(self.ann_index)} entries)")
+        self.segment_ann_index = await self._load_ann_index(
+            os.path.join(self.ann_index_dir, "segments"), "Segment"
+        )
+    
+    async def _load_ann_index(self, directory: str, label: str) -> IVFIndex:
+        """Open an ANN index over `label` nodes, rebuilding it if it is out of step with the database"""
+        index = IVFIndex(
+            directory,
+            nlist=int(os.getenv("ANN_NLIST", 0)) or None,
+            nprobe=int(os.getenv("ANN_NPROBE", 8)),
+            min_train=int(os.getenv("ANN_MIN_TRAIN", 2048)),
+            precision=self.embedding_precision,
+            rerank=os.getenv("ANN_RERANK", "true").lower() == "true"
+        )
+        try:
+            index.open()
+        except LockHeld as e:
+            raise LockHeld(
+                f"{e}. The local ANN index belongs to one process: stop the server before running "
+                "import or migration scripts, or import through POST /api/entries/bulk"
+            ) from e
+        
+        async with self.driver.session(database=self.database) as session:
+            result = await session.run(
+                f"MATCH (e:{label}) WHERE e.embedding IS NOT NULL OR e.embedding_q IS NOT NULL "
+                "RETURN count(e) as count"
+            )
+            record = await result.single()
+            embedded = record["count"] if record else 0
+        
+        # All-zero embeddings are counted by the query but not searchable; the
+        # index keeps their ids aside so they do not force a rebuild every start
+        if index.stored != embedded:
+            print(f"[INFO] ANN index has {index.stored} of {embedded} {label} embeddings, rebuilding")
+            await self.rebuild_ann_index(index, label)
+        return index
+    
+    async def rebuild_ann_index(self, index: IVFIndex, label: str = "Entry"):
+        """Reload every stored embedding of `label` nodes into the ANN index"""
+        index.reset()
+        async for ids, vectors in self._export_embeddings(label):
+            index.add_many(ids, vectors, retrain=False)
+        if len(index) >= index.min_train:
+            loop = asyncio.get_running_loop()
+            fitted = await loop.run_in_executor(None, index.fit_centroids)
+            if fitted is not None:
+                index.apply_centroids(fitted)
+        index.flush()
+    
+    def _schedule_retrain(self, index: IVFIndex):
+        """Retrain an index that has outgrown its buckets, without blocking the event loop"""
+        task = self.retrain_tasks.get(index.directory)
+        if not index.needs_training or (task is not None and not task.done()):
+            return
+        self.retrain_tasks[index.directory] = asyncio.create_task(self._retrain(index))
+    
+    async def _retrain(self, index: IVFIndex):
+        loop = asyncio.get_running_loop()
+        try:
+            fitted = await loop.run_in_executor(None, index.fit_centroids)
+            # Applied on the loop, so searches never see half-swapped buckets
+            if fitted is not None:
+                index.apply_centroids(fitted)
+                print(f"[OK] Retrained ANN index {index.directory} ({len(index.centroids)} buckets)")
+        except Exception as e:
+            print(f"[WARN] ANN index retraining failed: {e}")
     
     async def close(self):
         """Close database connection"""
+        if self.retrain_tasks:
+            await asyncio.gather(*self.retrain_tasks.values(), return_exceptions=True)
+            self.retrain_tasks = {}
+        if self.ann_index is not None:
+            self.ann_index.close()
+        if self.segment_ann_index is not None:
+            self.segment_ann_index.close()
         if self.driver:
             await self.driver.close()
     
-    async def create_entry(self, entry_data: Dict) -> Dict:
-        """Create a new diary entry in Neo4j"""
+    @timed("neo4j.create_entries")
+    async def create_entries(self, entries: List[Dict]) -> List[Dict]:
+        """
+        Create a batch of diary entries in one managed transaction
+        
+        The entry nodes, their tag/concept/entity/keyword graph and their
+        SHARES_* and SIMILAR_TO links are written together; the driver retries
+        the transaction automatically on transient errors. Each entry dict may
+        carry a precomputed "graph_data" so that graph extraction can run
+        elsewhere (e.g. in a process pool) before the write, an "id" chosen by
+        the caller and an "enrichment_status" (default "ready").
+        """
+        # Generate unique IDs (outside the transaction so retries reuse them)
+        import uuid
+        rows = [
+            self._entry_row(entry_data.get("id") or str(uuid.uuid4()), entry_data)
+            for entry_data in entries
+        ]
+        if not rows:
+            return []
+        
+        embedded = self._prepare_similar_links(rows, entries)
+        
+        async with self.driver.session(database=self.database) as session:
+            await session.execute_write(self._write_entries_tx, rows)
+        
+        if self.text_index is not None:
+            for row in rows:
+                self.text_index.add(row["id"], row["title"], row["text"])
+        self._add_to_ann_index(embedded)
+        self._add_segments_to_ann_index(rows, entries)
+        
+        return [
+            {
+                "id": row["id"],
+                "title": row["title"],
+                "text": row["text"],
+                "timestamp": row["timestamp"],
+                "audio_path": row["audio_path"],
+                "image_path": row["image_path"],
+                "tags": row["tags"],
+                "enrichment_status": row["enrichment_status"]
+            }
+            for row in rows
+        ]
+    
+    @timed("neo4j.enrich_entry")
+    async def enrich_entry(self, entry_id: str, entry_data: Dict) -> bool:
+        """
+        Store the enrichment results for an entry written as "pending"
+        
+        Sets its text and embedding, writes its concept/entity/keyword graph and
+        SHARES_* / SIMILAR_TO links, and marks it "ready" - all in one managed
+        transaction. Returns False if the entry no longer exists.
+        """
+        row = self._entry_row(entry_id, entry_data)
+        embedded = self._prepare_similar_links([row], [entry_data])
+        
+        async with self.driver.session(database=self.database) as session:
+            found, replaced_segments = await session.execute_write(self._enrich_entry_tx, row)
+        if not found:
+            return False
+        
+        if self.text_index is not None:
+            self.text_index.remove(entry_id)
+            self.text_index.add(entry_id, entry_data.get("title", ""), row["text"])
+        self._add_to_ann_index(embedded)
+        if self.segment_ann_index is not None:
+            for replaced_id in replaced_segments:
+                self.segment_ann_index.remove(replaced_id)
+        self._add_segments_to_ann_index([row], [entry_data])
+        return True
+    
+    async def _enrich_entry_tx(self, tx, row: Dict) -> Tuple[bool, List[str]]:
+        with span("cypher.enrich_entry"):
+            result = await tx.run(
+                """
+                UNWIND $rows AS row
+                MATCH (e:Entry {id: row.id})
+                SET e.text = row.text,
+                    e.embedding = row.embedding,
+                    e.embedding_q = row.embedding_q,
+                    e.embedding_scale = row.embedding_scale,
+                    e.enrichment_status = 'ready'
+                """ + GRAPH_MERGES + """
+                RETURN count(e) as found
+                """,
+                rows=[row]
+            )
+            record = await result.single()
+        if not record or record["found"] == 0:
+            return False, []
+        # A retried enrichment replaces the segments written by the last attempt
+        replaced = await self._delete_segments(tx, [row["id"]])
+        await self._write_segments(tx, [row])
+        await self._link_entries(tx, [row])
+        return True, replaced
+    
+    @timed("cypher.set_enrichment_status")
+    async def set_enrichment_status(self, entry_id: str, status: str) -> bool:
+        """Record an entry's enrichment status (e.g. "failed")"""
         async with self.driver.session(database=self.database) as session:
-            # Generate unique ID
-            import uuid
-            entry_id = str(uuid.uuid4())
-            
-            # Prepare embedding for storage
-            embedding = entry_data.get("embedding")
-            if embedding is not None:
-                embedding = list(embedding)  # Convert numpy array to list
-            
-            # Create entry node
-            query = """
-            CREATE (e:Entry {
-                id: $id,
-                title: $title,
-                text: $text,
-                timestamp: $timestamp,
-                audio_path: $audio_path,
-                image_path: $image_path,
-                embedding: $embedding
-            })
-            RETURN e.id as id, e.title as title, e.text as text,
-                   e.timestamp as timestamp, e.audio_path as audio_path,
-                   e.image_path as image_path
-            """
-            
             result = await session.run(
-                query,
+                """
+                MATCH (e:Entry {id: $id})
+                SET e.enrichment_status = $status
+                RETURN count(e) as found
+                """,
                 id=entry_id,
-                title=entry_data.get("title", "Untitled"),
-                text=entry_data.get("text"),
-                timestamp=entry_data.get("timestamp", datetime.utcnow().isoformat()),
-                audio_path=entry_data.get("audio_path"),
-                image_path=entry_data.get("image_path"),
-                embedding=embedding
+                status=status
             )
-            
-            # Don't need to use the result - we'll return our own dict
-            
-            # Create tags and relationships
-            tags = entry_data.get("tags", [])
-            if tags:
-                await session.run(
-                    """
-                    MATCH (e:Entry {id: $entry_id})
-                    UNWIND $tags AS tag_name
-                    MERGE (t:Tag {name: tag_name})
-                    CREATE (e)-[:HAS_TAG]->(t)
-                    """,
-                    entry_id=entry_id,
-                    tags=tags
-                )
-            
-            # Extract graph components from text
-            entry_text = entry_data.get("text", "") or entry_data.get("title", "")
-            if entry_text:
-                graph_data = self.graph_processor.process_entry(entry_text)
-                
-                # Create Concept nodes and link to entry
-                concepts = graph_data.get('concepts', [])
-                if concepts:
-                    await session.run(
-                        """
-                        MATCH (e:Entry {id: $entry_id})
-                        UNWIND $concepts AS concept_name
-                        MERGE (c:Concept {name: concept_name})
-                        CREATE (e)-[:MENTIONS_CONCEPT]->(c)
-                        """,
-                        entry_id=entry_id,
-                        concepts=concepts[:20]  # Limit to prevent too many nodes
-                    )
-                
-                # Create Entity nodes and link to entry
-                entities = graph_data.get('entities', [])
-                if entities:
-                    await session.run(
-                        """
-                        MATCH (e:Entry {id: $entry_id})
-                        UNWIND $entities AS entity_name
-                        MERGE (ent:Entity {name: entity_name})
-                        CREATE (e)-[:MENTIONS_ENTITY]->(ent)
-                        """,
-                        entry_id=entry_id,
-                        entities=entities[:10]  # Limit entities
-                    )
-                
-                # Create Keyword nodes and link to entry
-                keywords = graph_data.get('keywords', [])
-                if keywords:
-                    await session.run(
-                        """
-                        MATCH (e:Entry {id: $entry_id})
-                        UNWIND $keywords AS keyword_name
-                        MERGE (k:Keyword {name: keyword_name})
-                        CREATE (e)-[:HAS_KEYWORD]->(k)
-                        """,
-                        entry_id=entry_id,
-                        keywords=keywords[:15]  # Limit keywords
-                    )
-                
-                # Create relationships extracted from text
-                relationships = graph_data.get('relationships', [])
-                for rel in relationships[:10]:  # Limit relationships
-                    if rel.get('object'):
-                        await session.run(
-                            """
-                            MATCH (e:Entry {id: $entry_id})
-                            MERGE (obj:Concept {name: $object})
-                            CREATE (e)-[:RELATES_TO {type: $relation}]->(obj)
-                            """,
-                            entry_id=entry_id,
-                            relation=rel.get('relation', 'relates'),
-                            object=rel.get('object', '')[:50]
-                        )
-            
-            # Link to entries with shared concepts/keywords
-            await self._link_shared_concepts(entry_id)
-            
-            # Create similarity relationships with existing entries (if embeddings available)
-            if embedding:
-                await self._create_similarity_relationships(entry_id, embedding, 0.85)
-            
-            # Return created entry
-            return {
-                "id": entry_id,
-                "title": entry_data.get("title", "Untitled"),
-                "text": entry_data.get("text"),
-                "timestamp": entry_data.get("timestamp"),
-                "audio_path": entry_data.get("audio_path"),
-                "image_path": entry_data.get("image_path"),
-                "tags": tags
+            record = await result.single()
+            return bool(record and record["found"])
+    
+    def _prepare_similar_links(self, rows: List[Dict], entries: List[Dict]) -> List[Tuple[str, np.ndarray]]:
+        """
+        The (id, embedding) pairs of the rows that carry an embedding
+        
+        With quantized storage there is no float property to search in Cypher,
+        so SIMILAR_TO neighbours are picked here and attached as row["similar"].
+        """
+        embedded = [
+            (row["id"], entry_data["embedding"])
+            for row, entry_data in zip(rows, entries)
+            if entry_data.get("embedding") is not None and np.any(entry_data["embedding"])
+        ]
+        if self.embedding_precision != "float32" and embedded:
+            similar = self._similar_links(
+                [entry_id for entry_id, _ in embedded],
+                np.asarray([vector for _, vector in embedded], dtype=np.float32)
+            )
+            for row in rows:
+                row["similar"] = similar.get(row["id"], [])
+        return embedded
+    
+    def _add_to_ann_index(self, embedded: List[Tuple[str, np.ndarray]]):
+        if self.ann_index is not None and embedded:
+            self.ann_index.add_many(
+                [entry_id for entry_id, _ in embedded],
+                np.asarray([vector for _, vector in embedded], dtype=np.float32),
+                retrain=False
+            )
+            self._schedule_retrain(self.ann_index)
+    
+    def _add_segments_to_ann_index(self, rows: List[Dict], entries: List[Dict]):
+        if self.segment_ann_index is None:
+            return
+        embedded = [
+            (segment_id(row["id"], index), segment["embedding"])
+            for row, entry_data in zip(rows, entries)
+            for index, segment in enumerate(entry_data.get("segments") or [])
+            if segment.get("embedding") is not None
+        ]
+        if embedded:
+            self.segment_ann_index.add_many(
+                [seg_id for seg_id, _ in embedded],
+                np.asarray([vector for _, vector in embedded], dtype=np.float32),
+                retrain=False
+            )
+            self._schedule_retrain(self.segment_ann_index)
+    
+    def _entry_row(self, entry_id: str, entry_data: Dict) -> Dict:
+        """Build the UNWIND parameter row for an entry and its extracted graph"""
+        # Prepare embedding for storage
+        embedding, embedding_q, embedding_scale = self._encode_for_storage(entry_data.get("embedding"))
+        
+        segments = []
+        for index, segment in enumerate(entry_data.get("segments") or []):
+            if segment.get("embedding") is None:
+                continue
+            seg_embedding, seg_embedding_q, seg_embedding_scale = self._encode_for_storage(segment["embedding"])
+            segments.append({
+                "id": segment_id(entry_id, index),
+                "position": index,
+                "text": segment["text"],
+                "start": segment.get("start"),
+                "end": segment.get("end"),
+                "embedding": seg_embedding,
+                "embedding_q": seg_embedding_q,
+                "embedding_scale": seg_embedding_scale
+            })
+        
+        # Extract graph components from text
+        entry_text = entry_data.get("text", "") or entry_data.get("title", "")
+        graph_data = entry_data.get("graph_data")
+        if graph_data is None:
+            graph_data = self.graph_processor.process_entry(entry_text)
+        
+        relationships = [
+            {
+                "relation": rel.get('relation', 'relates'),
+                "object": rel.get('object', '')[:50]
             }
+            for rel in graph_data.get('relationships', [])[:10]  # Limit relationships
+            if rel.get('object')
+        ]
+        
+        return {
+            "id": entry_id,
+            "title": entry_data.get("title", "Untitled"),
+            "text": entry_data.get("text"),
+            "timestamp": entry_data.get("timestamp") or datetime.utcnow().isoformat(),
+            "audio_path": entry_data.get("audio_path"),
+            "image_path": entry_data.get("image_path"),
+            "enrichment_status": entry_data.get("enrichment_status", "ready"),
+            "embedding": embedding,
+            "embedding_q": embedding_q,
+            "embedding_scale": embedding_scale,
+            "tags": entry_data.get("tags", []),
+            "concepts": graph_data.get('concepts', [])[:20],  # Limit to prevent too many nodes
+            "entities": graph_data.get('entities', [])[:10],  # Limit entities
+            "keywords": graph_data.get('keywords', [])[:15],  # Limit keywords
+            "relationships": relationships,
+            "segments": segments
+        }
     
-    async def _link_shared_concepts(self, entry_id: str):
-        """Link entry to other entries that share concepts, keywords, or entities"""
-        async with self.driver.session(database=self.database) as session:
-            # Link entries sharing concepts
-            query = """
-            MATCH (e1:Entry {id: $entry_id})-[:MENTIONS_CONCEPT]->(c:Concept)<-[:MENTIONS_CONCEPT]-(e2:Entry)
+    def _encode_for_storage(self, embedding) -> Tuple[Optional[List[float]], Optional[bytes], Optional[float]]:
+        """(embedding, embedding_q, embedding_scale) properties in EMBEDDING_PRECISION"""
+        if embedding is None:
+            return None, None, None
+        if self.embedding_precision != "float32":
+            embedding_q, embedding_scale = encode_embedding(embedding, self.embedding_precision)
+            return None, embedding_q, embedding_scale
+        return [float(x) for x in embedding], None, None  # Convert numpy array to list
+    
+    async def _write_entries_tx(self, tx, rows: List[Dict]):
+        """Transaction function writing entries, their graph and their links"""
+        # Entry nodes with Tag, Concept, Entity and Keyword links
+        with span("cypher.write_entries"):
+            result = await tx.run(
+                """
+                UNWIND $rows AS row
+                CREATE (e:Entry {
+                    id: row.id,
+                    title: row.title,
+                    text: row.text,
+                    timestamp: row.timestamp,
+                    audio_path: row.audio_path,
+                    image_path: row.image_path,
+                    embedding: row.embedding,
+                    embedding_q: row.embedding_q,
+                    embedding_scale: row.embedding_scale,
+                    enrichment_status: row.enrichment_status
+                })
+                FOREACH (tag_name IN row.tags |
+                    MERGE (t:Tag {name: tag_name})
+                    CREATE (e)-[:HAS_TAG]->(t))
+                """ + GRAPH_MERGES,
+                rows=rows
+            )
+            await result.consume()
+        await self._write_segments(tx, rows)
+        await self._link_entries(tx, rows)
+    
+    @timed("cypher.write_segments")
+    async def _write_segments(self, tx, rows: List[Dict]):
+        """Segment nodes, linked from their entries by HAS_SEGMENT"""
+        segments = [dict(segment, entry_id=row["id"]) for row in rows for segment in row["segments"]]
+        if not segments:
+            return
+        result = await tx.run(
+            """
+            UNWIND $segments AS segment
+            MATCH (e:Entry {id: segment.entry_id})
+            CREATE (e)-[:HAS_SEGMENT]->(:Segment {
+                id: segment.id,
+                entry_id: segment.entry_id,
+                position: segment.position,
+                text: segment.text,
+                start_time: segment.start,
+                end_time: segment.end,
+                embedding: segment.embedding,
+                embedding_q: segment.embedding_q,
+                embedding_scale: segment.embedding_scale
+            })
+            """,
+            segments=segments
+        )
+        await result.consume()
+    
+    @staticmethod
+    @timed("cypher.delete_segments")
+    async def _delete_segments(tx, entry_ids: List[str]) -> List[str]:
+        """Delete the segments of the given entries, returning their ids"""
+        result = await tx.run(
+            """
+            UNWIND $entry_ids AS entry_id
+            MATCH (:Entry {id: entry_id})-[:HAS_SEGMENT]->(s:Segment)
+            WITH s, s.id AS id
+            DETACH DELETE s
+            RETURN id
+            """,
+            entry_ids=entry_ids
+        )
+        return [record["id"] async for record in result]
+    
+    async def _link_entries(self, tx, rows: List[Dict]):
+        """SHARES_* and SIMILAR_TO links for freshly written or enriched entries"""
+        # Link to entries with shared concepts/keywords
+        await self._link_shared_concepts(tx, [row["id"] for row in rows])
+        
+        # Create similarity relationships with existing entries (if embeddings available)
+        embedded = [
+            {"id": row["id"], "embedding": row["embedding"]}
+            for row in rows if row["embedding"] and any(row["embedding"])
+        ]
+        if embedded:
+            await self._create_similarity_relationships(tx, embedded)
+        elif any(row.get("similar") for row in rows):
+            await self._write_similar_links(tx, rows)
+    
+    @timed("cypher.link_shared_concepts")
+    async def _link_shared_concepts(self, tx, entry_ids: List[str]):
+        """Link entries to other entries that share concepts, keywords, or entities"""
+        query = """
+        UNWIND $entry_ids AS entry_id
+        MATCH (e1:Entry {id: entry_id})
+        CALL {
+            WITH e1
+            MATCH (e1)-[:MENTIONS_CONCEPT]->(c:Concept)<-[:MENTIONS_CONCEPT]-(e2:Entry)
             WHERE e1 <> e2
             WITH e1, e2, count(c) as shared_concepts
             WHERE shared_concepts >= 1
-            MERGE (e1)-[r:SHARES_CONCEPT {count: shared_concepts}]->(e2)
-            RETURN count(*) as linked
-            """
-            await session.run(query, entry_id=entry_id)
-            
-            # Link entries sharing keywords
-            query = """
-            MATCH (e1:Entry {id: $entry_id})-[:HAS_KEYWORD]->(k:Keyword)<-[:HAS_KEYWORD]-(e2:Entry)
+            MERGE (e1)-[:SHARES_CONCEPT {count: shared_concepts}]->(e2)
+        }
+        CALL {
+            WITH e1
+            MATCH (e1)-[:HAS_KEYWORD]->(k:Keyword)<-[:HAS_KEYWORD]-(e2:Entry)
             WHERE e1 <> e2
             WITH e1, e2, count(k) as shared_keywords
             WHERE shared_keywords >= 2
-            MERGE (e1)-[r:SHARES_KEYWORD {count: shared_keywords}]->(e2)
-            RETURN count(*) as linked
-            """
-            await session.run(query, entry_id=entry_id)
-            
-            # Link entries sharing entities
-            query = """
-            MATCH (e1:Entry {id: $entry_id})-[:MENTIONS_ENTITY]->(ent:Entity)<-[:MENTIONS_ENTITY]-(e2:Entry)
+            MERGE (e1)-[:SHARES_KEYWORD {count: shared_keywords}]->(e2)
+        }
+        CALL {
+            WITH e1
+            MATCH (e1)-[:MENTIONS_ENTITY]->(ent:Entity)<-[:MENTIONS_ENTITY]-(e2:Entry)
             WHERE e1 <> e2
             WITH e1, e2, count(ent) as shared_entities
             WHERE shared_entities >= 1
-            MERGE (e1)-[r:SHARES_ENTITY {count: shared_entities}]->(e2)
-            RETURN count(*) as linked
+            MERGE (e1)-[:SHARES_ENTITY {count: shared_entities}]->(e2)
+        }
+        RETURN count(*) as linked
+        """
+        result = await tx.run(query, entry_ids=entry_ids)
+        await result.consume()
+    
+    @timed("cypher.similarity_relationships")
+    async def _create_similarity_relationships(
+        self,
+        tx,
+        rows: List[Dict],
+        threshold: Optional[float] = None,
+        top_k: Optional[int] = None
+    ):
+        """
+        Create symmetric SIMILAR_TO relationships with each entry's nearest neighbours
+        
+        Only the top-k most similar entries above the threshold are linked, found
+        through the vector index when available instead of comparing every entry.
+        Rows are {"id", "embedding"} dicts.
+        """
+        threshold = self.similarity_threshold if threshold is None else threshold
+        top_k = self.similarity_top_k if top_k is None else top_k
+        if top_k <= 0:
+            return
+        
+        if self.vector_index_available:
+            # k + 1 because the entry itself is its own nearest neighbour
+            neighbours = """
+                CALL db.index.vector.queryNodes($index_name, $k + 1, row.embedding)
+                YIELD node AS e2, score
+                WITH e1, e2, 2 * score - 1 AS similarity
+                WHERE e1 <> e2 AND similarity > $threshold
             """
-            await session.run(query, entry_id=entry_id)
+        else:
+            neighbours = """
+                MATCH (e2:Entry)
+                WHERE e1 <> e2 AND e2.embedding IS NOT NULL
+                WITH e1, e2,
+                    cosineSimilarity(e1.embedding, e2.embedding) as similarity
+                WHERE similarity > $threshold
+            """
+        
+        query = """
+        UNWIND $rows AS row
+        MATCH (e1:Entry {id: row.id})
+        CALL {
+            WITH e1, row
+        """ + neighbours + """
+            RETURN e2, similarity
+            ORDER BY similarity DESC
+            LIMIT $k
+        }
+        UNWIND [[e1, e2], [e2, e1]] AS pair
+        WITH pair[0] AS a, pair[1] AS b, similarity
+        MERGE (a)-[r:SIMILAR_TO]->(b)
+        SET r.score = similarity
+        RETURN count(r) as count
+        """
+        
+        result = await tx.run(
+            query,
+            rows=rows,
+            index_name=self.vector_index_name,
+            threshold=threshold,
+            k=top_k
+        )
+        await result.consume()
     
-    async def _create_similarity_relationships(self, entry_id: str, embedding: List[float], threshold: float):
-        """Create SIMILAR_TO relationships with similar entries"""
-        async with self.driver.session(database=self.database) as session:
-            query = """
-            MATCH (e1:Entry {id: $entry_id})
-            MATCH (e2:Entry)
-            WHERE e1 <> e2 AND e2.embedding IS NOT NULL
-            WITH e1, e2, 
-                cosineSimilarity(e1.embedding, e2.embedding) as similarity
-            WHERE similarity > $threshold
-            CREATE (e1)-[:SIMILAR_TO {score: similarity}]->(e2)
-            RETURN COUNT(*) as count
+    def _similar_links(self, entry_ids: List[str], vectors: np.ndarray) -> Dict[str, List[Dict]]:
+        """Top-k neighbours above the threshold for new entries, among stored entries and the batch"""
+        vectors = normalize_rows(vectors)
+        within = vectors @ vectors.T
+        np.fill_diagonal(within, -np.inf)
+        
+        links = {}
+        for i, entry_id in enumerate(entry_ids):
+            candidates = dict(self.ann_index.search(vectors[i], self.similarity_top_k))
+            for j in np.flatnonzero(within[i] > self.similarity_threshold):
+                candidates[entry_ids[j]] = float(within[i, j])
+            best = sorted(
+                ((score, other) for other, score in candidates.items()
+                 if score > self.similarity_threshold and other != entry_id),
+                reverse=True
+            )[:self.similarity_top_k]
+            links[entry_id] = [{"id": other, "score": score} for score, other in best]
+        return links
+    
+    @timed("cypher.write_similar_links")
+    async def _write_similar_links(self, tx, rows: List[Dict]):
+        """MERGE symmetric SIMILAR_TO relationships chosen by _similar_links"""
+        result = await tx.run(
             """
+            UNWIND $rows AS row
+            MATCH (e1:Entry {id: row.id})
+            UNWIND row.similar AS link
+            MATCH (e2:Entry {id: link.id})
+            UNWIND [[e1, e2], [e2, e1]] AS pair
+            WITH pair[0] AS a, pair[1] AS b, link.score AS similarity
+            MERGE (a)-[r:SIMILAR_TO]->(b)
+            SET r.score = similarity
+            """,
+            rows=[{"id": row["id"], "similar": row["similar"]} for row in rows if row.get("similar")]
+        )
+        await result.consume()
+    
+    async def export_embeddings(self, batch_size: int = 5000):
+        """
+        Stream (ids, embedding matrix) batches for every embedded entry
+        
+        Pages by entry id so each batch is a single indexed range read.
+        """
+        async for ids, vectors in self._export_embeddings("Entry", batch_size):
+            yield ids, vectors
+    
+    async def _export_embeddings(self, label: str, batch_size: int = 5000):
+        """export_embeddings for Entry or Segment nodes"""
+        last_id = ""
+        async with self.driver.session(database=self.database) as session:
+            while True:
+                result = await session.run(
+                    f"""
+                    MATCH (e:{label})
+                    WHERE e.id > $last_id
+                      AND (e.embedding IS NOT NULL OR e.embedding_q IS NOT NULL)
+                    RETURN e.id as id, e.embedding as embedding,
+                           e.embedding_q as embedding_q, e.embedding_scale as embedding_scale
+                    ORDER BY e.id
+                    LIMIT $batch_size
+                    """,
+                    last_id=last_id,
+                    batch_size=batch_size
+                )
+                
+                ids = []
+                vectors = []
+                async for record in result:
+                    ids.append(record["id"])
+                    vectors.append(self._stored_embedding(record))
+                
+                if not ids:
+                    break
+                
+                yield ids, np.asarray(vectors, dtype=np.float32)
+                last_id = ids[-1]
+    
+    def _stored_embedding(self, record) -> np.ndarray:
+        """Decode an embedding stored as floats or as quantized bytes"""
+        if record["embedding"] is not None:
+            return np.asarray(record["embedding"], dtype=np.float32)
+        return decode_embedding(bytes(record["embedding_q"]), record["embedding_scale"])
+    
+    async def convert_embeddings(self, batch_size: int = 1000) -> int:
+        """
+        Rewrite stored embeddings in EMBEDDING_PRECISION, in id-ordered batches
+        
+        Returns the number of entries and segments converted; those already stored
+        in the target precision are left untouched, so an interrupted run can be
+        resumed.
+        """
+        converted = 0
+        for label in ("Entry", "Segment"):
+            converted += await self._convert_label_embeddings(label, batch_size)
+        return converted
+    
+    async def _convert_label_embeddings(self, label: str, batch_size: int) -> int:
+        """convert_embeddings for Entry or Segment nodes"""
+        converted = 0
+        last_id = ""
+        async with self.driver.session(database=self.database) as session:
+            while True:
+                result = await session.run(
+                    f"""
+                    MATCH (e:{label})
+                    WHERE e.id > $last_id
+                      AND (e.embedding IS NOT NULL OR e.embedding_q IS NOT NULL)
+                    RETURN e.id as id, e.embedding as embedding,
+                           e.embedding_q as embedding_q, e.embedding_scale as embedding_scale
+                    ORDER BY e.id
+                    LIMIT $batch_size
+                    """,
+                    last_id=last_id,
+                    batch_size=batch_size
+                )
+                records = [record async for record in result]
+                if not records:
+                    break
+                last_id = records[-1]["id"]
+                
+                updates = []
+                for record in records:
+                    vector = self._stored_embedding(record)
+                    if self.embedding_precision == "float32":
+                        if record["embedding"] is not None:
+                            continue
+                        updates.append({"id": record["id"], "embedding": [float(x) for x in vector],
+                                        "embedding_q": None, "embedding_scale": None})
+                    else:
+                        embedding_q, embedding_scale = encode_embedding(vector, self.embedding_precision)
+                        stored_int8 = record["embedding_scale"] is not None
+                        if record["embedding_q"] is not None and stored_int8 == (embedding_scale is not None):
+                            continue
+                        updates.append({"id": record["id"], "embedding": None,
+                                        "embedding_q": embedding_q, "embedding_scale": embedding_scale})
+                
+                if updates:
+                    await session.execute_write(self._convert_embeddings_tx, label, updates)
+                    converted += len(updates)
+                print(f"[INFO] {converted} {label} embeddings converted to {self.embedding_precision}")
+        
+        return converted
+    
+    @staticmethod
+    async def _convert_embeddings_tx(tx, label: str, updates: List[Dict]):
+        result = await tx.run(
+            f"""
+            UNWIND $updates AS update
+            MATCH (e:{label} {{id: update.id}})
+            SET e.embedding = update.embedding,
+                e.embedding_q = update.embedding_q,
+                e.embedding_scale = update.embedding_scale
+            """,
+            updates=updates
+        )
+        await result.consume()
+    
+    async def replace_similarity_edges(self, edges, batch_size: int = 5000) -> int:
+        """
+        Replace all SIMILAR_TO relationships with the given (source, target, score) edges
+        
+        Each undirected edge is written in both directions. Returns the number of
+        edges written.
+        """
+        async with self.driver.session(database=self.database) as session:
+            # Delete in chunks to keep transactions small on large graphs
+            while True:
+                result = await session.run(
+                    """
+                    MATCH ()-[r:SIMILAR_TO]->()
+                    WITH r LIMIT $batch_size
+                    DELETE r
+                    RETURN count(*) as deleted
+                    """,
+                    batch_size=batch_size
+                )
+                record = await result.single()
+                if not record or record["deleted"] == 0:
+                    break
+            
+            written = 0
+            batch = []
+            for source, target, score in edges:
+                batch.append({"source": source, "target": target, "score": float(score)})
+                if len(batch) >= batch_size:
+                    written += await self._write_similarity_batch(session, batch)
+                    batch = []
+            if batch:
+                written += await self._write_similarity_batch(session, batch)
             
-            await session.run(query, entry_id=entry_id, threshold=threshold)
+            return written
+    
+    async def _write_similarity_batch(self, session, batch: List[Dict]) -> int:
+        """Write one UNWIND batch of symmetric SIMILAR_TO edges"""
+        await session.run(
+            """
+            UNWIND $edges AS edge
+            MATCH (a:Entry {id: edge.source}), (b:Entry {id: edge.target})
+            CREATE (a)-[:SIMILAR_TO {score: edge.score}]->(b)
+            CREATE (b)-[:SIMILAR_TO {score: edge.score}]->(a)
+            """,
+            edges=batch
+        )
+        return len(batch)
     
     async def get_all_entries(self, skip: int = 0, limit: int = 100) -> List[Dict]:
         """Get all diary entries ordered by timestamp"""
         async with self.driver.session(database=self.database) as session:
+            # Page first, then collect tags for the returned entries only
             query = """
             MATCH (e:Entry)
-            OPTIONAL MATCH (e)-[:HAS_TAG]->(t:Tag)
-            WITH e, collect(t.name) as tags
-            ORDER BY e.timestamp DESC
+            WHERE e.timestamp IS NOT NULL
+            WITH e
+            ORDER BY e.timestamp DESC, e.id DESC
             SKIP $skip
             LIMIT $limit
+            OPTIONAL MATCH (e)-[:HAS_TAG]->(t:Tag)
+            WITH e, collect(t.name) as tags
+            ORDER BY e.timestamp DESC, e.id DESC
             RETURN e.id as id, e.title as title, e.text as text, 
                    e.timestamp as timestamp, e.audio_path as audio_path,
-                   e.image_path as image_path, tags
+                   e.image_path as image_path, tags,
+                   coalesce(e.enrichment_status, 'ready') as enrichment_status
             """
             
             result = await session.run(query, skip=skip, limit=limit)
@@ -326,6 +1013,75 @@ class DiaryDatabase:
             
             return entries
     
+    @timed("neo4j.get_entries_page")
+    async def get_entries_page(
+        self,
+        limit: int = 100,
+        cursor: Optional[str] = None,
+        start: Optional[str] = None,
+        end: Optional[str] = None,
+        status: Optional[str] = None
+    ) -> Tuple[List[Dict], Optional[str]]:
+        """
+        Keyset-paginated entries, newest first
+        
+        Pages are ordered by (timestamp, id) and continue after `cursor`, so each
+        page is a range seek on the entry_timestamp index whatever its depth.
+        `start` (inclusive) and `end` (exclusive) bound the timestamp range and
+        `status` keeps only entries with that enrichment status. Returns the entries and the cursor for the next page (None at the end).
+        """
+        conditions = []
+        params = {"limit": limit}
+        
+        if cursor:
+            cursor_ts, cursor_id = decode_cursor(cursor)
+            conditions.append("e.timestamp <= $cursor_ts")
+            conditions.append("(e.timestamp < $cursor_ts OR e.id < $cursor_id)")
+            params.update(cursor_ts=cursor_ts, cursor_id=cursor_id)
+        if start:
+            conditions.append("e.timestamp >= $start")
+            params["start"] = start
+        if end:
+            conditions.append("e.timestamp < $end")
+            params["end"] = end
+        if not conditions:
+            # Lets the planner serve the ORDER BY from the index
+            conditions.append("e.timestamp IS NOT NULL")
+        if status:
+            # Entries written before enrichment tracking have no status and are "ready"
+            conditions.append("coalesce(e.enrichment_status, 'ready') = $status")
+            params["status"] = status
+        
+        async with self.driver.session(database=self.database) as session:
+            query = f"""
+            MATCH (e:Entry)
+            WHERE {" AND ".join(conditions)}
+            WITH e
+            ORDER BY e.timestamp DESC, e.id DESC
+            LIMIT $limit
+            OPTIONAL MATCH (e)-[:HAS_TAG]->(t:Tag)
+            WITH e, collect(t.name) as tags
+            ORDER BY e.timestamp DESC, e.id DESC
+            RETURN e.id as id, e.title as title, e.text as text, 
+                   e.timestamp as timestamp, e.audio_path as audio_path,
+                   e.image_path as image_path, tags,
+                   coalesce(e.enrichment_status, 'ready') as enrichment_status
+            """
+            
+            result = await session.run(query, **params)
+            
+            entries = []
+            async for record in result:
+                entries.append(dict(record))
+        
+        next_cursor = None
+        if len(entries) == limit:
+            last = entries[-1]
+            next_cursor = encode_cursor(last["timestamp"], last["id"])
+        
+        return entries, next_cursor
+    
+    @timed("neo4j.get_entry")
     async def get_entry_by_id(self, entry_id: str) -> Optional[Dict]:
         """Get a specific entry by ID"""
         async with self.driver.session(database=self.database) as session:
@@ -335,7 +1091,8 @@ class DiaryDatabase:
             WITH e, collect(t.name) as tags
             RETURN e.id as id, e.title as title, e.text as text, 
                    e.timestamp as timestamp, e.audio_path as audio_path,
-                   e.image_path as image_path, tags
+                   e.image_path as image_path, tags,
+                   coalesce(e.enrichment_status, 'ready') as enrichment_status
             """
             
             result = await session.run(query, id=entry_id)
@@ -343,28 +1100,224 @@ class DiaryDatabase:
             
             return dict(record) if record else None
     
-    async def semantic_search(self, query_embedding: np.ndarray, limit: int = 10) -> List[Dict]:
-        """Perform semantic search using vector similarity"""
+    @timed("neo4j.vector_search")
+    async def vector_search(self, query_embedding: np.ndarray, limit: int = 10) -> Tuple[List[Dict], str]:
+        """
+        Semantic search returning the matching entries and the path used
+        
+        Uses the local ANN index when enabled ("ann_index"), then the
+        entry_embedding vector index when available ("vector_index"), otherwise
+        compares the query with every entry ("scan"). Segments of long entries
+        are searched the same way; an entry matched through a segment carries
+        it as "segment" ({text, start, end, similarity}).
+        """
+        query_vec = [float(x) for x in query_embedding]
+        if not any(query_vec):
+            # A zero vector has no direction - nothing can be similar to it
+            return [], "none"
+        
+        if self.ann_index is not None:
+            entries = await self._ann_search(query_embedding, limit)
+            return entries, "ann_index"
+        
+        if self.vector_index_available:
+            try:
+                entries, segment_hits = await asyncio.gather(
+                    self._index_search(query_vec, limit),
+                    self._segment_search(query_vec, limit, self.segment_index_available)
+                )
+                return merge_segment_hits(entries, segment_hits, limit), "vector_index"
+            except Exception as e:
+                print(f"[WARN] Vector index search failed, falling back to scan: {e}")
+                self.vector_index_available = False
+        
+        entries, segment_hits = await asyncio.gather(
+            self._scan_search(query_vec, limit),
+            self._segment_search(query_vec, limit, False)
+        )
+        return merge_segment_hits(entries, segment_hits, limit), "scan"
+    
+    async def _ann_search(self, query_embedding: np.ndarray, limit: int) -> List[Dict]:
+        """Candidate ids from the local ANN indexes, hydrated from Neo4j in one query"""
+        scores = {
+            entry_id: score
+            for entry_id, score in self.ann_index.search(query_embedding, limit)
+            if score > self.min_similarity
+        }
+        
+        # Best segment per entry (hits come best first)
+        best_segments = {}
+        if self.segment_ann_index is not None and len(self.segment_ann_index):
+            for seg_id, score in self.segment_ann_index.search(query_embedding, limit * self.segment_overfetch):
+                entry_id = seg_id.rpartition(":")[0]
+                if score > self.min_similarity and entry_id not in best_segments:
+                    best_segments[entry_id] = (seg_id, score)
+                    scores[entry_id] = max(scores.get(entry_id, -1.0), score)
+        
+        ranked = sorted(scores, key=scores.get, reverse=True)[:limit]
+        entries = await self._get_entries_with_segments(
+            ranked, [best_segments.get(entry_id, (None,))[0] for entry_id in ranked]
+        )
+        for entry in entries:
+            entry["similarity"] = scores[entry["id"]]
+            if entry["id"] in best_segments:
+                entry["segment"]["similarity"] = best_segments[entry["id"]][1]
+        return entries
+    
+    async def _get_entries_with_segments(self, entry_ids: List[str], segment_ids: List[Optional[str]]) -> List[Dict]:
+        """get_entries_by_ids, each with the segment at its position in segment_ids (or None)"""
+        if not entry_ids:
+            return []
         async with self.driver.session(database=self.database) as session:
-            # Convert to list
-            query_vec = list(query_embedding)
+            query = """
+            UNWIND range(0, size($ids) - 1) AS position
+            MATCH (e:Entry {id: $ids[position]})
+            OPTIONAL MATCH (e)-[:HAS_TAG]->(t:Tag)
+            WITH position, e, collect(t.name) as tags
+            OPTIONAL MATCH (e)-[:HAS_SEGMENT]->(s:Segment {id: $segment_ids[position]})
+            WITH position, e, tags, s
+            ORDER BY position
+            RETURN e.id as id, e.title as title, e.text as text, 
+                   e.timestamp as timestamp, e.audio_path as audio_path,
+                   e.image_path as image_path, tags,
+                   coalesce(e.enrichment_status, 'ready') as enrichment_status,
+                   s.text as segment_text, s.start_time as segment_start, s.end_time as segment_end
+            """
             
-            # Use vector similarity search
+            result = await session.run(query, ids=entry_ids, segment_ids=segment_ids)
+            return [with_segment(dict(record)) async for record in result]
+    
+    async def _segment_search(self, query_vec: List[float], limit: int, use_index: bool) -> List[Dict]:
+        """Entries whose segments match the query, each with its best segment"""
+        if use_index:
+            candidates = """
+            CALL db.index.vector.queryNodes($index_name, $k, $query_vector)
+            YIELD node AS s, score
+            WITH s, 2 * score - 1 AS similarity
+            """
+        else:
+            candidates = """
+            MATCH (s:Segment)
+            WHERE s.embedding IS NOT NULL
+            WITH s, cosineSimilarity(s.embedding, $query_vector) AS similarity
+            """
+        query = candidates + """
+            WHERE similarity > $min_similarity
+            MATCH (e:Entry)-[:HAS_SEGMENT]->(s)
+            WITH e, s, similarity
+            ORDER BY similarity DESC
+            WITH e, collect(s)[0] AS best, max(similarity) AS similarity
+            ORDER BY similarity DESC
+            LIMIT $limit
+            OPTIONAL MATCH (e)-[:HAS_TAG]->(t:Tag)
+            WITH e, best AS s, similarity, collect(t.name) as tags
+            ORDER BY similarity DESC
+            RETURN e.id as id, e.title as title, e.text as text, 
+                   e.timestamp as timestamp, e.audio_path as audio_path,
+                   e.image_path as image_path, tags, similarity,
+                   s.text as segment_text, s.start_time as segment_start, s.end_time as segment_end
+            """
+        async with self.driver.session(database=self.database) as session:
+            result = await session.run(
+                query,
+                index_name=self.segment_index_name,
+                k=limit * self.segment_overfetch,
+                query_vector=query_vec,
+                min_similarity=self.min_similarity,
+                limit=limit
+            )
+            entries = []
+            async for record in result:
+                entry = with_segment(dict(record))
+                entry["segment"]["similarity"] = entry["similarity"]
+                entries.append(entry)
+            return entries
+    
+    async def _index_search(self, query_vec: List[float], limit: int) -> List[Dict]:
+        """kNN search through the vector index, thresholding only the top candidates"""
+        async with self.driver.session(database=self.database) as session:
+            # Over-fetch so that the similarity threshold still leaves `limit` results.
+            # The index reports cosine scores normalised to [0, 1]: (1 + cos) / 2
+            query = """
+            CALL db.index.vector.queryNodes($index_name, $k, $query_vector)
+            YIELD node AS e, score
+            WITH e, 2 * score - 1 AS similarity
+            WHERE similarity > $min_similarity
+            ORDER BY similarity DESC
+            LIMIT $limit
+            OPTIONAL MATCH (e)-[:HAS_TAG]->(t:Tag)
+            WITH e, similarity, collect(t.name) as tags
+            ORDER BY similarity DESC
+            RETURN e.id as id, e.title as title, e.text as text, 
+                   e.timestamp as timestamp, e.audio_path as audio_path,
+                   e.image_path as image_path, tags, similarity
+            """
+            
+            result = await session.run(
+                query,
+                index_name=self.vector_index_name,
+                k=max(limit * self.search_overfetch, limit),
+                query_vector=query_vec,
+                min_similarity=self.min_similarity,
+                limit=limit
+            )
+            
+            entries = []
+            async for record in result:
+                entries.append(dict(record))
+            
+            return entries
+    
+    async def _scan_search(self, query_vec: List[float], limit: int) -> List[Dict]:
+        """Brute-force cosine similarity over every entry (servers without vector indexes)"""
+        async with self.driver.session(database=self.database) as session:
             query = """
             MATCH (e:Entry)
             WHERE e.embedding IS NOT NULL
             WITH e, cosineSimilarity(e.embedding, $query_vector) as similarity
-            WHERE similarity > 0.5
+            WHERE similarity > $min_similarity
+            ORDER BY similarity DESC
+            LIMIT $limit
             OPTIONAL MATCH (e)-[:HAS_TAG]->(t:Tag)
             WITH e, similarity, collect(t.name) as tags
             ORDER BY similarity DESC
-            LIMIT $limit
             RETURN e.id as id, e.title as title, e.text as text, 
                    e.timestamp as timestamp, e.audio_path as audio_path,
                    e.image_path as image_path, tags, similarity
             """
             
-            result = await session.run(query, query_vector=query_vec, limit=limit)
+            result = await session.run(
+                query,
+                query_vector=query_vec,
+                min_similarity=self.min_similarity,
+                limit=limit
+            )
+            
+            entries = []
+            async for record in result:
+                entries.append(dict(record))
+            
+            return entries
+    
+    @timed("neo4j.get_entries_by_ids")
+    async def get_entries_by_ids(self, entry_ids: List[str]) -> List[Dict]:
+        """Fetch entries by id, preserving the order of `entry_ids`"""
+        if not entry_ids:
+            return []
+        async with self.driver.session(database=self.database) as session:
+            query = """
+            UNWIND range(0, size($ids) - 1) AS position
+            MATCH (e:Entry {id: $ids[position]})
+            OPTIONAL MATCH (e)-[:HAS_TAG]->(t:Tag)
+            WITH position, e, collect(t.name) as tags
+            ORDER BY position
+            RETURN e.id as id, e.title as title, e.text as text, 
+                   e.timestamp as timestamp, e.audio_path as audio_path,
+                   e.image_path as image_path, tags,
+                   coalesce(e.enrichment_status, 'ready') as enrichment_status
+            """
+            
+            result = await session.run(query, ids=entry_ids)
             
             entries = []
             async for record in result:
@@ -372,8 +1325,71 @@ class DiaryDatabase:
             
             return entries
     
+    @timed("neo4j.text_search")
     async def text_search(self, query_text: str, limit: int = 10) -> List[Dict]:
-        """Perform text-based search as fallback when embeddings unavailable"""
+        """
+        Relevance-ranked keyword search
+        
+        Uses the Neo4j full-text index when available, otherwise the in-process
+        BM25 index. Results carry a "score" (higher is more relevant).
+        """
+        if not query_text or not query_text.strip():
+            return []
+        
+        if self.fulltext_index_available:
+            try:
+                return await self._fulltext_search(query_text, limit)
+            except Exception as e:
+                print(f"[WARN] Full-text search failed, using in-process index: {e}")
+                self.fulltext_index_available = False
+                if self.in_process_text_index:
+                    await self._build_text_index()
+        
+        if self.text_index is not None:
+            hits = self.text_index.search(query_text, limit)
+            scores = dict(hits)
+            entries = await self.get_entries_by_ids([doc_id for doc_id, _ in hits])
+            for entry in entries:
+                entry["score"] = scores[entry["id"]]
+            return entries
+        
+        return await self._contains_search(query_text, limit)
+    
+    def keyword_search_path(self) -> str:
+        """Name of the mechanism text_search currently uses"""
+        if self.fulltext_index_available:
+            return "fulltext_index"
+        return "bm25" if self.text_index is not None else "scan"
+    
+    async def _fulltext_search(self, query_text: str, limit: int) -> List[Dict]:
+        """Search the entry_fulltext index, returning Lucene relevance scores"""
+        async with self.driver.session(database=self.database) as session:
+            query = """
+            CALL db.index.fulltext.queryNodes($index_name, $search, {limit: $limit})
+            YIELD node AS e, score
+            OPTIONAL MATCH (e)-[:HAS_TAG]->(t:Tag)
+            WITH e, score, collect(t.name) as tags
+            ORDER BY score DESC
+            RETURN e.id as id, e.title as title, e.text as text, 
+                   e.timestamp as timestamp, e.audio_path as audio_path,
+                   e.image_path as image_path, tags, score
+            """
+            
+            result = await session.run(
+                query,
+                index_name=self.fulltext_index_name,
+                search=lucene_query(query_text),
+                limit=limit
+            )
+            
+            entries = []
+            async for record in result:
+                entries.append(dict(record))
+            
+            return entries
+    
+    async def _contains_search(self, query_text: str, limit: int) -> List[Dict]:
+        """Substring scan, used only if no keyword index could be built"""
         async with self.driver.session(database=self.database) as session:
             # Simple text search using CONTAINS
             query = """
@@ -398,19 +1414,60 @@ class DiaryDatabase:
             
             return entries
     
+    @timed("neo4j.delete_entry")
     async def delete_entry(self, entry_id: str) -> bool:
         """Delete an entry and its relationships"""
         async with self.driver.session(database=self.database) as session:
             query = """
             MATCH (e:Entry {id: $id})
+            OPTIONAL MATCH (e)-[:HAS_SEGMENT]->(s:Segment)
+            WITH e, collect(s) AS segments, collect(s.id) AS segment_ids
+            FOREACH (s IN segments | DETACH DELETE s)
             DETACH DELETE e
-            RETURN COUNT(*) as deleted
+            RETURN segment_ids
             """
             
             result = await session.run(query, id=entry_id)
             record = await result.single()
             
-            return record["deleted"] > 0
+            if self.text_index is not None:
+                self.text_index.remove(entry_id)
+            if self.ann_index is not None:
+                self.ann_index.remove(entry_id)
+            if self.segment_ann_index is not None and record is not None:
+                for seg_id in record["segment_ids"]:
+                    self.segment_ann_index.remove(seg_id)
+            
+            return record is not None
+
+
+# Concept, Entity, Keyword and RELATES_TO links for the entry `e` of each `row`
+GRAPH_MERGES = """
+            FOREACH (concept_name IN row.concepts |
+                MERGE (c:Concept {name: concept_name})
+                MERGE (e)-[:MENTIONS_CONCEPT]->(c))
+            FOREACH (entity_name IN row.entities |
+                MERGE (ent:Entity {name: entity_name})
+                MERGE (e)-[:MENTIONS_ENTITY]->(ent))
+            FOREACH (keyword_name IN row.keywords |
+                MERGE (k:Keyword {name: keyword_name})
+                MERGE (e)-[:HAS_KEYWORD]->(k))
+            FOREACH (rel IN row.relationships |
+                MERGE (obj:Concept {name: rel.object})
+                MERGE (e)-[:RELATES_TO {type: rel.relation}]->(obj))
+"""
+
 
+LUCENE_SPECIAL = set('+-&|!(){}[]^"~*?:\\/')
 
 
+def lucene_query(text: str) -> str:
+    """Escape user input for a full-text query, matching any of its words"""
+    terms = []
+    for word in text.split():
+        escaped = "".join("\\" + ch if ch in LUCENE_SPECIAL else ch for ch in word)
+        if escaped in ("AND", "OR", "NOT"):
+            # Search operators as plain words
+            escaped = escaped.lower()
+        terms.append(escaped)
+    return " ".join(terms)
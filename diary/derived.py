@@ -0,0 +1,206 @@
+"""
+Derived media: thumbnails and resized variants of uploaded images
+
+List views show dozens of entries at once, so they request a small variant
+instead of the original photo. Variants are rendered on first request and
+kept in an on-disk cache with a byte budget and LRU eviction.
+"""
+
+import asyncio
+import hashlib
+import os
+import time
+import uuid
+from collections import OrderedDict
+from typing import Dict, Optional
+
+from PIL import Image, ImageOps
+
+from diary.executors import media_stage
+from diary.media import is_content_addressed
+
+# Long side, in pixels, of each variant
+VARIANTS = {
+    "thumb": int(os.getenv("THUMBNAIL_SIDE", 400)),
+    "medium": int(os.getenv("MEDIUM_IMAGE_SIDE", 1280)),
+}
+JPEG_QUALITY = 82
+
+
+def _render_variant(source: str, dest: str, side: int) -> int:
+    """Write a JPEG of source fitting in side x side to dest and return its size"""
+    image = Image.open(source)
+    # JPEG draft mode decodes at 1/2, 1/4 or 1/8 scale for almost free
+    image.draft("RGB", (side, side))
+    image = ImageOps.exif_transpose(image)
+    if image.mode in ("RGBA", "LA", "P"):
+        image = image.convert("RGBA")
+        background = Image.new("RGB", image.size, (255, 255, 255))
+        background.paste(image, mask=image.split()[-1])
+        image = background
+    else:
+        image = image.convert("RGB")
+    image.thumbnail((side, side), Image.LANCZOS)
+
+    # Written under a temporary name so a reader never sees a partial file
+    os.makedirs(os.path.dirname(dest), exist_ok=True)
+    tmp_path = f"{dest}.{uuid.uuid4().hex}.tmp"
+    try:
+        image.save(tmp_path, "JPEG", quality=JPEG_QUALITY, optimize=True, progressive=True)
+        os.replace(tmp_path, dest)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return os.path.getsize(dest)
+
+
+class DerivedMediaCache:
+    """
+    On-disk LRU cache of rendered image variants
+
+    Variants of content-addressed uploads are keyed by the upload's hash;
+    other files by their path, size and modification time, so a replaced
+    file gets fresh variants. Recency is kept in memory and mirrored to the
+    files' access times, which rebuild the LRU order after a restart (the
+    modification time stays put, as it backs Last-Modified). Concurrent
+    requests for the same missing variant render it once.
+
+    Several API workers share the directory, so the byte budget is checked
+    against the directory itself: it is re-read after a render once
+    DERIVED_CACHE_RESCAN_SECONDS have passed, picking up the other workers'
+    variants, evictions and (through access times) their hits. Between
+    scans the cache can overshoot by what the other workers rendered.
+    """
+
+    def __init__(self, root: Optional[str] = None, max_bytes: Optional[int] = None):
+        self.root = root or os.getenv("DERIVED_CACHE_DIR", "./data/derived")
+        self.max_bytes = max_bytes or int(os.getenv("DERIVED_CACHE_MB", 512)) * 1024 * 1024
+        self.rescan_seconds = float(os.getenv("DERIVED_CACHE_RESCAN_SECONDS", 60))
+        self._scanned_at = 0.0
+        self.entries: "OrderedDict[str, int]" = OrderedDict()
+        self.bytes = 0
+        self._pending: Dict[str, asyncio.Future] = {}
+
+        # Metrics
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        os.makedirs(self.root, exist_ok=True)
+        self._load(self._list_files())
+        self._evict()
+
+    def _list_files(self):
+        """(path, size) of every cached variant, least recently used first"""
+        files = []
+        for directory, _, names in os.walk(self.root):
+            for name in names:
+                path = os.path.join(directory, name)
+                try:
+                    stat = os.stat(path)
+                    if name.endswith(".tmp"):
+                        # Another worker may still be writing a recent one
+                        if time.time() - stat.st_mtime > 3600:
+                            os.remove(path)
+                        continue
+                except OSError:
+                    continue  # evicted by another worker meanwhile
+                files.append((stat.st_atime, path, stat.st_size))
+        return [(path, size) for _, path, size in sorted(files)]
+
+    def _load(self, files):
+        """Replace the in-memory view of the cache with the directory listing"""
+        self.entries = OrderedDict(files)
+        self.bytes = sum(self.entries.values())
+        self._scanned_at = time.monotonic()
+
+    async def _rescan(self):
+        """Re-read the directory if the last scan is older than rescan_seconds"""
+        if time.monotonic() - self._scanned_at < self.rescan_seconds:
+            return
+        self._scanned_at = time.monotonic()  # one rescan at a time
+        loop = asyncio.get_running_loop()
+        self._load(await loop.run_in_executor(None, self._list_files))
+
+    def variant_path(self, source: str, variant: str) -> str:
+        """Cache path of a variant of source"""
+        if is_content_addressed(source):
+            key = os.path.splitext(os.path.basename(source))[0]
+        else:
+            stat = os.stat(source)
+            key = hashlib.sha256(
+                f"{os.path.realpath(source)}\0{stat.st_size}\0{stat.st_mtime_ns}".encode("utf-8")
+            ).hexdigest()
+        return os.path.join(self.root, key[:2], f"{key}.{variant}.jpg")
+
+    async def get(self, source: str, variant: str) -> str:
+        """Path of the requested variant of source, rendering it if needed"""
+        side = VARIANTS[variant]
+        path = self.variant_path(source, variant)
+        if path in self.entries and os.path.exists(path):
+            self.hits += 1
+            self._touch(path)
+            return path
+        if path not in self._pending and os.path.exists(path):
+            # Rendered by another worker since the last scan
+            try:
+                self.entries[path] = os.path.getsize(path)
+                self.bytes += self.entries[path]
+                self.hits += 1
+                self._touch(path)
+                return path
+            except OSError:
+                pass
+
+        # The render runs as its own task, so a client that disconnects does
+        # not cancel it for the other requests waiting on the same variant
+        task = self._pending.get(path)
+        if task is None:
+            self.misses += 1
+            task = asyncio.ensure_future(self._render(source, path, side))
+            self._pending[path] = task
+        return await asyncio.shield(task)
+
+    async def _render(self, source: str, path: str, side: int) -> str:
+        try:
+            size = await media_stage.run(_render_variant, source, path, side)
+        finally:
+            del self._pending[path]
+        await self._rescan()
+        if path in self.entries:
+            self.bytes -= self.entries.pop(path)
+        self.entries[path] = size
+        self.bytes += size
+        self._evict(keep=path)
+        return path
+
+    def _touch(self, path: str):
+        self.entries.move_to_end(path)
+        try:
+            os.utime(path, ns=(time.time_ns(), os.stat(path).st_mtime_ns))
+        except OSError:
+            pass
+
+    def _evict(self, keep: Optional[str] = None):
+        """Delete least recently used variants until the cache fits its budget"""
+        while self.bytes > self.max_bytes and self.entries:
+            path, size = next(iter(self.entries.items()))
+            if path == keep:
+                break
+            del self.entries[path]
+            self.bytes -= size
+            self.evictions += 1
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def stats(self) -> Dict:
+        return {
+            "entries": len(self.entries),
+            "bytes": self.bytes,
+            "budget_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions
+        }
@@ -0,0 +1,239 @@
+"""
+Two-tier cache for text embeddings keyed by model name and content hash
+"""
+
+import hashlib
+import json
+import os
+import unicodedata
+from collections import OrderedDict
+from typing import Dict, Optional
+
+import numpy as np
+
+from diary.locking import LockHeld, OwnerLock
+
+
+def cache_key(model_name: str, text: str) -> str:
+    """Hash of the model name and whitespace/unicode-normalised text"""
+    normalized = " ".join(unicodedata.normalize("NFC", text).split())
+    return hashlib.sha256(f"{model_name}\0{normalized}".encode("utf-8")).hexdigest()
+
+
+class DiskEmbeddingStore:
+    """
+    Fixed-capacity on-disk embedding store
+
+    Vectors live in a memory-mapped float16/float32 array used as a ring
+    buffer; an append-only key index maps content hashes to rows. Once full,
+    the oldest row is overwritten. The next row to write is tracked in
+    memory, so the store is owned by one process (an owner lock in the
+    directory, held until the process exits); others raise LockHeld.
+    """
+
+    def __init__(self, directory: str, capacity: int = 100000, dtype: str = "float16"):
+        self.directory = directory
+        self.capacity = capacity
+        self.dtype = np.dtype(dtype)
+        self.dim = None
+        self.vectors = None
+        self.rows: Dict[str, int] = {}
+        self.row_keys: Dict[int, str] = {}
+        self.next_row = 0
+        self.index_lines = 0
+        self.evictions = 0
+
+        os.makedirs(directory, exist_ok=True)
+        self.lock = OwnerLock(os.path.join(directory, "owner.lock"))
+        self.lock.acquire()
+        self.meta_path = os.path.join(directory, "meta.json")
+        self.vectors_path = os.path.join(directory, "vectors.bin")
+        self.index_path = os.path.join(directory, "keys.idx")
+        self._load()
+
+    def _load(self):
+        """Reopen an existing store"""
+        if not os.path.exists(self.meta_path):
+            return
+        with open(self.meta_path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta.get("capacity") != self.capacity or meta.get("dtype") != self.dtype.name:
+            print("[INFO] Embedding cache settings changed, starting a new disk cache")
+            return
+
+        self.dim = meta["dim"]
+        self.vectors = np.memmap(
+            self.vectors_path, dtype=self.dtype, mode="r+", shape=(self.capacity, self.dim)
+        )
+        if os.path.exists(self.index_path):
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    parts = line.split()
+                    if len(parts) != 2:
+                        continue  # Torn write from a crash
+                    self._assign(parts[0], int(parts[1]))
+                    self.next_row = (int(parts[1]) + 1) % self.capacity
+                    self.index_lines += 1
+
+    def _create(self, dim: int):
+        """Allocate the vector file for the first stored embedding"""
+        self.dim = dim
+        self.vectors = np.memmap(
+            self.vectors_path, dtype=self.dtype, mode="w+", shape=(self.capacity, dim)
+        )
+        with open(self.meta_path, "w", encoding="utf-8") as f:
+            json.dump({"dim": dim, "capacity": self.capacity, "dtype": self.dtype.name}, f)
+        open(self.index_path, "w").close()
+        self.rows.clear()
+        self.row_keys.clear()
+        self.next_row = 0
+        self.index_lines = 0
+
+    def _assign(self, key: str, row: int):
+        """Point key at row, dropping whatever key held the row before"""
+        old_key = self.row_keys.get(row)
+        if old_key is not None and old_key != key:
+            del self.rows[old_key]
+        self.rows[key] = row
+        self.row_keys[row] = key
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        row = self.rows.get(key)
+        if row is None:
+            return None
+        return np.asarray(self.vectors[row], dtype=np.float32)
+
+    def put(self, key: str, vector: np.ndarray):
+        if key in self.rows:
+            return
+        if self.vectors is None or self.dim != vector.shape[0]:
+            self._create(vector.shape[0])
+
+        row = self.next_row
+        if row in self.row_keys:
+            self.evictions += 1
+        self.vectors[row] = vector
+        # The row must be on disk before the index line that points at it
+        self.vectors.flush()
+        self._assign(key, row)
+        self.next_row = (row + 1) % self.capacity
+
+        with open(self.index_path, "a", encoding="utf-8") as f:
+            f.write(f"{key} {row}\n")
+        self.index_lines += 1
+        if self.index_lines > 2 * self.capacity:
+            self._compact()
+
+    def _compact(self):
+        """Rewrite the key index with one line per live row, oldest first"""
+        tmp_path = self.index_path + ".tmp"
+        order = [(self.next_row + i) % self.capacity for i in range(self.capacity)]
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for row in order:
+                if row in self.row_keys:
+                    f.write(f"{self.row_keys[row]} {row}\n")
+        os.replace(tmp_path, self.index_path)
+        self.index_lines = len(self.rows)
+
+    def flush(self):
+        if self.vectors is not None:
+            self.vectors.flush()
+
+    def __len__(self):
+        return len(self.rows)
+
+
+class EmbeddingCache:
+    """
+    LRU cache of embeddings with an optional persistent disk tier
+
+    The in-memory tier is bounded by a byte budget. Disk hits are promoted
+    to memory. Counters are kept for hits, misses and evictions.
+    """
+
+    def __init__(
+        self,
+        max_bytes: int,
+        disk_dir: Optional[str] = None,
+        disk_capacity: int = 100000,
+        disk_dtype: str = "float16"
+    ):
+        self.max_bytes = max_bytes
+        self.entries: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self.bytes = 0
+        self.disk = None
+        if disk_dir:
+            try:
+                self.disk = DiskEmbeddingStore(disk_dir, disk_capacity, disk_dtype)
+            except LockHeld as e:
+                print(f"[INFO] Embedding disk cache is in use ({e}); caching in memory only")
+            except Exception as e:
+                print(f"[WARN] Could not open embedding disk cache: {e}")
+
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def _size(key: str, vector: np.ndarray) -> int:
+        return vector.nbytes + len(key)
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        vector = self.entries.get(key)
+        if vector is not None:
+            self.entries.move_to_end(key)
+            self.memory_hits += 1
+            return vector.copy()
+
+        if self.disk is not None:
+            vector = self.disk.get(key)
+            if vector is not None:
+                self.disk_hits += 1
+                self._remember(key, vector)
+                return vector.copy()
+
+        self.misses += 1
+        return None
+
+    def put(self, key: str, vector: np.ndarray):
+        vector = np.asarray(vector, dtype=np.float32)
+        self._remember(key, vector)
+        if self.disk is not None:
+            self.disk.put(key, vector)
+
+    def _remember(self, key: str, vector: np.ndarray):
+        """Insert into the memory tier, evicting least recently used entries"""
+        size = self._size(key, vector)
+        if size > self.max_bytes:
+            return
+        if key in self.entries:
+            self.bytes -= self._size(key, self.entries.pop(key))
+        self.entries[key] = vector
+        self.bytes += size
+        while self.bytes > self.max_bytes:
+            old_key, old_vector = self.entries.popitem(last=False)
+            self.bytes -= self._size(old_key, old_vector)
+            self.evictions += 1
+
+    def flush(self):
+        if self.disk is not None:
+            self.disk.flush()
+
+    def stats(self) -> Dict:
+        stats = {
+            "memory_entries": len(self.entries),
+            "memory_bytes": self.bytes,
+            "memory_budget_bytes": self.max_bytes,
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "evictions": self.evictions
+        }
+        if self.disk is not None:
+            stats.update({
+                "disk_entries": len(self.disk),
+                "disk_capacity": self.disk.capacity,
+                "disk_evictions": self.disk.evictions
+            })
+        return stats
@@ -2,10 +2,18 @@
 Embedding service for semantic search and summarization
 """
 
-from sentence_transformers import SentenceTransformer
+import asyncio
+import os
+import time
 import numpy as np
-from typing import List, Dict
-import torch
+from collections import Counter
+from typing import List, Dict, Optional, Tuple
+from diary import metrics
+from diary.executors import (
+    PRIORITIES, ModelNotReady, embedding_stage, request_deadline, request_priority
+)
+from diary.embedding_cache import EmbeddingCache, cache_key
+from diary.model_bundle import verify_bundle
 
 
 class EmbeddingService:
@@ -13,94 +21,155 @@ class EmbeddingService:
     
     def __init__(self):
         self.model = None
-        self.model_name = "all-MiniLM-L6-v2"  # 384 dimensions, fast and efficient
+        self.model_name = os.getenv("EMBED_MODEL_NAME", "all-MiniLM-L6-v2")  # 384 dimensions, fast and efficient
+        
+        # EMBED_MODEL_DIR pins a local bundle (see bundle_model.py); loading it
+        # never contacts the Hugging Face hub. sentence-transformers and torch
+        # are only imported when the model loads.
+        self.model_dir = os.getenv("EMBED_MODEL_DIR") or None
+        self.offline = os.getenv("EMBED_OFFLINE", "1" if self.model_dir else "0") == "1"
+        self.device = os.getenv("EMBED_DEVICE") or None
+        
+        # "torch" runs SentenceTransformer; "onnx" runs the bundle's ONNX export
+        # (export_onnx.py) through ONNX Runtime without importing torch
+        self.backend = os.getenv("EMBED_BACKEND", "torch")
+        self.onnx_quantized = os.getenv("EMBED_ONNX_QUANTIZED", "0") == "1"
+        self.onnx_threads = int(os.getenv("EMBED_ONNX_THREADS", 0))
+        self.load_retry_seconds = float(os.getenv("EMBED_LOAD_RETRY_SECONDS", 60))
+        self.state = "cold"  # cold -> loading -> ready, or failed
+        self.load_error = None
+        self.load_seconds = None
+        self._load_task = None
+        self._failed_at = 0.0
+        
+        # Dynamic batching: concurrent embed_text calls arriving within the batch
+        # window are encoded together in one forward pass
+        self.batch_window = float(os.getenv("EMBED_BATCH_WINDOW_MS", 5)) / 1000
+        self.max_batch_size = int(os.getenv("EMBED_MAX_BATCH_SIZE", 32))
+        self._pending: List[Tuple[str, asyncio.Future, str, Optional[float]]] = []
+        self._flush_handle = None
+        self.batch_sizes = Counter()  # achieved batch size -> number of batches
+        
+        # Embedding cache keyed by (model name, normalised text hash)
+        cache_mb = float(os.getenv("EMBED_CACHE_MB", 64))
+        self.cache = EmbeddingCache(
+            max_bytes=int(cache_mb * 1024 * 1024),
+            disk_dir=os.getenv("EMBED_CACHE_DIR") or None,
+            disk_capacity=int(os.getenv("EMBED_CACHE_DISK_ENTRIES", 100000)),
+            disk_dtype=os.getenv("EMBED_CACHE_DISK_DTYPE", "float16")
+        ) if cache_mb > 0 else None
+    
+    @property
+    def ready(self) -> bool:
+        """Whether the model is loaded and warmed up"""
+        return self.model is not None
+    
+    def start_warmup(self):
+        """Begin loading the model in the background; requests needing it wait for it"""
+        if self._load_task is None:
+            self._load_task = asyncio.ensure_future(self._load())
     
     async def load_model(self):
-        """Load the sentence transformer model"""
-        print("Loading embedding model...")
+        """
+        Load the model, or wait for the load already in progress
+        
+        A failed load is retried by the next caller once EMBED_LOAD_RETRY_SECONDS
+        have passed, so a missing model does not slow every request down.
+        """
+        if self.model is not None:
+            return
+        if self._load_task is None or (
+            self._load_task.done() and time.monotonic() - self._failed_at >= self.load_retry_seconds
+        ):
+            self._load_task = asyncio.ensure_future(self._load())
+        # Shielded: a caller that times out must not cancel the load for everyone
+        await asyncio.shield(self._load_task)
+    
+    async def require_model(self):
+        """
+        Load the model if needed, or raise ModelNotReady
+        
+        For work that must not store zero vectors in place of embeddings
+        (enrichment, imports); search falls back to keywords instead.
+        """
+        await self.load_model()
+        if not self.ready:
+            raise ModelNotReady("embed", f"The embedding model is not loaded ({self.state})", self.load_retry_seconds)
+    
+    async def _load(self):
+        self.state = "loading"
+        print(f"Loading embedding model from {self.model_dir or self.model_name}...")
+        started = time.perf_counter()
         try:
-            # Try loading directly first
-            self.model = SentenceTransformer(self.model_name)
-            print("[OK] Embedding model loaded")
-        except (FileNotFoundError, OSError, Exception) as e:
-            print(f"[WARN] Model cache issue detected: {e}")
-            print("Attempting to fix by clearing ALL cache and re-downloading...")
-            try:
-                import shutil
-                import os
-                from pathlib import Path
-                
-                # Find and clear ALL related cache
-                cache_base = Path.home() / ".cache" / "huggingface"
-                cache_dir = cache_base / "hub"
-                
-                # Clear the entire model cache directory
-                model_cache_pattern = "models--sentence-transformers--all-MiniLM-L6-v2"
-                
-                print("Clearing all related cache...")
-                
-                # Remove the main model cache
-                if cache_dir.exists():
-                    for item in cache_dir.glob(f"{model_cache_pattern}*"):
-                        if item.is_dir():
-                            print(f"Removing: {item}")
-                            try:
-                                shutil.rmtree(item, ignore_errors=True)
-                            except Exception:
-                                pass
-                    
-                    # Also check snapshots directory
-                    for item in cache_dir.rglob("*sentence-transformers*all-MiniLM-L6-v2*"):
-                        if item.is_dir():
-                            print(f"Removing snapshot: {item}")
-                            try:
-                                shutil.rmtree(item, ignore_errors=True)
-                            except Exception:
-                                pass
-                
-                # Force fresh download - use default cache but ensure clean download
-                import tempfile
-                
-                print("Re-downloading model with fresh cache (this may take a few minutes, ~420MB)...")
-                print("Please be patient, downloading from HuggingFace...")
-                
-                # Try downloading to a temporary location first, then move
-                # This avoids cache corruption issues
-                try:
-                    # Use default cache but force re-download
-                    from huggingface_hub import snapshot_download
-                    import os
-                    
-                    # Clear any environment variables that might interfere
-                    if 'TRANSFORMERS_CACHE' in os.environ:
-                        del os.environ['TRANSFORMERS_CACHE']
-                    if 'HF_HOME' in os.environ:
-                        del os.environ['HF_HOME']
-                    
-                    # Direct download approach - let sentence-transformers handle it
-                    print("Downloading model files...")
-                    self.model = SentenceTransformer(self.model_name)
-                    
-                except Exception as download_error:
-                    print(f"[WARN] Direct download failed: {download_error}")
-                    print("[INFO] Trying alternative download method...")
-                    
-                    # Last resort: use a simpler model or skip
-                    print("[WARN] Using fallback - model will be None")
-                    print("[INFO] You can manually install with: pip install --upgrade sentence-transformers")
-                    raise download_error
-                print("[OK] Embedding model loaded successfully")
-            except Exception as e2:
-                print(f"[ERROR] Failed to load embedding model after retry: {e2}")
-                print("[WARN] App will start but semantic search will be limited")
-                print("[INFO] You can try running 'python fix_model_cache.py' manually")
-                self.model = None
+            self.model = await embedding_stage.run_once(self._load_sync)
+        except Exception as e:
+            self.state = "failed"
+            self.load_error = str(e)
+            self._failed_at = time.monotonic()
+            print(f"[ERROR] Could not load embedding model: {e}")
+            if self.model_dir:
+                print("[INFO] Recreate the bundle with: python bundle_model.py --output " + self.model_dir)
+            else:
+                print("[INFO] For offline hosts, create a bundle with bundle_model.py and set EMBED_MODEL_DIR")
+            print("[WARN] Semantic search will use basic keyword matching until the model loads")
+            return
+        self.load_seconds = time.perf_counter() - started
+        self.load_error = None
+        self.state = "ready"
+        print(f"[OK] Embedding model loaded and warmed up in {self.load_seconds:.1f}s")
+    
+    def _load_sync(self):
+        """Import the inference backend, load the model and run one encode (on the embed stage)"""
+        if self.model_dir:
+            manifest = verify_bundle(self.model_dir)
+            if manifest["model_name"] != self.model_name:
+                raise ValueError(
+                    f"Model bundle holds {manifest['model_name']}, expected {self.model_name}"
+                )
+        
+        if self.backend == "onnx":
+            if not self.model_dir:
+                raise ValueError("EMBED_BACKEND=onnx needs EMBED_MODEL_DIR pointing at an exported bundle")
+            from diary.onnx_encoder import OnnxEncoder
+            model = OnnxEncoder(self.model_dir, quantized=self.onnx_quantized, threads=self.onnx_threads)
+        elif self.backend != "torch":
+            raise ValueError(f"Unknown EMBED_BACKEND: {self.backend}")
+        else:
+            if self.offline:
+                # Read by huggingface_hub and transformers at import time
+                os.environ.setdefault("HF_HUB_OFFLINE", "1")
+                os.environ.setdefault("TRANSFORMERS_OFFLINE", "1")
+            from sentence_transformers import SentenceTransformer
+            model = SentenceTransformer(self.model_dir or self.model_name, device=self.device)
+        
+        # The first encode initialises kernels and buffers; do it before serving
+        model.encode(["warm-up"], convert_to_numpy=True)
+        return model
+    
+    def status(self) -> Dict:
+        """Model load state for the readiness endpoint"""
+        return {
+            "state": self.state,
+            "model": self.model_name,
+            "backend": self.backend + ("-int8" if self.backend == "onnx" and self.onnx_quantized else ""),
+            "source": self.model_dir or "huggingface",
+            "offline": self.offline,
+            "load_seconds": round(self.load_seconds, 2) if self.load_seconds is not None else None,
+            "error": self.load_error
+        }
     
     async def embed_text(self, text: str) -> np.ndarray:
         """Generate embedding for a text string"""
         if not text or not text.strip():
             return np.zeros(384)
         
+        # Cache hits skip the model entirely
+        key = cache_key(self.model_name, text) if self.cache is not None else None
+        if key is not None:
+            cached = self.cache.get(key)
+            if cached is not None:
+                return cached
+        
         if self.model is None:
             await self.load_model()
         
@@ -108,12 +177,88 @@ class EmbeddingService:
             # Return zero vector if model failed to load
             return np.zeros(384)
         
-        # Generate embedding
-        embedding = self.model.encode(text, convert_to_numpy=True)
+        embedding = await self._encode(text)
+        if key is not None:
+            self.cache.put(key, embedding)
         return embedding
     
+    async def _encode(self, text: str) -> np.ndarray:
+        """Encode one text, batched with other concurrent requests"""
+        if self.batch_window <= 0 or self.max_batch_size <= 1:
+            # Batching disabled - encode directly off the event loop
+            embedding = await embedding_stage.run(self.model.encode, text, convert_to_numpy=True)
+            self.batch_sizes[1] += 1
+            return embedding
+        
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((text, future, request_priority.get(), request_deadline.get()))
+        
+        if len(self._pending) >= self.max_batch_size:
+            self._flush_pending()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.batch_window, self._flush_pending)
+        
+        # The batch's own "embed" span belongs to no single request; this one
+        # covers the batching window and the encode, as the caller sees them
+        with metrics.span("embed.batched"):
+            return await future
+    
+    def _flush_pending(self):
+        """Send the queued embed requests to the model as one batch"""
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        
+        batch, self._pending = self._pending, []
+        if batch:
+            asyncio.ensure_future(self._encode_pending(batch))
+    
+    async def _encode_pending(self, batch: List[Tuple[str, asyncio.Future, str, Optional[float]]]):
+        """Encode a batch of queued requests and hand each caller its vector"""
+        texts = [text for text, *_ in batch]
+        self.batch_sizes[len(batch)] += 1
+        # The batch runs in the most urgent lane of its callers, and until the
+        # last of their deadlines (none if any caller has none)
+        request_priority.set(min((priority for _, _, priority, _ in batch), key=PRIORITIES.index))
+        deadlines = [deadline for *_, deadline in batch]
+        request_deadline.set(None if None in deadlines else max(deadlines))
+        metrics.request_timings.set(None)
+        try:
+            vectors = await embedding_stage.run(self.model.encode, texts, convert_to_numpy=True)
+        except Exception as e:
+            for _, future, *_ in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        
+        for (_, future, *_), vector in zip(batch, vectors):
+            if not future.done():
+                future.set_result(vector)
+    
+    def batch_stats(self) -> Dict:
+        """Histogram of achieved embed_text batch sizes"""
+        return {
+            "batch_window_ms": self.batch_window * 1000,
+            "max_batch_size": self.max_batch_size,
+            "batches": sum(self.batch_sizes.values()),
+            "requests": sum(size * count for size, count in self.batch_sizes.items()),
+            "batch_size_histogram": {
+                str(size): count for size, count in sorted(self.batch_sizes.items())
+            }
+        }
+    
     async def embed_batch(self, texts: List[str]) -> np.ndarray:
         """Generate embeddings for multiple texts"""
+        if not texts:
+            return np.zeros((0, 384))
+        
+        keys = [cache_key(self.model_name, text) for text in texts] if self.cache is not None else None
+        cached = [self.cache.get(key) for key in keys] if keys else [None] * len(texts)
+        missing = [i for i, vector in enumerate(cached) if vector is None]
+        if not missing:
+            return np.vstack(cached)
+        
         if self.model is None:
             await self.load_model()
         
@@ -121,7 +266,15 @@ class EmbeddingService:
             # Return zero vectors if model failed to load
             return np.zeros((len(texts), 384))
         
-        embeddings = self.model.encode(texts, convert_to_numpy=True)
+        encoded = await embedding_stage.run(
+            self.model.encode, [texts[i] for i in missing], convert_to_numpy=True
+        )
+        for i, vector in zip(missing, encoded):
+            cached[i] = vector
+            if keys:
+                self.cache.put(keys[i], vector)
+        
+        embeddings = np.vstack(cached)
         return embeddings
     
     async def similarity(self, embedding1: np.ndarray, embedding2: np.ndarray) -> float:
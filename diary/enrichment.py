@@ -0,0 +1,308 @@
+"""
+Background enrichment of diary entries
+
+Saving an entry only writes the raw entry (marked "pending") and a job row.
+A worker then transcribes/OCRs its media, embeds it, extracts its graph and
+links it, and marks it "ready". Jobs live in a local SQLite table so that
+work left unfinished by a restart is picked up again.
+"""
+
+import asyncio
+import json
+import os
+import sqlite3
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+from diary import metrics
+from diary.executors import Overloaded, request_priority
+from diary.graph_processor import process_entry_text
+
+
+JOB_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    entry_id TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'queued',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    not_before REAL NOT NULL DEFAULT 0,
+    error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_queue ON jobs (status, not_before, id);
+"""
+
+
+class JobStore:
+    """Durable enrichment job queue in a SQLite file (WAL mode)"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.conn: Optional[sqlite3.Connection] = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="diary-jobs")
+
+    async def _run(self, fn, *args):
+        """Run a blocking call on the job store thread"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, fn, *args)
+
+    async def open(self, requeue: bool = True) -> int:
+        """
+        Open the queue; jobs that were running when the process stopped are re-queued
+
+        With several API workers sharing the queue only the launcher re-queues
+        (requeue=False in the workers), or a starting worker would take over
+        jobs another worker is still running.
+        """
+        return await self._run(self._open_sync, requeue)
+
+    def _open_sync(self, requeue: bool) -> int:
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(JOB_SCHEMA)
+        if not requeue:
+            return 0
+        with self.conn:
+            cursor = self.conn.execute(
+                "UPDATE jobs SET status = 'queued', updated_at = ? WHERE status = 'running'",
+                (time.time(),)
+            )
+        return cursor.rowcount
+
+    async def close(self):
+        if self.conn is not None:
+            await self._run(self.conn.close)
+            self.conn = None
+        self._executor.shutdown(wait=True)
+
+    async def enqueue(self, entry_id: str, payload: Dict):
+        def insert():
+            now = time.time()
+            with self.conn:
+                self.conn.execute(
+                    "INSERT INTO jobs (entry_id, payload, created_at, updated_at) VALUES (?, ?, ?, ?)",
+                    (entry_id, json.dumps(payload), now, now)
+                )
+        await self._run(insert)
+
+    async def claim(self) -> Optional[Dict]:
+        """Take the oldest due job and mark it running, or None"""
+        def take():
+            now = time.time()
+            with self.conn:
+                # Write-locks the queue first, so two processes cannot claim the same job
+                self.conn.execute("BEGIN IMMEDIATE")
+                row = self.conn.execute(
+                    "SELECT * FROM jobs WHERE status = 'queued' AND not_before <= ? ORDER BY id LIMIT 1",
+                    (now,)
+                ).fetchone()
+                if row is None:
+                    return None
+                self.conn.execute(
+                    "UPDATE jobs SET status = 'running', attempts = attempts + 1, updated_at = ? WHERE id = ?",
+                    (now, row["id"])
+                )
+            job = dict(row)
+            job["attempts"] += 1
+            job["payload"] = json.loads(job["payload"])
+            return job
+        return await self._run(take)
+
+    async def complete(self, job_id: int):
+        """Finished jobs are deleted; the entry's status is the lasting record"""
+        def delete():
+            with self.conn:
+                self.conn.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+        await self._run(delete)
+
+    async def fail(self, job_id: int, error: str, retry_at: Optional[float] = None):
+        """Re-queue a job for `retry_at`, or mark it failed for good"""
+        def update():
+            with self.conn:
+                self.conn.execute(
+                    "UPDATE jobs SET status = ?, not_before = ?, error = ?, updated_at = ? WHERE id = ?",
+                    ("queued" if retry_at else "failed", retry_at or 0, error, time.time(), job_id)
+                )
+        await self._run(update)
+
+    async def release(self, job_id: int, retry_at: float):
+        """Put a claimed job back for `retry_at` without counting the attempt"""
+        def update():
+            with self.conn:
+                self.conn.execute(
+                    "UPDATE jobs SET status = 'queued', attempts = attempts - 1, not_before = ?, updated_at = ? "
+                    "WHERE id = ?",
+                    (retry_at, time.time(), job_id)
+                )
+        await self._run(update)
+
+    async def counts(self) -> Dict[str, int]:
+        def query():
+            return {
+                row["status"]: row["count"]
+                for row in self.conn.execute("SELECT status, COUNT(*) AS count FROM jobs GROUP BY status")
+            }
+        return await self._run(query)
+
+
+class EnrichmentWorker:
+    """
+    In-process worker pool draining the enrichment job queue
+
+    `submit` is the fast phase of a save: it records the job and writes the
+    raw entry, nothing more. Failed jobs are retried with exponential backoff
+    up to ENRICH_MAX_ATTEMPTS times, after which the entry is marked "failed".
+
+    Jobs run in the "bulk" priority lane of the stage executors, behind
+    interactive requests. A job turned away by a full stage is put back
+    without using up an attempt. Once ENRICH_MAX_BACKLOG jobs are waiting,
+    new saves are refused (check_backlog) instead of growing the queue.
+    """
+
+    def __init__(self, db, ingestor, store: Optional[JobStore] = None, workers: Optional[int] = None):
+        self.db = db
+        self.ingestor = ingestor
+        self.store = store or JobStore(os.getenv("ENRICH_JOBS_PATH", "./data/jobs.db"))
+        self.workers = workers or int(os.getenv("ENRICH_WORKERS", 2))
+        self.max_attempts = int(os.getenv("ENRICH_MAX_ATTEMPTS", 3))
+        self.poll_interval = float(os.getenv("ENRICH_POLL_INTERVAL", 1.0))
+        self.requeue_on_start = os.getenv("ENRICH_REQUEUE_ON_START", "1") == "1"
+        self.max_backlog = int(os.getenv("ENRICH_MAX_BACKLOG", 1000))
+        self._wakeup: Optional[asyncio.Event] = None
+        self._tasks: List[asyncio.Task] = []
+        self.completed = 0
+        self.failed = 0
+        self.deferred = 0
+
+    async def start(self):
+        """Open the job queue and start the workers"""
+        resumed = await self.store.open(self.requeue_on_start)
+        if resumed:
+            print(f"[INFO] Resuming {resumed} interrupted enrichment jobs")
+        self._wakeup = asyncio.Event()
+        self._tasks = [asyncio.create_task(self._work()) for _ in range(self.workers)]
+        print(f"[OK] Enrichment workers started ({self.workers})")
+
+    async def close(self):
+        """Stop the workers; a job cut off mid-way is re-queued on the next start"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        await self.store.close()
+
+    async def submit(self, entry_data: Dict) -> Dict:
+        """
+        Persist a raw entry as "pending" and queue its enrichment
+
+        entry_data uses the EntryCreate fields. The job is recorded first, so an
+        entry is never left pending without one; a job whose entry was never
+        written simply fails to find it.
+        """
+        entry_id = str(uuid.uuid4())
+        await self.store.enqueue(entry_id, entry_data)
+        entry = await self.db.create_entry({
+            **entry_data,
+            "id": entry_id,
+            "graph_data": {},
+            "enrichment_status": "pending"
+        })
+        self._wakeup.set()
+        return entry
+
+    async def check_backlog(self):
+        """Raise Overloaded if the job queue is already ENRICH_MAX_BACKLOG deep"""
+        if not self.max_backlog:
+            return
+        jobs = await self.store.counts()
+        backlog = jobs.get("queued", 0) + jobs.get("running", 0)
+        if backlog >= self.max_backlog:
+            # Roughly how long the workers need to work the queue back down
+            retry_after = max(1.0, (backlog - self.max_backlog + 1) * 2.0 / self.workers)
+            raise Overloaded("enrich", f"{backlog} entries are waiting for enrichment", min(retry_after, 300.0))
+
+    async def _work(self):
+        request_priority.set("bulk")
+        while True:
+            job = await self.store.claim()
+            if job is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            try:
+                with metrics.span("enrich"):
+                    await self.enrich(job["entry_id"], job["payload"])
+            except asyncio.CancelledError:
+                raise
+            except Overloaded as e:
+                # Not the job's fault: back off and let interactive work through
+                await self.store.release(job["id"], time.time() + e.retry_after)
+                self.deferred += 1
+            except Exception as e:
+                await self._failed(job, e)
+            else:
+                await self.store.complete(job["id"])
+                self.completed += 1
+
+    async def enrich(self, entry_id: str, payload: Dict):
+        """Transcribe/OCR, embed, extract the graph and write the results"""
+        entry_data = await self.ingestor.prepare(payload)
+
+        if entry_data["text"] or entry_data["segments"]:
+            # Without the model the entry would be stored with no embedding for
+            # good; ModelNotReady puts the job back until the model is up
+            await self.ingestor.embeddings.require_model()
+
+        if entry_data["text"]:
+            vector = await self.ingestor.embeddings.embed_text(entry_data["text"])
+            entry_data["embedding"] = vector if vector.any() else None
+        if entry_data["segments"]:
+            vectors = await self.ingestor.embeddings.embed_batch(
+                [segment["text"] for segment in entry_data["segments"]]
+            )
+            for segment, vector in zip(entry_data["segments"], vectors):
+                segment["embedding"] = vector if vector.any() else None
+
+        loop = asyncio.get_running_loop()
+        with metrics.span("graph_extract"):
+            entry_data["graph_data"] = await loop.run_in_executor(
+                None, process_entry_text, entry_data["text"] or entry_data["title"]
+            )
+
+        if not await self.db.enrich_entry(entry_id, entry_data):
+            raise LookupError(f"Entry {entry_id} not found")
+
+    async def _failed(self, job: Dict, error: Exception):
+        if job["attempts"] < self.max_attempts:
+            delay = 2 ** job["attempts"]
+            print(f"[WARN] Enrichment of {job['entry_id']} failed ({error}), retrying in {delay}s")
+            await self.store.fail(job["id"], str(error), time.time() + delay)
+            return
+
+        print(f"[ERROR] Enrichment of {job['entry_id']} failed after {job['attempts']} attempts: {error}")
+        await self.store.fail(job["id"], str(error))
+        await self.db.set_enrichment_status(job["entry_id"], "failed")
+        self.failed += 1
+
+    async def stats(self) -> Dict:
+        jobs = await self.store.counts()
+        return {
+            "queued": jobs.get("queued", 0),
+            "running": jobs.get("running", 0),
+            "failed_jobs": jobs.get("failed", 0),
+            "completed": self.completed,
+            "failed": self.failed,
+            "deferred": self.deferred,
+            "max_backlog": self.max_backlog
+        }
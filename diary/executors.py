@@ -0,0 +1,273 @@
+"""
+Bounded executors for CPU-bound model stages
+
+Encoding, transcription and OCR are synchronous and CPU-heavy. Running them
+directly inside async handlers blocks the event loop, so each stage gets its
+own size-bounded executor and a concurrency limit, keeping the loop free to
+answer list, search and health requests. Bursts are shed at the door: each
+stage has a bounded queue per priority lane and honours request deadlines,
+so an overloaded stage answers 429/503 quickly instead of letting latency
+and memory grow without limit.
+"""
+
+import asyncio
+import functools
+import math
+import os
+import time
+from collections import Counter, deque
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from contextvars import ContextVar
+from typing import Callable, Deque, Dict, Optional
+
+from diary import metrics
+
+# Interactive calls (search, queries) are always started before bulk ones
+# (enrichment, bulk import) waiting for the same stage
+PRIORITIES = ("interactive", "bulk")
+
+# Set per request by main.py (and per background task); read by StageExecutor.run.
+# The deadline is a time.monotonic() value.
+request_priority: ContextVar[str] = ContextVar("request_priority", default="interactive")
+request_deadline: ContextVar[Optional[float]] = ContextVar("request_deadline", default=None)
+
+
+class Overloaded(Exception):
+    """A stage queue is full; the caller should retry after `retry_after` seconds"""
+
+    status_code = 429
+
+    def __init__(self, stage: str, message: str, retry_after: float = 1):
+        super().__init__(message)
+        self.stage = stage
+        self.retry_after = max(1, math.ceil(retry_after))
+
+
+class DeadlineExceeded(Overloaded):
+    """The request's deadline passed, or would pass, before the stage could start it"""
+
+    status_code = 503
+
+
+class ModelNotReady(Overloaded):
+    """A model is not loaded; work that needs it should be retried later"""
+
+    status_code = 503
+
+
+class StageExecutor:
+    """
+    Runs blocking calls for one pipeline stage with admission control
+
+    At most max_workers calls run at once. Others wait in a bounded queue per
+    priority lane; a full lane rejects new calls straight away (Overloaded),
+    and a call whose deadline would pass before it could start, going by the
+    recent average service time, is rejected too (DeadlineExceeded).
+    """
+
+    def __init__(self, name: str, max_workers: int = 1, kind: str = "thread", max_queue: int = 64):
+        self.name = name
+        self.max_workers = max(1, max_workers)
+        self.kind = kind
+        self.max_queue = max_queue
+        self._executor = None
+        self._wait_span = f"{name}.wait"
+        self._waiters: Dict[str, Deque[asyncio.Future]] = {priority: deque() for priority in PRIORITIES}
+        self.service_time: Optional[float] = None  # moving average, seconds
+
+        # Metrics
+        self.running = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = Counter()  # "queue_full" / "deadline" -> count
+
+    @property
+    def queued(self) -> int:
+        return sum(len(lane) for lane in self._waiters.values())
+
+    def _get_executor(self) -> Executor:
+        """Create the underlying pool on first use"""
+        if self._executor is None:
+            if self.kind == "process":
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+            else:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers,
+                    thread_name_prefix=f"diary-{self.name}"
+                )
+        return self._executor
+
+    def expected_wait(self, priority: str) -> Optional[float]:
+        """Estimated seconds before a new call in this lane would start"""
+        if self.service_time is None:
+            return None
+        ahead = len(self._waiters["interactive"])
+        if priority == "bulk":
+            ahead += len(self._waiters["bulk"])
+        return (ahead + 1) / self.max_workers * self.service_time
+
+    def _reject(self, reason: str, error: Overloaded) -> Overloaded:
+        self.rejected[reason] += 1
+        return error
+
+    async def _admit(self, priority: str, deadline: Optional[float]):
+        """Wait for a free slot in priority order, or raise Overloaded"""
+        if self.running < self.max_workers and not self.queued:
+            self.running += 1
+            return
+
+        lane = self._waiters[priority]
+        expected = self.expected_wait(priority)
+        if deadline is not None:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or (expected is not None and expected > remaining):
+                raise self._reject("deadline", DeadlineExceeded(
+                    self.name, f"The {self.name} stage cannot start this request before its deadline",
+                    expected or 1
+                ))
+        if len(lane) >= self.max_queue:
+            raise self._reject("queue_full", Overloaded(
+                self.name, f"The {self.name} queue is full", expected or 1
+            ))
+
+        waiter = asyncio.get_running_loop().create_future()
+        lane.append(waiter)
+        try:
+            if deadline is None:
+                await waiter
+            else:
+                await asyncio.wait_for(waiter, deadline - time.monotonic())
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if waiter.done() and not waiter.cancelled():
+                # The slot was handed over just as we gave up: pass it on
+                self._release()
+            elif waiter in lane:
+                lane.remove(waiter)
+            if isinstance(e, asyncio.TimeoutError):
+                raise self._reject("deadline", DeadlineExceeded(
+                    self.name, f"The request's deadline passed while queued for {self.name}",
+                    self.expected_wait(priority) or 1
+                ))
+            raise
+
+    def _release(self):
+        """Hand the slot to the next waiter, interactive lane first"""
+        for priority in PRIORITIES:
+            lane = self._waiters[priority]
+            while lane:
+                waiter = lane.popleft()
+                if not waiter.done():
+                    waiter.set_result(None)
+                    return
+        self.running -= 1
+
+    async def run(self, fn: Callable, *args, **kwargs):
+        """
+        Run fn(*args, **kwargs) on this stage's executor and await the result
+
+        The call's lane and deadline come from request_priority and
+        request_deadline in the caller's context.
+        """
+        return await self._run(functools.partial(fn, *args, **kwargs), sample=True)
+
+    async def run_once(self, fn: Callable, *args, **kwargs):
+        """
+        Like run, for one-off work such as loading a model
+
+        Its duration is not counted in the service time, which would
+        otherwise make admission control reject every queued call until the
+        average decays.
+        """
+        return await self._run(functools.partial(fn, *args, **kwargs), sample=False)
+
+    async def _run(self, call: Callable, sample: bool):
+        # Queueing and running are timed as separate spans ("embed.wait", "embed")
+        with metrics.span(self._wait_span):
+            await self._admit(request_priority.get(), request_deadline.get())
+        started = time.monotonic()
+        try:
+            loop = asyncio.get_running_loop()
+            with metrics.span(self.name):
+                return await loop.run_in_executor(self._get_executor(), call)
+        except Exception:
+            self.failed += 1
+            raise
+        finally:
+            if sample:
+                elapsed = time.monotonic() - started
+                self.service_time = elapsed if self.service_time is None else 0.8 * self.service_time + 0.2 * elapsed
+            self.completed += 1
+            self._release()
+
+    def stats(self) -> Dict:
+        """Queue depth, throughput and rejection counters"""
+        return {
+            "kind": self.kind,
+            "max_workers": self.max_workers,
+            "max_queue": self.max_queue,
+            "queued": self.queued,
+            "queued_by_priority": {priority: len(lane) for priority, lane in self._waiters.items()},
+            "running": self.running,
+            "completed": self.completed,
+            "failed": self.failed,
+            "rejected": dict(self.rejected),
+            "service_time_ms": round(self.service_time * 1000, 2) if self.service_time is not None else None
+        }
+
+    def shutdown(self):
+        """Shut down the underlying pool"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+# Torch releases the GIL during inference, so threads are enough for the models.
+# Tesseract work is dispatched to processes.
+embedding_stage = StageExecutor(
+    "embed", int(os.getenv("EMBED_WORKERS", 1)), max_queue=int(os.getenv("EMBED_QUEUE_LIMIT", 256))
+)
+transcription_stage = StageExecutor(
+    "transcribe", int(os.getenv("TRANSCRIBE_WORKERS", 1)), max_queue=int(os.getenv("TRANSCRIBE_QUEUE_LIMIT", 16))
+)
+ocr_stage = StageExecutor(
+    "ocr", int(os.getenv("OCR_WORKERS", 2)), kind="process", max_queue=int(os.getenv("OCR_QUEUE_LIMIT", 32))
+)
+# Pillow releases the GIL while decoding and resizing
+media_stage = StageExecutor(
+    "media", int(os.getenv("MEDIA_WORKERS", 2)), max_queue=int(os.getenv("MEDIA_QUEUE_LIMIT", 64))
+)
+
+STAGES = {
+    stage.name: stage
+    for stage in (embedding_stage, transcription_stage, ocr_stage, media_stage)
+}
+
+
+def stage_stats() -> Dict:
+    """Metrics for every stage executor"""
+    return {name: stage.stats() for name, stage in STAGES.items()}
+
+
+@metrics.REGISTRY.collector
+def _stage_metrics():
+    """Queue depth, running calls and rejections of every stage, read on scrape"""
+    stages = list(STAGES.values())
+    return [
+        metrics.family("diary_stage_queued", "gauge", "Calls waiting for a stage slot", (
+            ({"stage": stage.name, "priority": priority}, len(lane))
+            for stage in stages for priority, lane in stage._waiters.items()
+        )),
+        metrics.family("diary_stage_running", "gauge", "Calls running on a stage", (
+            ({"stage": stage.name}, stage.running) for stage in stages
+        )),
+        metrics.family("diary_stage_rejected_total", "counter", "Calls turned away by admission control", (
+            ({"stage": stage.name, "reason": reason}, count)
+            for stage in stages for reason, count in stage.rejected.items()
+        )),
+    ]
+
+
+def shutdown_stages():
+    """Shut down every stage executor"""
+    for stage in STAGES.values():
+        stage.shutdown()
@@ -7,6 +7,28 @@ from typing import List, Dict, Set
 from collections import Counter
 
 
+TOKEN_PATTERN = re.compile(r'\b[a-z]+\b')
+QUOTED_PATTERN = re.compile(r'"([^"]+)"')
+CAPITALIZED_PATTERN = re.compile(r'\b[A-Z][a-z]+\b')
+NAME_PATTERN = re.compile(r'\b[A-Z][a-z]+\s+[A-Z][a-z]+\b')
+LOCATION_PATTERN = re.compile(r'\b(in|at|from|to)\s+([A-Z][a-z]+(?:\s+[A-Z][a-z]+)?)\b')
+
+# Action patterns: "I [verb] [object]" or "[subject] [verb] [object]"
+# Simple extraction for now - can be enhanced with dependency parsing
+RELATIONSHIP_PATTERNS = [
+    re.compile(r'i\s+(went|visited|met|saw|talked|worked|studied|learned|did|created|built)\s+(?:to|with|at|in)?\s*([a-z\s]+)'),
+    re.compile(r'i\s+(am|was|feel|felt)\s+(happy|sad|excited|tired|grateful|worried|proud|anxious|calm)'),
+    re.compile(r'we\s+(went|visited|met|saw|talked|worked|studied|did|created)\s+(?:to|with|at)?\s*([a-z\s]+)'),
+]
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase word tokens, shared by keyword extraction and the keyword search index"""
+    if not text:
+        return []
+    return TOKEN_PATTERN.findall(text.lower())
+
+
 class GraphProcessor:
     """Processes text to extract entities, concepts, and keywords for graph structure"""
     
@@ -39,31 +61,22 @@ class GraphProcessor:
         'movie', 'music', 'dance', 'sing', 'paint', 'draw', 'create', 'build', 'fix'
     }
     
+    def _keyword_counts(self, text_lower: str) -> Counter:
+        """Frequency of each keyword candidate (stop words and short words removed)"""
+        # Count every token in C, then drop the rejects once per distinct word;
+        # deleting keeps first-occurrence order, which most_common uses for ties
+        counts = Counter(TOKEN_PATTERN.findall(text_lower))
+        for word in [word for word in counts if len(word) <= 2 or word in self.STOP_WORDS]:
+            del counts[word]
+        return counts
+    
     def extract_keywords(self, text: str, max_keywords: int = 10) -> List[str]:
         """
         Extract important keywords from text
         """
         if not text:
             return []
-        
-        # Convert to lowercase and split
-        words = re.findall(r'\b[a-z]+\b', text.lower())
-        
-        # Filter out stop words and short words
-        keywords = [
-            word for word in words 
-            if len(word) > 2 
-            and word not in self.STOP_WORDS
-            and word.isalpha()
-        ]
-        
-        # Count frequency
-        word_freq = Counter(keywords)
-        
-        # Get most common keywords
-        top_keywords = [word for word, count in word_freq.most_common(max_keywords)]
-        
-        return top_keywords
+        return [word for word, count in self._keyword_counts(text.lower()).most_common(max_keywords)]
     
     def extract_concepts(self, text: str) -> List[str]:
         """
@@ -72,33 +85,28 @@ class GraphProcessor:
         """
         if not text:
             return []
-        
         text_lower = text.lower()
+        keywords = [word for word, count in self._keyword_counts(text_lower).most_common(15)]
+        return self._concepts(text, text_lower, keywords)
+    
+    def _concepts(self, text: str, text_lower: str, keywords: List[str]) -> List[str]:
+        """Concepts given the text's top-15 keywords"""
         concepts = set()
         
         # Extract regular keywords
-        keywords = self.extract_keywords(text, max_keywords=15)
         concepts.update(keywords)
         
-        # Extract emotions mentioned
-        for emotion in self.EMOTION_KEYWORDS:
-            if emotion in text_lower:
-                concepts.add(emotion)
-        
-        # Extract activities mentioned
-        for activity in self.ACTIVITY_KEYWORDS:
-            if activity in text_lower:
-                concepts.add(activity)
+        # Emotions and activities mentioned, as substrings ("running" mentions "run")
+        concepts.update(word for word in self.EMOTION_KEYWORDS if word in text_lower)
+        concepts.update(word for word in self.ACTIVITY_KEYWORDS if word in text_lower)
         
         # Extract quoted phrases (important concepts)
-        quoted = re.findall(r'"([^"]+)"', text)
-        for phrase in quoted:
+        for phrase in QUOTED_PATTERN.findall(text):
             # Extract keywords from quoted phrases
-            phrase_keywords = self.extract_keywords(phrase, max_keywords=5)
-            concepts.update(phrase_keywords)
+            concepts.update(self.extract_keywords(phrase, max_keywords=5))
         
         # Extract capitalized words (likely names or important concepts)
-        capitalized = re.findall(r'\b[A-Z][a-z]+\b', text)
+        capitalized = CAPITALIZED_PATTERN.findall(text)
         concepts.update([word.lower() for word in capitalized if len(word) > 3])
         
         return list(concepts)[:20]  # Limit to top 20 concepts
@@ -108,15 +116,14 @@ class GraphProcessor:
         Extract named entities (simple version - can be enhanced with NER)
         """
         entities = []
-        text_lower = text.lower()
         
         # Extract person names (heuristic: capitalized words)
-        names = re.findall(r'\b[A-Z][a-z]+\s+[A-Z][a-z]+\b', text)
+        names = NAME_PATTERN.findall(text)
         entities.extend([name.lower() for name in names])
         
         # Extract common entity patterns
         # Locations (words after "in", "at", "from", "to")
-        locations = re.findall(r'\b(in|at|from|to)\s+([A-Z][a-z]+(?:\s+[A-Z][a-z]+)?)\b', text)
+        locations = LOCATION_PATTERN.findall(text)
         entities.extend([loc[1].lower() for loc in locations])
         
         return list(set(entities))  # Remove duplicates
@@ -126,22 +133,12 @@ class GraphProcessor:
         Extract semantic relationships from text
         Returns list of relationship tuples: (subject, relation, object)
         """
+        return self._relationships(text.lower())
+    
+    def _relationships(self, text_lower: str) -> List[Dict[str, str]]:
         relationships = []
-        
-        # Pattern: "I [verb] [object]" or "[subject] [verb] [object]"
-        # Simple extraction for now - can be enhanced with dependency parsing
-        
-        # Action patterns
-        action_patterns = [
-            r'i\s+(went|visited|met|saw|talked|worked|studied|learned|did|created|built)\s+(?:to|with|at|in)?\s*([a-z\s]+)',
-            r'i\s+(am|was|feel|felt)\s+(happy|sad|excited|tired|grateful|worried|proud|anxious|calm)',
-            r'we\s+(went|visited|met|saw|talked|worked|studied|did|created)\s+(?:to|with|at)?\s*([a-z\s]+)',
-        ]
-        
-        text_lower = text.lower()
-        for pattern in action_patterns:
-            matches = re.finditer(pattern, text_lower)
-            for match in matches:
+        for pattern in RELATIONSHIP_PATTERNS:
+            for match in pattern.finditer(text_lower):
                 if len(match.groups()) >= 2:
                     verb = match.group(1)
                     obj = match.group(2).strip()[:30]  # Limit length
@@ -167,9 +164,41 @@ class GraphProcessor:
                 'relationships': []
             }
         
+        # Lowercase and tokenize once; the top 10 keywords are the first 10 of
+        # the top 15 because most_common breaks ties by first occurrence
+        text_lower = text.lower()
+        keywords = [word for word, count in self._keyword_counts(text_lower).most_common(15)]
+        
         return {
-            'keywords': self.extract_keywords(text),
-            'concepts': self.extract_concepts(text),
+            'keywords': keywords[:10],
+            'concepts': self._concepts(text, text_lower, keywords),
             'entities': self.extract_entities(text),
-            'relationships': self.extract_relationships(text)
+            'relationships': self._relationships(text_lower)
         }
+    
+    def process_entries(self, texts: List[str]) -> List[Dict]:
+        """process_entry for a batch of texts"""
+        return [self.process_entry(text) for text in texts]
+
+
+_process_pool_processor = None
+
+
+def process_entry_text(text: str) -> Dict:
+    """
+    Module-level entry point for GraphProcessor.process_entry
+    
+    Picklable, so it can be submitted to a ProcessPoolExecutor for bulk jobs.
+    """
+    global _process_pool_processor
+    if _process_pool_processor is None:
+        _process_pool_processor = GraphProcessor()
+    return _process_pool_processor.process_entry(text)
+
+
+def process_entry_texts(texts: List[str]) -> List[Dict]:
+    """Batch form of process_entry_text: one pool task (and pickle round trip) per chunk"""
+    global _process_pool_processor
+    if _process_pool_processor is None:
+        _process_pool_processor = GraphProcessor()
+    return _process_pool_processor.process_entries(texts)
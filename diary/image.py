@@ -2,9 +2,12 @@
 Image processing and OCR capabilities
 """
 
-from PIL import Image
+from PIL import Image, ImageOps
 import os
-from typing import Optional
+import sqlite3
+import numpy as np
+from typing import Dict, List, Optional, Tuple
+from diary.executors import Overloaded, ocr_stage
 
 # Try to import pytesseract, but handle gracefully if not available
 try:
@@ -14,66 +17,299 @@ except ImportError:
     OCR_AVAILABLE = False
 
 
+# Long side of the image handed to Tesseract; phone photos are decoded straight
+# to this size (JPEG draft mode) instead of at full resolution
+OCR_MAX_SIDE = int(os.getenv("OCR_MAX_SIDE", 2400))
+# Long side of the grayscale preview used for hashing and text detection
+PREVIEW_SIDE = 640
+BLOCK = 16  # text detection cell size, in preview pixels
+EDGE_THRESHOLD = 40  # grey-level step that counts as an edge
+HASH_BANDS = 8  # 256-bit hash split into 8 bands of 32 bits (exact lookup up to 7 bits apart)
+
+OCR_CACHE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS ocr_cache (
+    hash BLOB NOT NULL,
+    mask BLOB NOT NULL,
+    b0 INTEGER, b1 INTEGER, b2 INTEGER, b3 INTEGER,
+    b4 INTEGER, b5 INTEGER, b6 INTEGER, b7 INTEGER,
+    width INTEGER,
+    height INTEGER,
+    text TEXT NOT NULL
+);
+""" + "".join(
+    f"CREATE INDEX IF NOT EXISTS ocr_cache_b{band} ON ocr_cache (b{band});\n"
+    for band in range(HASH_BANDS)
+)
+
+
+def _block_mean(gray: np.ndarray, rows: int, cols: int) -> np.ndarray:
+    """Area-average a 2-D array down to rows x cols"""
+    row_edges = np.linspace(0, gray.shape[0], rows + 1).astype(int)
+    col_edges = np.linspace(0, gray.shape[1], cols + 1).astype(int)
+    sums = np.add.reduceat(np.add.reduceat(gray, row_edges[:-1], axis=0), col_edges[:-1], axis=1)
+    counts = np.outer(np.diff(row_edges), np.diff(col_edges))
+    return sums / np.maximum(counts, 1)
+
+
+def dhash(gray: np.ndarray, size: int = 16) -> bytes:
+    """
+    256-bit difference hash of a grayscale image
+
+    Near-duplicate photos (recompressed, resized, slightly re-exposed) differ
+    in only a few bits, so the Hamming distance measures visual similarity.
+    """
+    small = _block_mean(gray.astype(np.float32), size, size + 1)
+    return np.packbits(small[:, 1:] > small[:, :-1]).tobytes()
+
+
+def hash_bands(digest: bytes) -> List[int]:
+    """The hash as HASH_BANDS 32-bit integers, for indexed near-duplicate lookup"""
+    return [int.from_bytes(digest[i:i + 4], "big") for i in range(0, len(digest), 4)]
+
+
+def hamming(a: bytes, b: bytes) -> int:
+    return int(np.unpackbits(np.frombuffer(a, dtype=np.uint8) ^ np.frombuffer(b, dtype=np.uint8)).sum())
+
+
+def text_cells(gray: np.ndarray, min_density: float = 0.12) -> np.ndarray:
+    """
+    Grid of BLOCK x BLOCK preview cells that probably contain text
+
+    Text is a dense mesh of sharp grey-level steps, so a cell is a candidate
+    when its share of edge pixels reaches min_density.
+    """
+    gray = gray.astype(np.int16)
+    edges = np.zeros(gray.shape, dtype=bool)
+    edges[:, 1:] |= np.abs(np.diff(gray, axis=1)) > EDGE_THRESHOLD
+    edges[1:, :] |= np.abs(np.diff(gray, axis=0)) > EDGE_THRESHOLD
+
+    rows, cols = gray.shape[0] // BLOCK, gray.shape[1] // BLOCK
+    density = edges[:rows * BLOCK, :cols * BLOCK].reshape(rows, BLOCK, cols, BLOCK).mean(axis=(1, 3))
+    return density >= min_density
+
+
+def mask_hash(cells: np.ndarray, size: int = 16) -> bytes:
+    """Coarse 256-bit map of where text was detected"""
+    if cells.size == 0:
+        return bytes(size * size // 8)
+    return np.packbits(_block_mean(cells.astype(np.float32), size, size) > 0.25).tobytes()
+
+
+def text_regions(candidate: np.ndarray, min_blocks: int = 3) -> List[Tuple[int, int, int, int]]:
+    """
+    Non-overlapping boxes (left, top, right, bottom), in preview pixels, around text cells
+
+    Horizontally adjacent candidate cells are merged into line regions and
+    small isolated blobs are dropped. An empty list means OCR can be skipped.
+    """
+    rows, cols = candidate.shape
+    if rows == 0 or cols == 0:
+        return []
+
+    # Bridge one-cell gaps between words on a line
+    bridged = candidate.copy()
+    bridged[:, 1:-1] |= candidate[:, :-2] & candidate[:, 2:]
+
+    # Connected components over the cell grid (at most ~40x40 cells)
+    seen = np.zeros_like(bridged)
+    regions = []
+    for row, col in zip(*np.nonzero(bridged)):
+        if seen[row, col]:
+            continue
+        stack = [(row, col)]
+        seen[row, col] = True
+        cells = []
+        while stack:
+            r, c = stack.pop()
+            cells.append((r, c))
+            for nr, nc in ((r - 1, c), (r + 1, c), (r, c - 1), (r, c + 1)):
+                if 0 <= nr < rows and 0 <= nc < cols and bridged[nr, nc] and not seen[nr, nc]:
+                    seen[nr, nc] = True
+                    stack.append((nr, nc))
+        if len(cells) < min_blocks:
+            continue
+        cell_rows = [r for r, _ in cells]
+        cell_cols = [c for _, c in cells]
+        # Text lines are wider than they are tall; reject isolated texture blobs
+        if max(cell_cols) - min(cell_cols) + 1 < 2:
+            continue
+        regions.append((
+            max(min(cell_cols) - 1, 0) * BLOCK,
+            max(min(cell_rows) - 1, 0) * BLOCK,
+            min(max(cell_cols) + 2, cols) * BLOCK,
+            min(max(cell_rows) + 2, rows) * BLOCK
+        ))
+
+    # The padding makes neighbouring lines overlap; OCR each area only once
+    merged = True
+    while merged:
+        merged = False
+        for i in range(len(regions)):
+            for j in range(i + 1, len(regions)):
+                a, b = regions[i], regions[j]
+                if a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]:
+                    regions[i] = (min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3]))
+                    del regions[j]
+                    merged = True
+                    break
+            if merged:
+                break
+    return regions
+
+
+_cache_conn: Optional[sqlite3.Connection] = None
+
+
+def _cache(path: str) -> sqlite3.Connection:
+    """The OCR cache connection of this worker process"""
+    global _cache_conn
+    if _cache_conn is None:
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        _cache_conn = sqlite3.connect(path, timeout=30)
+        _cache_conn.execute("PRAGMA journal_mode=WAL")
+        _cache_conn.executescript(OCR_CACHE_SCHEMA)
+    return _cache_conn
+
+
+def _cached_ocr(conn: sqlite3.Connection, digest: bytes, mask: bytes, max_distance: int) -> Optional[Dict]:
+    """
+    A cached result for this image or a near-duplicate
+
+    Both the picture hash and the text layout hash must be within
+    max_distance bits: a photo that gained a caption looks almost the same
+    but must not reuse the caption-less result.
+    """
+    # Two hashes within fewer than HASH_BANDS differing bits share at least one band
+    bands = hash_bands(digest)
+    where = " OR ".join(f"b{band} = ?" for band in range(HASH_BANDS))
+    best = None
+    for stored, stored_mask, width, height, text in conn.execute(
+        f"SELECT hash, mask, width, height, text FROM ocr_cache WHERE {where}", bands
+    ):
+        distance = hamming(digest, stored)
+        if hamming(mask, stored_mask) > max_distance:
+            continue
+        if distance <= max_distance and (best is None or distance < best[0]):
+            best = (distance, {"text": text, "width": width, "height": height})
+    return best[1] if best else None
+
+
+def _ocr_image(image_path: str, cache_path: Optional[str] = None, max_distance: int = 6) -> Dict:
+    """
+    OCR an image file (executed in the OCR process pool)
+
+    The image is decoded once, straight at OCR resolution, and a small
+    grayscale preview derived from it drives the perceptual-hash cache and the
+    text detection pre-pass. Tesseract then only sees the candidate regions.
+    Returns {"text", "width", "height"} with the original dimensions.
+    """
+    image = Image.open(image_path)
+    width, height = image.size
+
+    # JPEG draft mode decodes at 1/2, 1/4 or 1/8 scale for almost free
+    scale = OCR_MAX_SIDE / max(width, height)
+    if scale < 1:
+        image.draft("L", (int(width * scale), int(height * scale)))
+    image = ImageOps.exif_transpose(image).convert("L")
+    factor = max(image.size) // OCR_MAX_SIDE
+    if factor > 1:
+        image = image.reduce(factor)
+
+    preview = image.reduce(max(1, max(image.size) // PREVIEW_SIDE))
+    gray = np.asarray(preview)
+
+    cells = text_cells(gray)
+    digest, mask = dhash(gray), mask_hash(cells)
+    conn = _cache(cache_path) if cache_path else None
+    if conn is not None:
+        cached = _cached_ocr(conn, digest, mask, max_distance)
+        if cached is not None:
+            return cached
+
+    regions = text_regions(cells)
+    texts = []
+    if regions:
+        ratio_x = image.size[0] / preview.size[0]
+        ratio_y = image.size[1] / preview.size[1]
+        region_area = sum((right - left) * (bottom - top) for left, top, right, bottom in regions)
+        if region_area > 0.5 * preview.size[0] * preview.size[1]:
+            # Mostly text (a document or screenshot): one pass keeps the layout
+            texts.append(pytesseract.image_to_string(image))
+        else:
+            for left, top, right, bottom in sorted(regions, key=lambda box: (box[1], box[0])):
+                crop = image.crop((
+                    int(left * ratio_x), int(top * ratio_y),
+                    int(right * ratio_x), int(bottom * ratio_y)
+                ))
+                texts.append(pytesseract.image_to_string(crop))
+
+    result = {
+        "text": "\n".join(text.strip() for text in texts if text.strip()),
+        "width": width,
+        "height": height
+    }
+    if conn is not None:
+        with conn:
+            conn.execute(
+                "INSERT INTO ocr_cache (hash, mask, b0, b1, b2, b3, b4, b5, b6, b7, width, height, text) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (digest, mask, *hash_bands(digest), width, height, result["text"])
+            )
+    return result
+
+
 class ImageProcessor:
-    """Service for processing images"""
+    """
+    Service for processing images
+    
+    OCR results are cached by perceptual hash (OCR_CACHE_PATH), so re-uploads
+    and near-duplicate photos within OCR_HASH_DISTANCE bits skip Tesseract.
+    """
     
     def __init__(self):
         self.use_ocr = OCR_AVAILABLE
+        self.cache_path = os.getenv("OCR_CACHE_PATH", "./data/ocr_cache.db") or None
+        self.max_distance = int(os.getenv("OCR_HASH_DISTANCE", 6))
     
     async def process_image(self, image_path: str) -> str:
         """
         Process image and extract text if applicable
-        
+    
         Args:
             image_path: Path to image file
-            
+    
         Returns:
             Extracted text or metadata
         """
         if not os.path.exists(image_path):
             raise FileNotFoundError(f"Image file not found: {image_path}")
-        
-        text = ""
-        
+    
+        if not self.use_ocr:
+            return "[Image content]"
+    
         # Try OCR to extract text from image
-        if self.use_ocr:
-            try:
-                image = Image.open(image_path)
-                # Convert to RGB if necessary
-                if image.mode != 'RGB':
-                    image = image.convert('RGB')
-                
-                # Extract text using OCR
-                text = pytesseract.image_to_string(image)
-                text = text.strip()
-                
-            except Exception as e:
-                print(f"OCR not available or failed: {e}")
-                text = "[Image content]"
-        else:
-            text = "[Image content]"
-        
+        try:
+            result = await ocr_stage.run(_ocr_image, image_path, self.cache_path, self.max_distance)
+        except Overloaded:
+            # Turned away, not failed: the caller retries later
+            raise
+        except Exception as e:
+            print(f"OCR not available or failed: {e}")
+            return "[Image content]"
+    
         # Generate basic description if no text found
-        if not text:
-            try:
-                image = Image.open(image_path)
-                width, height = image.size
-                text = f"[Image: {width}x{height} pixels]"
-            except:
-                text = "[Image]"
-        
-        return text
+        return result["text"] or f"[Image: {result['width']}x{result['height']} pixels]"
     
     async def extract_metadata(self, image_path: str) -> dict:
         """
         Extract metadata from image
-        
+    
         Returns:
             Dictionary with image metadata
         """
         if not os.path.exists(image_path):
             raise FileNotFoundError(f"Image file not found: {image_path}")
-        
+    
         try:
             image = Image.open(image_path)
             metadata = {
@@ -82,14 +318,14 @@ class ImageProcessor:
                 "format": image.format,
                 "mode": image.mode
             }
-            
+    
             # Extract EXIF data if available
             if hasattr(image, '_getexif') and image._getexif():
                 exif = image._getexif()
                 metadata["exif"] = str(exif)
-            
+    
             return metadata
-        
+    
         except Exception as e:
             print(f"Error extracting metadata: {e}")
             return {}
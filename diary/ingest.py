@@ -0,0 +1,231 @@
+"""
+Bulk ingestion of diary entries with micro-batched embedding and graph writes
+"""
+
+import asyncio
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import AsyncIterable, Callable, Dict, Iterable, List, Optional, Tuple, Union
+
+from diary import metrics
+from diary.executors import Overloaded
+from diary.graph_processor import process_entry_texts
+from diary.segments import build_segments
+
+
+class BulkIngestor:
+    """
+    Imports many entries at once
+
+    Entries are collected into batches of `batch_size`. Each batch is embedded
+    with a single EmbeddingService.embed_batch call, graph extraction runs in a
+    process pool, and the batch is written to the database as one UNWIND
+    transaction.
+    """
+
+    def __init__(
+        self,
+        db,
+        embeddings,
+        speech_processor=None,
+        image_processor=None,
+        batch_size: Optional[int] = None,
+        workers: Optional[int] = None
+    ):
+        self.db = db
+        self.embeddings = embeddings
+        self.speech_processor = speech_processor
+        self.image_processor = image_processor
+        self.batch_size = batch_size or int(os.getenv("INGEST_BATCH_SIZE", 100))
+        self.workers = workers or int(os.getenv("INGEST_WORKERS", os.cpu_count() or 1))
+        self._pool = None
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        """Create the graph extraction process pool on first use"""
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.workers)
+        return self._pool
+
+    def close(self):
+        """Shut down the process pool"""
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+    async def prepare(self, item: Dict) -> Dict:
+        """
+        Turn an import item into entry data, transcribing or OCR-ing media
+
+        Items use the EntryCreate fields (title, text, audio_path, image_path,
+        tags, timestamp, transcription_model). Transcripts and OCR text are
+        cached by SpeechProcessor and ImageProcessor.
+        Long content is also split into "segments" (see diary.segments).
+        """
+        entry_data = {
+            "title": item.get("title") or "Untitled",
+            "text": item.get("text") or "",
+            "timestamp": item.get("timestamp") or datetime.utcnow().isoformat(),
+            "tags": [tag.strip() for tag in item.get("tags") or [] if tag.strip()]
+        }
+
+        transcript = None
+        transcription = image_text = ""
+        if item.get("audio_path") and self.speech_processor is not None:
+            result = await self.speech_processor.transcribe_with_timestamps(
+                item["audio_path"], item.get("transcription_model")
+            )
+            transcription = result.get("error") or result["text"]
+            transcript = result["segments"]
+            entry_data["audio_path"] = item["audio_path"]
+
+        if item.get("image_path") and self.image_processor is not None:
+            image_text = await self.image_processor.process_image(item["image_path"])
+            entry_data["image_path"] = item["image_path"]
+
+        # Transcripts are segmented by time, typed and OCR text by word windows
+        entry_data["segments"] = build_segments(
+            " ".join(part for part in (entry_data["text"], image_text) if part), transcript
+        )
+        entry_data["text"] = " ".join(
+            part for part in (entry_data["text"], transcription, image_text) if part
+        ) or None
+        return entry_data
+
+    async def ingest(
+        self,
+        items: Union[AsyncIterable[Dict], Iterable[Dict]],
+        on_batch: Optional[Callable[[List[Dict], List[Dict]], None]] = None
+    ) -> Dict:
+        """
+        Ingest a stream of items in micro-batches
+
+        `on_batch(items, created)` is called after every committed batch with
+        the items that were written, which lets callers report progress or
+        checkpoint. An item that cannot be prepared (e.g. its media file is
+        missing) fails on its own, named by its "source" or its position in
+        the stream. Returns a summary dict.
+        """
+        stats = {"created": 0, "failed": 0, "ids": [], "errors": []}
+        batch = []
+        position = 0
+
+        async def flush():
+            try:
+                written, created, failures = await self.write_batch(batch)
+            except Exception as e:
+                print(f"[ERROR] Failed to import batch of {len(batch)} entries: {e}")
+                stats["failed"] += len(batch)
+                stats["errors"].append(str(e))
+                return
+            for item, error in failures:
+                print(f"[WARN] Skipping {item['source']}: {error}")
+                stats["errors"].append(f"{item['source']}: {error}")
+            stats["failed"] += len(failures)
+            stats["created"] += len(created)
+            stats["ids"].extend(entry["id"] for entry in created)
+            if on_batch and written:
+                on_batch(written, created)
+
+        async for item in _iterate(items):
+            position += 1
+            item.setdefault("source", f"item {position}")
+            batch.append(item)
+            if len(batch) >= self.batch_size:
+                await flush()
+                batch = []
+
+        if batch:
+            await flush()
+
+        return stats
+
+    async def write_batch(
+        self, items: List[Dict]
+    ) -> Tuple[List[Dict], List[Dict], List[Tuple[Dict, Exception]]]:
+        """
+        Prepare, embed, extract and write one batch of items
+
+        The batch's media is transcribed and OCR'd concurrently; the stage
+        executors bound how much of it runs at once. Each step waits out
+        stage rejections on its own, so a rejected embed does not redo the
+        batch's transcription and OCR. Items that fail to prepare are left
+        out of the write. Returns (written items, created entries,
+        [(item, error)] for the items left out).
+        """
+        results = await asyncio.gather(
+            *[_until_admitted(self.prepare, item) for item in items], return_exceptions=True
+        )
+        written, prepared, failures = [], [], []
+        for item, result in zip(items, results):
+            if isinstance(result, Exception):
+                failures.append((item, result))
+            elif isinstance(result, BaseException):
+                raise result
+            else:
+                written.append(item)
+                prepared.append(result)
+        created = await _until_admitted(self.write_prepared, prepared) if prepared else []
+        return written, created, failures
+
+    async def write_prepared(self, entries: List[Dict]) -> List[Dict]:
+        """Embed, extract and write a batch of prepared entries"""
+        # One forward pass for the whole batch, entries and their segments alike
+        texts = [entry["text"] for entry in entries if entry["text"]]
+        texts += [segment["text"] for entry in entries for segment in entry["segments"]]
+        if texts:
+            # Fail (and retry) rather than store entries without embeddings
+            await self.embeddings.require_model()
+            vectors = iter(await self.embeddings.embed_batch(texts))
+            for entry in entries:
+                if entry["text"]:
+                    vector = next(vectors)
+                    entry["embedding"] = vector if vector.any() else None
+            for entry in entries:
+                for segment in entry["segments"]:
+                    vector = next(vectors)
+                    segment["embedding"] = vector if vector.any() else None
+
+        # Graph extraction is CPU-bound pure Python, so spread it over processes,
+        # one chunk of texts per worker
+        loop = asyncio.get_running_loop()
+        pool = self._get_pool()
+        texts = [entry["text"] or entry["title"] for entry in entries]
+        chunk_size = max(1, -(-len(texts) // self.workers))
+        with metrics.span("graph_extract"):
+            chunks = await asyncio.gather(*[
+                loop.run_in_executor(pool, process_entry_texts, texts[start:start + chunk_size])
+                for start in range(0, len(texts), chunk_size)
+            ])
+        graphs = [graph_data for chunk in chunks for graph_data in chunk]
+        for entry, graph_data in zip(entries, graphs):
+            entry["graph_data"] = graph_data
+
+        return await self.db.create_entries(entries)
+
+
+async def _until_admitted(fn, *args, attempts: int = 10):
+    """
+    Await fn(*args), waiting out stage rejections
+
+    A bulk import is turned away when a stage's bulk lane is full; waiting
+    here stops reading the request body, which slows the sender down
+    instead of failing its entries.
+    """
+    for attempt in range(1, attempts + 1):
+        try:
+            return await fn(*args)
+        except Overloaded as e:
+            if attempt == attempts:
+                raise
+            await asyncio.sleep(e.retry_after)
+
+
+async def _iterate(items: Union[AsyncIterable[Dict], Iterable[Dict]]):
+    """Iterate sync and async iterables alike"""
+    if hasattr(items, "__aiter__"):
+        async for item in items:
+            yield item
+    else:
+        for item in items:
+            yield item
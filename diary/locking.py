@@ -0,0 +1,71 @@
+"""
+Owner locks for on-disk state that only one process may write
+
+The ANN index, the SQLite backend's embedding matrices and the disk
+embedding cache keep row counters in memory, so two processes appending to
+the same files would overwrite each other's rows. Each takes an exclusive
+advisory lock on a file next to its data; the operating system drops it
+when the process exits, so a crash never leaves a stale lock behind.
+"""
+
+import os
+from typing import Optional, TextIO
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+class LockHeld(RuntimeError):
+    """Another process owns the locked state"""
+
+
+class OwnerLock:
+    """Exclusive, non-blocking lock on `path`; the owner's pid is written into the file"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file: Optional[TextIO] = None
+
+    def acquire(self):
+        """Take the lock, or raise LockHeld naming the process that has it"""
+        if self._file is not None:
+            return
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        f = open(self.path, "a+", encoding="utf-8")
+        try:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+        except OSError:
+            try:
+                f.seek(0)
+                owner = f.read().strip() or "unknown"
+            except OSError:
+                owner = "unknown"
+            f.close()
+            raise LockHeld(f"{self.path} is held by another process (pid {owner})")
+        f.seek(0)
+        f.truncate()
+        f.write(str(os.getpid()))
+        f.flush()
+        self._file = f
+
+    def release(self):
+        if self._file is None:
+            return
+        if fcntl is not None:
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+        else:
+            self._file.seek(0)
+            msvcrt.locking(self._file.fileno(), msvcrt.LK_UNLCK, 1)
+        self._file.close()
+        self._file = None
+
+    @property
+    def held(self) -> bool:
+        return self._file is not None
@@ -0,0 +1,184 @@
+"""
+Content-addressed storage for uploaded media
+"""
+
+import hashlib
+import os
+import re
+import uuid
+from collections import OrderedDict
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Dict, Optional, Tuple
+
+import aiofiles
+
+AUDIO_EXTENSIONS = [".mp3", ".wav", ".m4a", ".ogg"]
+IMAGE_EXTENSIONS = [".jpg", ".jpeg", ".png", ".gif", ".webp"]
+
+CONTENT_ADDRESSED_NAME = re.compile(r"^[0-9a-f]{64}\.[a-z0-9]+$")
+
+
+class UploadTooLarge(Exception):
+    """Raised while streaming an upload that exceeds its type's size limit"""
+
+    def __init__(self, file_type: str, limit: int):
+        super().__init__(f"{file_type} uploads are limited to {limit // (1024 * 1024)} MB")
+        self.limit = limit
+
+
+class MediaStore:
+    """
+    Saves uploads under uploads/<type>/<sha256[:2]>/<sha256><ext>
+
+    Uploads are streamed to a temporary file in fixed-size chunks while their
+    SHA-256 is computed, so memory use does not depend on the file size, and
+    the size limit for the file type is enforced as the bytes arrive. A file
+    that is already stored is not written twice.
+    """
+
+    def __init__(self, root: str = "uploads"):
+        self.root = root
+        self.chunk_size = int(os.getenv("UPLOAD_CHUNK_KB", 1024)) * 1024
+        default_mb = int(os.getenv("MAX_FILE_SIZE_MB", 50))
+        self.limits = {
+            "audio": int(os.getenv("MAX_AUDIO_SIZE_MB", default_mb)) * 1024 * 1024,
+            "image": int(os.getenv("MAX_IMAGE_SIZE_MB", default_mb)) * 1024 * 1024,
+        }
+        self.incoming = os.path.join(root, ".incoming")
+        os.makedirs(self.incoming, exist_ok=True)
+
+    async def save_upload(self, file, file_type: str) -> str:
+        """Stream an UploadFile to its content-addressed path and return that path"""
+        ext = os.path.splitext(file.filename)[1].lower() if file.filename else ""
+        if file_type == "audio":
+            ext = ext if ext in AUDIO_EXTENSIONS else ".mp3"
+        else:
+            ext = ext if ext in IMAGE_EXTENSIONS else ".png"
+
+        limit = self.limits[file_type]
+        digest = hashlib.sha256()
+        size = 0
+        tmp_path = os.path.join(self.incoming, uuid.uuid4().hex)
+        try:
+            async with aiofiles.open(tmp_path, "wb") as f:
+                while True:
+                    chunk = await file.read(self.chunk_size)
+                    if not chunk:
+                        break
+                    size += len(chunk)
+                    if size > limit:
+                        raise UploadTooLarge(file_type, limit)
+                    digest.update(chunk)
+                    await f.write(chunk)
+
+            sha = digest.hexdigest()
+            directory = os.path.join(self.root, file_type, sha[:2])
+            path = os.path.join(directory, sha + ext)
+            if os.path.exists(path):
+                os.remove(tmp_path)
+            else:
+                os.makedirs(directory, exist_ok=True)
+                os.replace(tmp_path, path)
+            return path
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+
+def is_content_addressed(path: str) -> bool:
+    """Whether a media path was named by MediaStore after its contents"""
+    return bool(CONTENT_ADDRESSED_NAME.match(os.path.basename(path)))
+
+
+
+def validators(path: str, stat: os.stat_result) -> Dict[str, str]:
+    """ETag and Last-Modified headers for a media file"""
+    if is_content_addressed(path):
+        # The name is the hash of the contents, so it is a strong validator
+        etag = '"' + os.path.splitext(os.path.basename(path))[0] + '"'
+    else:
+        etag = f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+    return {
+        "ETag": etag,
+        "Last-Modified": formatdate(stat.st_mtime, usegmt=True)
+    }
+
+
+def not_modified(headers, etag: str, mtime: float) -> bool:
+    """Whether a conditional GET can be answered with 304"""
+    if_none_match = headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+        return "*" in tags or etag in tags
+    if_modified_since = headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            return int(mtime) <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+def parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """
+    Inclusive (start, end) byte range of a single-range Range header
+
+    Returns None when the whole file should be sent (no header, a malformed
+    one such as `bytes=5-3`, or a form this server does not handle, such as
+    multiple ranges) and raises ValueError when the range cannot be satisfied.
+    """
+    if not header or not header.startswith("bytes=") or "," in header:
+        return None
+    first, _, last = header[len("bytes="):].strip().partition("-")
+    try:
+        if first:
+            start = int(first)
+            if last and int(last) < start:
+                return None  # invalid range-spec: ignored (RFC 7233 2.1)
+            end = min(int(last), size - 1) if last else size - 1
+        else:
+            # Suffix range: the last N bytes
+            length = int(last)
+            start, end = max(0, size - length), size - 1
+            if length <= 0:
+                raise ValueError
+    except ValueError:
+        if first or not last.isdigit():
+            return None
+        start, end = size, size - 1  # "bytes=-0" can never be satisfied
+    if start >= size or start > end:
+        raise ValueError(f"range not satisfiable: {header}")
+    return start, end
+
+
+class MediaPathCache:
+    """
+    Small LRU map of entry id to its (image_path, audio_path)
+
+    Media paths never change once an entry exists, so serving an entry's
+    media does not need a database round trip after the first request.
+    Deletes only reach the cache of the process that handled them, so the
+    server runs with capacity 0 (caching disabled) when it has several workers.
+    """
+
+    def __init__(self, capacity: int = 1024):
+        self.capacity = capacity
+        self.paths: "OrderedDict[str, Tuple[Optional[str], Optional[str]]]" = OrderedDict()
+
+    def get(self, entry_id: str) -> Optional[Tuple[Optional[str], Optional[str]]]:
+        paths = self.paths.get(entry_id)
+        if paths is not None:
+            self.paths.move_to_end(entry_id)
+        return paths
+
+    def put(self, entry_id: str, image_path: Optional[str], audio_path: Optional[str]):
+        if self.capacity <= 0:
+            return
+        self.paths[entry_id] = (image_path, audio_path)
+        self.paths.move_to_end(entry_id)
+        while len(self.paths) > self.capacity:
+            self.paths.popitem(last=False)
+
+    def discard(self, entry_id: str):
+        self.paths.pop(entry_id, None)
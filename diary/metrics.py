@@ -0,0 +1,268 @@
+"""
+Lightweight in-process metrics: timed spans, counters, gauges and histograms
+
+A span times one block of work (a pipeline stage, a Cypher statement) into a
+latency histogram, with an error counter and an in-flight gauge per span
+name. Inside an HTTP request the span times are also collected for the
+Server-Timing response header. Recording a sample is a few dictionary
+updates; the Prometheus text for /metrics is only built when it is scraped.
+With METRICS_ENABLED=0, span() returns a shared no-op and timed() leaves
+functions undecorated, so instrumented code costs next to nothing.
+"""
+
+import bisect
+import functools
+import math
+import os
+import threading
+import time
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+ENABLED = os.getenv("METRICS_ENABLED", "1") == "1"
+
+# Seconds: from sub-millisecond Cypher reads to minute-long transcriptions
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+
+# (sample name, labels, value)
+Sample = Tuple[str, Dict[str, str], float]
+# (name, type, help, samples) - plain tuples, so snapshots can cross processes
+Family = Tuple[str, str, str, List[Sample]]
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, label_names: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(label_names)
+        self._series: Dict[Tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+
+    def _labels(self, values: Tuple[str, ...]) -> Dict[str, str]:
+        return dict(zip(self.label_names, values))
+
+    def samples(self) -> List[Sample]:
+        with self._lock:
+            return [(self.name, self._labels(labels), value) for labels, value in self._series.items()]
+
+    def family(self) -> Family:
+        return self.name, self.kind, self.help, self.samples()
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, labels: Tuple[str, ...] = (), amount: float = 1.0):
+        with self._lock:
+            self._series[labels] = self._series.get(labels, 0.0) + amount
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def inc(self, labels: Tuple[str, ...] = (), amount: float = 1.0):
+        with self._lock:
+            self._series[labels] = self._series.get(labels, 0.0) + amount
+
+    def dec(self, labels: Tuple[str, ...] = (), amount: float = 1.0):
+        self.inc(labels, -amount)
+
+    def set(self, labels: Tuple[str, ...], value: float):
+        with self._lock:
+            self._series[labels] = value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, label_names: Tuple[str, ...] = (), buckets: Tuple[float, ...] = BUCKETS):
+        super().__init__(name, help, label_names)
+        self.buckets = tuple(buckets)
+
+    def observe(self, labels: Tuple[str, ...], value: float):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                # Per-bucket counts (the last is +Inf), sum
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def samples(self) -> List[Sample]:
+        with self._lock:
+            series = [(labels, list(counts), total) for labels, (counts, total) in self._series.items()]
+        samples = []
+        for labels, counts, total in series:
+            base = self._labels(labels)
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                samples.append((f"{self.name}_bucket", {**base, "le": _format_value(bound)}, cumulative))
+            samples.append((f"{self.name}_sum", base, total))
+            samples.append((f"{self.name}_count", base, cumulative))
+        return samples
+
+
+class Registry:
+    """The metrics of one process, plus collectors that report existing state on scrape"""
+
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+        self._collectors: List[Callable[[], Iterable[Family]]] = []
+
+    def counter(self, name: str, help: str, label_names: Tuple[str, ...] = ()) -> Counter:
+        return self._add(Counter(name, help, label_names))
+
+    def gauge(self, name: str, help: str, label_names: Tuple[str, ...] = ()) -> Gauge:
+        return self._add(Gauge(name, help, label_names))
+
+    def histogram(self, name: str, help: str, label_names: Tuple[str, ...] = ()) -> Histogram:
+        return self._add(Histogram(name, help, label_names))
+
+    def _add(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def collector(self, fn: Callable[[], Iterable[Family]]):
+        """Register fn (usable as a decorator); it is called on every scrape"""
+        self._collectors.append(fn)
+        return fn
+
+    def snapshot(self) -> List[Family]:
+        families = [metric.family() for metric in self._metrics]
+        for fn in self._collectors:
+            families.extend(fn())
+        return families
+
+
+REGISTRY = Registry()
+
+SPAN_SECONDS = REGISTRY.histogram("diary_span_seconds", "Duration of timed spans", ("span",))
+SPAN_ERRORS = REGISTRY.counter("diary_span_errors_total", "Spans that ended with an exception", ("span",))
+SPANS_IN_FLIGHT = REGISTRY.gauge("diary_spans_in_flight", "Spans currently running", ("span",))
+
+# Set by main.py for each HTTP request: span name -> [milliseconds, count]
+request_timings: ContextVar[Optional[Dict[str, List[float]]]] = ContextVar("request_timings", default=None)
+
+
+class Span:
+    """Context manager timing a block of work under `name`"""
+
+    __slots__ = ("name", "labels", "started")
+
+    def __init__(self, name: str):
+        self.name = name
+        self.labels = (name,)
+
+    def __enter__(self):
+        SPANS_IN_FLIGHT.inc(self.labels)
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        elapsed = time.perf_counter() - self.started
+        SPANS_IN_FLIGHT.dec(self.labels)
+        SPAN_SECONDS.observe(self.labels, elapsed)
+        # Cancellation is not an error of the work being timed
+        if exc_type is not None and issubclass(exc_type, Exception):
+            SPAN_ERRORS.inc(self.labels)
+        timings = request_timings.get()
+        if timings is not None:
+            entry = timings.get(self.name)
+            if entry is None:
+                timings[self.name] = [elapsed * 1000, 1]
+            else:
+                entry[0] += elapsed * 1000
+                entry[1] += 1
+        return False
+
+
+class _NoSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+NO_SPAN = _NoSpan()
+
+
+def span(name: str):
+    """Time a `with` block as span `name` (a no-op when metrics are disabled)"""
+    return Span(name) if ENABLED else NO_SPAN
+
+
+def timed(name: str):
+    """Decorator timing every call of an async function as span `name`"""
+    def decorate(fn):
+        if not ENABLED:
+            return fn
+
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            with Span(name):
+                return await fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def family(name: str, kind: str, help: str, values: Iterable[Tuple[Dict[str, str], float]]) -> Family:
+    """A metric family built from existing state at scrape time"""
+    return name, kind, help, [(name, labels, value) for labels, value in values]
+
+
+def server_timing(timings: Dict[str, List[float]], total_ms: Optional[float] = None) -> str:
+    """Server-Timing header value; repeated spans are summed and counted in desc"""
+    parts = [
+        f"{name};dur={ms:.1f}" + (f';desc="x{int(count)}"' if count > 1 else "")
+        for name, (ms, count) in timings.items()
+    ]
+    if total_ms is not None:
+        parts.append(f"total;dur={total_ms:.1f}")
+    return ", ".join(parts)
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer() and abs(value) < 1e15:
+        return str(int(value))
+    return repr(value)
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    escaped = (
+        f'{key}="' + str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") + '"'
+        for key, value in labels.items()
+    )
+    return "{" + ",".join(escaped) + "}"
+
+
+def render(snapshots: Dict[str, List[Family]]) -> str:
+    """
+    Prometheus text exposition of several processes' snapshots
+
+    `snapshots` maps a process name (e.g. "api", "model_server") to
+    Registry.snapshot(); each sample is labelled with its process, and
+    families reported by several processes are merged.
+    """
+    merged: Dict[str, Tuple[str, str, List[Sample]]] = {}
+    for process, families in snapshots.items():
+        for name, kind, help, samples in families:
+            entry = merged.setdefault(name, (kind, help, []))
+            entry[2].extend((sample, {"process": process, **labels}, value) for sample, labels, value in samples)
+
+    lines = []
+    for name, (kind, help, samples) in merged.items():
+        lines.append(f"# HELP {name} {help}")
+        lines.append(f"# TYPE {name} {kind}")
+        lines.extend(f"{sample}{_format_labels(labels)} {_format_value(value)}" for sample, labels, value in samples)
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,64 @@
+"""
+Pinned local copies of the embedding model
+
+A bundle is a directory written by `python bundle_model.py`: the saved
+SentenceTransformer plus a bundle.json manifest naming the model and listing
+every file with its size and SHA-256. Loading from a bundle needs no network
+access and always yields the same weights.
+"""
+
+import hashlib
+import json
+import os
+from typing import Dict
+
+MANIFEST = "bundle.json"
+
+
+def _file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def write_manifest(directory: str, model_name: str) -> Dict:
+    """Record the model name and every file of a saved model in bundle.json"""
+    files = {}
+    for root, _, names in os.walk(directory):
+        for name in sorted(names):
+            path = os.path.join(root, name)
+            relative = os.path.relpath(path, directory).replace(os.sep, "/")
+            if relative == MANIFEST:
+                continue
+            files[relative] = {"size": os.path.getsize(path), "sha256": _file_sha256(path)}
+    manifest = {"model_name": model_name, "files": files}
+    with open(os.path.join(directory, MANIFEST), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    return manifest
+
+
+def read_manifest(directory: str) -> Dict:
+    """Load a bundle's manifest, raising FileNotFoundError when there is none"""
+    with open(os.path.join(directory, MANIFEST), encoding="utf-8") as f:
+        return json.load(f)
+
+
+def verify_bundle(directory: str, full: bool = False) -> Dict:
+    """
+    Check that a bundle is complete and return its manifest
+
+    File sizes are always compared, which catches interrupted copies at no
+    cost; full=True also re-hashes every file. Raises ValueError on mismatch.
+    """
+    manifest = read_manifest(directory)
+    for relative, expected in manifest["files"].items():
+        path = os.path.join(directory, relative)
+        if not os.path.isfile(path):
+            raise ValueError(f"Model bundle {directory} is missing {relative}")
+        if os.path.getsize(path) != expected["size"]:
+            raise ValueError(f"Model bundle file {relative} has the wrong size")
+        if full and _file_sha256(path) != expected["sha256"]:
+            raise ValueError(f"Model bundle file {relative} does not match its checksum")
+    return manifest
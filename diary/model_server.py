@@ -0,0 +1,401 @@
+"""
+Model server shared by several API workers
+
+With more than one API worker, each would load its own copy of the
+embedding and Whisper models. Instead serve.py starts one model-server
+process that owns EmbeddingService, SpeechProcessor and ImageProcessor, and
+the workers reach it over a Unix socket through the Remote* proxies below,
+which never import the ML libraries. Requests from every worker land in the
+same EmbeddingService, so its dynamic batching forms batches across workers.
+
+Messages are length-prefixed pickles. The socket lives in a private
+directory created by serve.py (mode 0700) and is itself mode 0600, so only
+the same user can connect.
+"""
+
+import asyncio
+import os
+import pickle
+import signal
+import struct
+import time
+from collections import Counter
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from diary import metrics
+from diary.embeddings import EmbeddingService
+from diary.executors import (
+    PRIORITIES, DeadlineExceeded, ModelNotReady, Overloaded, request_deadline, request_priority
+)
+
+HEADER = struct.Struct("!I")
+
+
+class ModelServerError(Exception):
+    """A model-server call failed on the server side"""
+
+
+class ModelServerUnavailable(ModelServerError):
+    """The model server cannot be reached"""
+
+
+async def _send(writer: asyncio.StreamWriter, message):
+    data = pickle.dumps(message, protocol=pickle.HIGHEST_PROTOCOL)
+    writer.write(HEADER.pack(len(data)) + data)
+    await writer.drain()
+
+
+async def _receive(reader: asyncio.StreamReader):
+    (length,) = HEADER.unpack(await reader.readexactly(HEADER.size))
+    return pickle.loads(await reader.readexactly(length))
+
+
+class ModelServer:
+    """
+    Serves model calls from API workers over a Unix socket
+
+    Each connection can have many requests in flight; at most `concurrency`
+    per priority lane run at once across all connections
+    (MODEL_SERVER_CONCURRENCY). Each request carries the worker's priority
+    and remaining deadline, so the stage executors here apply the same
+    admission control as in a single process; their rejections are sent back
+    as Overloaded/DeadlineExceeded/ModelNotReady.
+    """
+
+    def __init__(self, socket_path: str, concurrency: Optional[int] = None):
+        from diary.image import ImageProcessor
+        from diary.speech import SpeechProcessor
+
+        self.socket_path = socket_path
+        self.concurrency = concurrency or int(os.getenv("MODEL_SERVER_CONCURRENCY", 64))
+        self.grace_seconds = float(os.getenv("MODEL_SERVER_GRACE_SECONDS", 30))
+        self.embeddings = EmbeddingService()
+        self.speech = SpeechProcessor()
+        self.images = ImageProcessor()
+        self.methods = {
+            "embed_text": self.embeddings.embed_text,
+            "embed_batch": self.embeddings.embed_batch,
+            "load_model": self.embeddings.load_model,
+            "transcribe": self.speech.transcribe,
+            "transcribe_with_timestamps": self.speech.transcribe_with_timestamps,
+            "process_image": self.images.process_image,
+            "status": self._status,
+            "stats": self._stats,
+            "metrics": self._metrics,
+        }
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+        self._writers = set()
+
+        # Metrics
+        self.connections = 0
+        self.in_flight = 0
+        self.calls = Counter()
+        self.errors = Counter()
+
+    async def _status(self) -> Dict:
+        return self.embeddings.status()
+
+    async def _metrics(self) -> List:
+        """This process's metric families, rendered by the worker serving /metrics"""
+        return metrics.REGISTRY.snapshot()
+
+    async def _stats(self) -> Dict:
+        from diary.executors import stage_stats
+
+        cache = self.embeddings.cache
+        return {
+            "pid": os.getpid(),
+            "connections": self.connections,
+            "in_flight": self.in_flight,
+            "concurrency": self.concurrency,
+            "calls": dict(self.calls),
+            "errors": dict(self.errors),
+            "embedding": self.embeddings.batch_stats(),
+            "embedding_cache": cache.stats() if cache is not None else None,
+            "stages": stage_stats()
+        }
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """Read requests from one worker and answer each as soon as it is done"""
+        self.connections += 1
+        self._writers.add(writer)
+        write_lock = asyncio.Lock()
+        tasks = set()
+        try:
+            while True:
+                try:
+                    message = await _receive(reader)
+                except (asyncio.IncompleteReadError, ConnectionError, asyncio.CancelledError):
+                    break
+                task = asyncio.ensure_future(self._dispatch(message, writer, write_lock))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+        finally:
+            if tasks:
+                await asyncio.gather(*tasks, return_exceptions=True)
+            self.connections -= 1
+            self._writers.discard(writer)
+            writer.close()
+
+    async def _dispatch(self, message, writer: asyncio.StreamWriter, write_lock: asyncio.Lock):
+        request_id, method, args, kwargs, priority, timeout = message
+        # This runs in its own task, so the context is this request's alone
+        request_priority.set(priority)
+        request_deadline.set(None if timeout is None else time.monotonic() + timeout)
+        async with self._semaphores[priority]:
+            self.in_flight += 1
+            try:
+                response = (request_id, True, await self.methods[method](*args, **kwargs))
+            except Overloaded as e:
+                self.errors[method] += 1
+                response = (request_id, False, (type(e).__name__, e.stage, str(e), e.retry_after))
+            except Exception as e:
+                self.errors[method] += 1
+                response = (request_id, False, f"{type(e).__name__}: {e}")
+            finally:
+                self.in_flight -= 1
+                self.calls[method] += 1
+        try:
+            async with write_lock:
+                await _send(writer, response)
+        except ConnectionError:
+            pass  # The worker went away; nobody is waiting for the answer
+
+    async def serve(self):
+        """Serve until SIGTERM (or the launcher exits), then drain and shut down"""
+        from diary.executors import shutdown_stages
+
+        self._semaphores = {priority: asyncio.Semaphore(self.concurrency) for priority in PRIORITIES}
+        self.embeddings.start_warmup()
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+        server = await asyncio.start_unix_server(self._handle, path=self.socket_path)
+        os.chmod(self.socket_path, 0o600)
+        print(f"[OK] Model server listening on {self.socket_path} (pid {os.getpid()})")
+
+        stop = asyncio.Event()
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, stop.set)
+        parent = os.getppid()
+        while not stop.is_set():
+            try:
+                await asyncio.wait_for(stop.wait(), 2)
+            except asyncio.TimeoutError:
+                if os.getppid() != parent:
+                    print("[WARN] Launcher exited; stopping the model server")
+                    break
+
+        # Stop accepting connections and let requests in flight finish
+        server.close()
+        waited = 0.0
+        while self.in_flight and waited < self.grace_seconds:
+            await asyncio.sleep(0.1)
+            waited += 0.1
+        if self.in_flight:
+            print(f"[WARN] Model server stopping with {self.in_flight} requests still running")
+        for writer in list(self._writers):
+            writer.close()
+        self.speech.close()
+        if self.embeddings.cache is not None:
+            self.embeddings.cache.flush()
+        shutdown_stages()
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+        print("[OK] Model server stopped")
+
+
+def run_model_server(socket_path: str, concurrency: Optional[int] = None):
+    """Process entry point for the model server"""
+    # Ctrl+C reaches the whole process group; the launcher stops this process
+    # with SIGTERM once the API workers have finished their requests
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    asyncio.run(ModelServer(socket_path, concurrency).serve())
+
+
+class _Connection:
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.reader = reader
+        self.writer = writer
+        self.pending: Dict[int, asyncio.Future] = {}
+        self.write_lock = asyncio.Lock()
+        self.reader_task: Optional[asyncio.Task] = None
+
+
+class ModelClient:
+    """
+    An API worker's connection to the model server
+
+    Calls are multiplexed over one socket and matched to responses by id. A
+    lost connection fails the calls in flight and is re-opened by the next
+    call.
+    """
+
+    def __init__(self, socket_path: str, timeout: Optional[float] = None):
+        self.socket_path = socket_path
+        self.timeout = timeout or float(os.getenv("MODEL_SERVER_TIMEOUT", 600))
+        self._connection: Optional[_Connection] = None
+        self._connect_lock: Optional[asyncio.Lock] = None
+        self._next_id = 0
+
+    async def _connect(self) -> _Connection:
+        if self._connect_lock is None:
+            self._connect_lock = asyncio.Lock()
+        async with self._connect_lock:
+            if self._connection is None:
+                try:
+                    reader, writer = await asyncio.open_unix_connection(self.socket_path)
+                except OSError as e:
+                    raise ModelServerUnavailable(f"Model server unavailable at {self.socket_path}: {e}") from e
+                connection = _Connection(reader, writer)
+                connection.reader_task = asyncio.ensure_future(self._read_responses(connection))
+                self._connection = connection
+            return self._connection
+
+    async def _read_responses(self, connection: _Connection):
+        try:
+            while True:
+                request_id, ok, result = await _receive(connection.reader)
+                future = connection.pending.pop(request_id, None)
+                if future is None or future.done():
+                    continue
+                if ok:
+                    future.set_result(result)
+                elif isinstance(result, tuple):
+                    name, stage, message, retry_after = result
+                    error = {"DeadlineExceeded": DeadlineExceeded, "ModelNotReady": ModelNotReady}.get(name, Overloaded)
+                    future.set_exception(error(stage, message, retry_after))
+                else:
+                    future.set_exception(ModelServerError(result))
+        except (asyncio.IncompleteReadError, ConnectionError, OSError):
+            pass
+        finally:
+            if self._connection is connection:
+                self._connection = None
+            connection.writer.close()
+            for future in connection.pending.values():
+                if not future.done():
+                    future.set_exception(ModelServerUnavailable("Lost the connection to the model server"))
+            connection.pending.clear()
+
+    async def call(self, method: str, *args, **kwargs):
+        """
+        Run `method` on the model server and return its result
+
+        The caller's priority lane and remaining deadline go with the request.
+        """
+        deadline = request_deadline.get()
+        timeout = None if deadline is None else deadline - time.monotonic()
+        if timeout is not None and timeout <= 0:
+            raise DeadlineExceeded(method, "The request's deadline passed before reaching the model server")
+        connection = await self._connect()
+        self._next_id += 1
+        request_id = self._next_id
+        future = asyncio.get_running_loop().create_future()
+        connection.pending[request_id] = future
+        message = (request_id, method, args, kwargs, request_priority.get(), timeout)
+        try:
+            with metrics.span(f"model_server.{method}"):
+                async with connection.write_lock:
+                    await _send(connection.writer, message)
+                return await asyncio.wait_for(future, self.timeout)
+        except (ConnectionError, OSError) as e:
+            raise ModelServerUnavailable(f"Lost the connection to the model server: {e}") from e
+        finally:
+            connection.pending.pop(request_id, None)
+
+    async def close(self):
+        connection, self._connection = self._connection, None
+        if connection is not None:
+            connection.writer.close()
+            connection.reader_task.cancel()
+            await asyncio.gather(connection.reader_task, return_exceptions=True)
+
+
+class RemoteEmbeddingService(EmbeddingService):
+    """
+    EmbeddingService whose model runs in the model server
+
+    Summaries, similarity and clustering need no model and run locally.
+    The model state shown by `ready`/`status()` is polled in the background,
+    so checking it never waits on the socket.
+    """
+
+    def __init__(self, client: ModelClient):
+        self.client = client
+        self.model_name = os.getenv("EMBED_MODEL_NAME", "all-MiniLM-L6-v2")
+        self.model = None
+        self.cache = None  # The cache lives in the model server
+        self.load_retry_seconds = float(os.getenv("EMBED_LOAD_RETRY_SECONDS", 60))
+        self._status = {"state": "cold"}
+        self._stats: Dict = {}
+        self._poller: Optional[asyncio.Task] = None
+
+    @property
+    def state(self) -> str:
+        return self._status["state"]
+
+    @property
+    def ready(self) -> bool:
+        return self.state == "ready"
+
+    def start_warmup(self):
+        """The model server warms the model; keep track of its state"""
+        if self._poller is None:
+            self._poller = asyncio.ensure_future(self._poll())
+
+    async def _poll(self):
+        while True:
+            try:
+                self._status = dict(await self.client.call("status"), remote=True)
+                self._stats = (await self.client.call("stats"))["embedding"]
+            except ModelServerError as e:
+                self._status = {"state": "unavailable", "remote": True, "error": str(e)}
+            await asyncio.sleep(5 if self.ready else 1)
+
+    async def load_model(self):
+        await self.client.call("load_model")
+        # Don't wait for the next poll to see the outcome
+        self._status = dict(await self.client.call("status"), remote=True)
+
+    def status(self) -> Dict:
+        return self._status
+
+    def batch_stats(self) -> Dict:
+        return self._stats
+
+    async def embed_text(self, text: str) -> np.ndarray:
+        return await self.client.call("embed_text", text)
+
+    async def embed_batch(self, texts: List[str]) -> np.ndarray:
+        return await self.client.call("embed_batch", texts)
+
+    async def close(self):
+        if self._poller is not None:
+            self._poller.cancel()
+            await asyncio.gather(self._poller, return_exceptions=True)
+            self._poller = None
+        await self.client.close()
+
+
+class RemoteSpeechProcessor:
+    """SpeechProcessor calls forwarded to the model server"""
+
+    def __init__(self, client: ModelClient):
+        self.client = client
+
+    async def transcribe(self, audio_path: str, model_size: Optional[str] = None) -> str:
+        return await self.client.call("transcribe", audio_path, model_size)
+
+    async def transcribe_with_timestamps(self, audio_path: str, model_size: Optional[str] = None) -> Dict:
+        return await self.client.call("transcribe_with_timestamps", audio_path, model_size)
+
+
+class RemoteImageProcessor:
+    """ImageProcessor calls forwarded to the model server"""
+
+    def __init__(self, client: ModelClient):
+        self.client = client
+
+    async def process_image(self, image_path: str) -> str:
+        return await self.client.call("process_image", image_path)
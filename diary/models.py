@@ -15,6 +15,7 @@ class EntryCreate(BaseModel):
     image_path: Optional[str] = None
     tags: List[str] = []
     timestamp: str = Field(default_factory=lambda: datetime.utcnow().isoformat())
+    transcription_model: Optional[str] = None
 
 
 class EntryResponse(BaseModel):
@@ -27,11 +28,18 @@ class EntryResponse(BaseModel):
     tags: List[str] = []
     timestamp: str
     similarity_score: Optional[float] = None
+    enrichment_status: str = "ready"
     
     class Config:
         from_attributes = True
 
 
+class EntryPage(BaseModel):
+    """Model for a page of entries with the cursor for the next page"""
+    entries: List[EntryResponse]
+    next_cursor: Optional[str] = None
+
+
 class SearchQuery(BaseModel):
     """Model for search queries"""
     text: str
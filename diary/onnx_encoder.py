@@ -0,0 +1,205 @@
+"""
+ONNX Runtime inference backend for sentence embeddings
+
+Runs the transformer of a model bundle exported by export_onnx.py through
+ONNX Runtime and reproduces the sentence-transformers pipeline around it
+(tokenize, pool, normalise) with the Rust `tokenizers` package, so encoding
+needs neither torch nor sentence-transformers at runtime. An int8
+dynamically quantized copy of the model can be used instead of the float32
+export for faster CPU inference.
+"""
+
+import json
+import os
+from typing import Dict, List, Optional, Union
+
+import numpy as np
+
+ONNX_DIR = "onnx"
+ONNX_INPUTS = ("input_ids", "attention_mask", "token_type_ids")
+
+
+def onnx_model_path(model_dir: str, quantized: bool = False) -> str:
+    """Location of the exported (or quantized) ONNX model inside a bundle"""
+    return os.path.join(model_dir, ONNX_DIR, "model.int8.onnx" if quantized else "model.onnx")
+
+
+def _read_json(path: str) -> Dict:
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _find(model_dir: str, name: str) -> Optional[str]:
+    """A config file of the bundle's transformer module (root or 0_Transformer/)"""
+    for directory in (model_dir, os.path.join(model_dir, "0_Transformer")):
+        path = os.path.join(directory, name)
+        if os.path.exists(path):
+            return path
+    return None
+
+
+def pipeline_config(model_dir: str) -> Dict:
+    """Pooling mode, normalisation and max sequence length of a saved SentenceTransformer"""
+    config = {"pooling": "mean", "normalize": False, "max_seq_length": 256}
+    modules_path = os.path.join(model_dir, "modules.json")
+    modules = _read_json(modules_path) if os.path.exists(modules_path) else []
+    for module in modules:
+        kind = module["type"].rsplit(".", 1)[-1]
+        if kind == "Pooling":
+            pooling = _read_json(os.path.join(model_dir, module["path"], "config.json"))
+            if pooling.get("pooling_mode_cls_token"):
+                config["pooling"] = "cls"
+            elif pooling.get("pooling_mode_max_tokens"):
+                config["pooling"] = "max"
+        elif kind == "Normalize":
+            config["normalize"] = True
+    st_config = _find(model_dir, "sentence_bert_config.json")
+    if st_config:
+        config["max_seq_length"] = _read_json(st_config).get("max_seq_length") or config["max_seq_length"]
+    return config
+
+
+class OnnxEncoder:
+    """
+    Drop-in replacement for SentenceTransformer.encode over an ONNX export
+
+    Texts are sorted by length and encoded in batches, so each batch is padded
+    only to its own longest text.
+    """
+
+    def __init__(
+        self,
+        model_dir: str,
+        quantized: bool = False,
+        threads: int = 0,
+        batch_size: int = 32
+    ):
+        import onnxruntime
+        from tokenizers import Tokenizer
+
+        self.model_path = onnx_model_path(model_dir, quantized)
+        if not os.path.exists(self.model_path):
+            raise FileNotFoundError(
+                f"{self.model_path} not found - run: python export_onnx.py --model-dir {model_dir}"
+                + (" --quantize" if quantized else "")
+            )
+        self.batch_size = batch_size
+        self.config = pipeline_config(model_dir)
+
+        tokenizer_path = _find(model_dir, "tokenizer.json")
+        if tokenizer_path is None:
+            raise FileNotFoundError(f"No tokenizer.json in {model_dir}")
+        self.tokenizer = Tokenizer.from_file(tokenizer_path)
+        self.tokenizer.enable_truncation(max_length=self.config["max_seq_length"])
+        pad_token = "[PAD]"
+        special_path = _find(model_dir, "special_tokens_map.json")
+        if special_path:
+            pad = _read_json(special_path).get("pad_token", pad_token)
+            pad_token = pad["content"] if isinstance(pad, dict) else pad
+        pad_id = self.tokenizer.token_to_id(pad_token)
+        self.tokenizer.enable_padding(pad_id=pad_id or 0, pad_token=pad_token)
+
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = onnxruntime.InferenceSession(
+            self.model_path, options, providers=["CPUExecutionProvider"]
+        )
+        self.input_names = [i.name for i in self.session.get_inputs() if i.name in ONNX_INPUTS]
+
+    def _encode_batch(self, texts: List[str]) -> np.ndarray:
+        encodings = self.tokenizer.encode_batch(texts)
+        feeds = {
+            "input_ids": np.array([e.ids for e in encodings], dtype=np.int64),
+            "attention_mask": np.array([e.attention_mask for e in encodings], dtype=np.int64),
+            "token_type_ids": np.array([e.type_ids for e in encodings], dtype=np.int64),
+        }
+        hidden = self.session.run(None, {name: feeds[name] for name in self.input_names})[0]
+
+        mask = feeds["attention_mask"][:, :, None].astype(np.float32)
+        if self.config["pooling"] == "cls":
+            pooled = hidden[:, 0]
+        elif self.config["pooling"] == "max":
+            pooled = np.where(mask > 0, hidden, -1e9).max(axis=1)
+        else:
+            pooled = (hidden * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)
+        if self.config["normalize"]:
+            pooled = pooled / np.maximum(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12)
+        return pooled.astype(np.float32)
+
+    def encode(
+        self,
+        sentences: Union[str, List[str]],
+        batch_size: Optional[int] = None,
+        convert_to_numpy: bool = True,
+        **kwargs
+    ) -> np.ndarray:
+        """Embed one text (returns a vector) or a list of texts (returns a matrix)"""
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32)
+
+        batch_size = batch_size or self.batch_size
+        order = np.argsort([-len(text) for text in texts], kind="stable")
+        embeddings = [None] * len(texts)
+        for start in range(0, len(texts), batch_size):
+            chunk = order[start:start + batch_size]
+            vectors = self._encode_batch([texts[i] for i in chunk])
+            for i, vector in zip(chunk, vectors):
+                embeddings[i] = vector
+        result = np.vstack(embeddings)
+        return result[0] if single else result
+
+
+def export_onnx(model_dir: str, opset: int = 14) -> str:
+    """
+    Export a bundle's transformer to ONNX (needs torch and sentence-transformers)
+
+    Only the transformer is exported; tokenisation, pooling and normalisation
+    run in OnnxEncoder. Batch and sequence axes are dynamic.
+    """
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    model = SentenceTransformer(model_dir, device="cpu")
+    transformer = model[0]
+    sample = transformer.tokenizer(["An example diary entry"], return_tensors="pt")
+    input_names = [name for name in ONNX_INPUTS if name in sample]
+
+    class HiddenStates(torch.nn.Module):
+        def __init__(self, auto_model):
+            super().__init__()
+            self.auto_model = auto_model
+
+        def forward(self, *inputs):
+            return self.auto_model(**dict(zip(input_names, inputs)))[0]
+
+    path = onnx_model_path(model_dir)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    dynamic = {"batch": 0, "sequence": 1}
+    with torch.no_grad():
+        torch.onnx.export(
+            HiddenStates(transformer.auto_model.eval()),
+            tuple(sample[name] for name in input_names),
+            path,
+            input_names=input_names,
+            output_names=["last_hidden_state"],
+            dynamic_axes={
+                name: {axis: label for label, axis in dynamic.items()}
+                for name in input_names + ["last_hidden_state"]
+            },
+            opset_version=opset,
+            do_constant_folding=True
+        )
+    return path
+
+
+def quantize_onnx(model_dir: str) -> str:
+    """Write an int8 dynamically quantized copy of the exported model"""
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    path = onnx_model_path(model_dir, quantized=True)
+    quantize_dynamic(onnx_model_path(model_dir), path, weight_type=QuantType.QInt8)
+    return path
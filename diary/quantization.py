@@ -0,0 +1,61 @@
+"""
+Compact embedding encodings: float32, float16, or int8 with a per-vector scale
+"""
+
+from typing import Optional, Tuple
+
+import numpy as np
+
+PRECISIONS = ("float32", "float16", "int8")
+
+CODE_DTYPES = {
+    "float32": np.float32,
+    "float16": np.float16,
+    "int8": np.int8,
+}
+
+
+def check_precision(precision: str) -> str:
+    precision = precision.lower()
+    if precision not in PRECISIONS:
+        raise ValueError(f"Unknown embedding precision '{precision}' (expected one of {', '.join(PRECISIONS)})")
+    return precision
+
+
+def quantize(vectors: np.ndarray, precision: str) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Encode a matrix of vectors, returning (codes, scales)
+
+    int8 codes use a symmetric per-vector scale (max |x| / 127), so
+    codes * scale reconstructs each vector; other precisions have scale 1.
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if vectors.ndim == 1:
+        vectors = vectors.reshape(1, -1)
+
+    if precision != "int8":
+        return vectors.astype(CODE_DTYPES[precision]), np.ones(len(vectors), dtype=np.float32)
+
+    scales = np.abs(vectors).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    codes = np.clip(np.rint(vectors / scales[:, None]), -127, 127).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+
+def dequantize(codes: np.ndarray, scales: np.ndarray) -> np.ndarray:
+    """Inverse of quantize"""
+    return np.asarray(codes, dtype=np.float32) * np.asarray(scales, dtype=np.float32)[:, None]
+
+
+def encode_embedding(vector: np.ndarray, precision: str) -> Tuple[bytes, Optional[float]]:
+    """Bytes and scale for storing one embedding as a database property"""
+    codes, scales = quantize(vector, precision)
+    scale = float(scales[0]) if precision == "int8" else None
+    return codes[0].tobytes(), scale
+
+
+def decode_embedding(data: bytes, scale: Optional[float]) -> np.ndarray:
+    """Inverse of encode_embedding: int8 codes carry a scale, float16 codes do not"""
+    if scale is not None:
+        return np.frombuffer(data, dtype=np.int8).astype(np.float32) * np.float32(scale)
+    return np.frombuffer(data, dtype=np.float16).astype(np.float32)
@@ -0,0 +1,118 @@
+"""
+Hybrid retrieval: vector and keyword search merged with reciprocal-rank fusion
+"""
+
+import asyncio
+import os
+import time
+from typing import Dict, List, Optional, Tuple
+
+from diary.executors import Overloaded, request_deadline
+
+
+class HybridRetriever:
+    """
+    Runs semantic and keyword search concurrently and fuses their rankings
+
+    Each leg has its own timeout so a slow leg cannot stall the response; a
+    leg that times out or fails simply contributes nothing. Results are merged
+    with weighted reciprocal-rank fusion and deduplicated by entry id.
+    """
+
+    def __init__(self, db, embeddings):
+        self.db = db
+        self.embeddings = embeddings
+        self.rrf_k = float(os.getenv("HYBRID_RRF_K", 60))
+        self.weights = {
+            "vector": float(os.getenv("HYBRID_VECTOR_WEIGHT", 1.0)),
+            "keyword": float(os.getenv("HYBRID_KEYWORD_WEIGHT", 1.0))
+        }
+        self.timeouts = {
+            "vector": float(os.getenv("HYBRID_VECTOR_TIMEOUT_MS", 2000)) / 1000,
+            "keyword": float(os.getenv("HYBRID_KEYWORD_TIMEOUT_MS", 1000)) / 1000
+        }
+
+    async def _vector_leg(self, text: str, limit: int) -> Tuple[List[Dict], Optional[str]]:
+        if not self.embeddings.ready:
+            # Still warming up (or failed to load) - the keyword leg carries the query
+            return [], None
+        query_embedding = await self.embeddings.embed_text(text)
+        if query_embedding is None or not query_embedding.any():
+            # Embeddings unavailable - the keyword leg carries the query
+            return [], None
+        return await self.db.vector_search(query_embedding, limit)
+
+    async def _keyword_leg(self, text: str, limit: int) -> Tuple[List[Dict], Optional[str]]:
+        results = await self.db.text_search(text, limit)
+        return results, self.db.keyword_search_path()
+
+    async def _run_leg(self, name: str, leg, text: str, limit: int) -> Tuple[List[Dict], Dict]:
+        """Run one leg under its timeout, recording latency and outcome"""
+        started = time.perf_counter()
+        info = {"status": "ok", "path": None, "hits": 0}
+        results = []
+        # Model stages reject the leg up front if it could not start in time
+        leg_deadline = time.monotonic() + self.timeouts[name]
+        deadline = request_deadline.get()
+        request_deadline.set(leg_deadline if deadline is None else min(deadline, leg_deadline))
+        try:
+            results, info["path"] = await asyncio.wait_for(leg(text, limit), self.timeouts[name])
+            if info["path"] is None:
+                info["status"] = "skipped"
+        except asyncio.TimeoutError:
+            info["status"] = "timeout"
+        except Overloaded as e:
+            info["status"] = "rejected"
+            info["error"] = str(e)
+        except Exception as e:
+            print(f"[WARN] {name} search failed: {e}")
+            info["status"] = "error"
+            info["error"] = str(e)
+        info["latency_ms"] = round((time.perf_counter() - started) * 1000, 2)
+        info["hits"] = len(results)
+        return results, info
+
+    async def search(self, text: str, limit: int = 20) -> Dict:
+        """
+        Search both legs and fuse them
+
+        Returns {"results": [...], "legs": {name: info}} where each leg's info
+        holds its latency, status, hit count and how many fused results it
+        contributed to.
+        """
+        (vector_results, vector_info), (keyword_results, keyword_info) = await asyncio.gather(
+            self._run_leg("vector", self._vector_leg, text, limit),
+            self._run_leg("keyword", self._keyword_leg, text, limit)
+        )
+
+        fused = self.fuse({"vector": vector_results, "keyword": keyword_results}, limit)
+
+        legs = {"vector": vector_info, "keyword": keyword_info}
+        for name, info in legs.items():
+            info["weight"] = self.weights[name]
+            info["contributed"] = sum(1 for entry in fused if name in entry["matched_by"])
+            info["unique"] = sum(1 for entry in fused if entry["matched_by"] == [name])
+
+        return {"results": fused, "legs": legs}
+
+    def fuse(self, rankings: Dict[str, List[Dict]], limit: int) -> List[Dict]:
+        """Weighted reciprocal-rank fusion of ranked result lists, deduplicated by id"""
+        merged: Dict[str, Dict] = {}
+        for name, results in rankings.items():
+            weight = self.weights.get(name, 1.0)
+            for rank, entry in enumerate(results, start=1):
+                fused = merged.get(entry["id"])
+                if fused is None:
+                    fused = dict(entry)
+                    fused["fusion_score"] = 0.0
+                    fused["matched_by"] = []
+                    merged[entry["id"]] = fused
+                else:
+                    # Keep per-leg scores (similarity / score) from every leg
+                    for key, value in entry.items():
+                        fused.setdefault(key, value)
+                fused["fusion_score"] += weight / (self.rrf_k + rank)
+                fused["matched_by"].append(name)
+
+        ranked = sorted(merged.values(), key=lambda entry: entry["fusion_score"], reverse=True)
+        return ranked[:limit]
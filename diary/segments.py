@@ -0,0 +1,106 @@
+"""
+Splitting long entries into segments for segment-level search
+
+all-MiniLM-L6-v2 truncates its input at 256 word pieces, so an entry-level
+embedding only reflects the start of a long memo. Long entries are therefore
+also stored as segments of about SEGMENT_WORDS words, each embedded and
+searched on its own. Transcript segments keep their start/end times.
+"""
+
+import os
+from typing import Dict, List, Optional
+
+
+def segment_id(entry_id: str, index: int) -> str:
+    """Id of an entry's index-th segment"""
+    return f"{entry_id}:{index}"
+
+
+def transcript_segments(segments: List[Dict], max_words: int) -> List[Dict]:
+    """Group consecutive timed Whisper segments into chunks of at most max_words words"""
+    chunks = []
+    current = []
+    words = 0
+    for segment in segments:
+        count = len(segment["text"].split())
+        if current and words + count > max_words:
+            chunks.append(_timed_chunk(current))
+            current = []
+            words = 0
+        current.append(segment)
+        words += count
+    if current:
+        chunks.append(_timed_chunk(current))
+    return chunks
+
+
+def _timed_chunk(segments: List[Dict]) -> Dict:
+    return {
+        "text": " ".join(segment["text"] for segment in segments),
+        "start": segments[0]["start"],
+        "end": segments[-1]["end"]
+    }
+
+
+def text_segments(text: str, max_words: int, overlap: int) -> List[Dict]:
+    """Overlapping windows of max_words words (no times) over plain text"""
+    words = text.split()
+    step = max(1, max_words - overlap)
+    return [
+        {"text": " ".join(words[start:start + max_words]), "start": None, "end": None}
+        for start in range(0, max(1, len(words) - overlap), step)
+    ]
+
+
+def build_segments(
+    text: Optional[str],
+    transcript: Optional[List[Dict]] = None,
+    max_words: Optional[int] = None,
+    overlap: Optional[int] = None
+) -> List[Dict]:
+    """
+    Segments for an entry: timed chunks of its transcript, windows over its other text
+
+    `text` is the entry text without the transcript. Content short enough to be
+    covered by the entry embedding yields no segments.
+    """
+    max_words = max_words or int(os.getenv("SEGMENT_WORDS", 120))
+    overlap = int(os.getenv("SEGMENT_OVERLAP_WORDS", 20)) if overlap is None else overlap
+
+    segments = []
+    transcript_words = sum(len(segment["text"].split()) for segment in transcript or [])
+    if transcript_words > max_words:
+        segments.extend(transcript_segments(transcript, max_words))
+    if text and len(text.split()) > max_words:
+        segments.extend(text_segments(text, max_words, overlap))
+    return segments
+
+
+def with_segment(record: Dict) -> Dict:
+    """Fold the segment_* columns of a search row into a "segment" dict (None without one)"""
+    text = record.pop("segment_text", None)
+    start = record.pop("segment_start", None)
+    end = record.pop("segment_end", None)
+    record["segment"] = {"text": text, "start": start, "end": end} if text is not None else None
+    return record
+
+
+def merge_segment_hits(entries: List[Dict], segment_hits: List[Dict], limit: int) -> List[Dict]:
+    """
+    Merge entry-level and segment-level results into one ranking
+
+    An entry found both ways keeps its best similarity and the matching
+    segment. Both lists carry "similarity"; segment hits carry "segment".
+    """
+    merged = {entry["id"]: entry for entry in entries}
+    for entry in entries:
+        entry.setdefault("segment", None)
+    for hit in segment_hits:
+        entry = merged.get(hit["id"])
+        if entry is None:
+            merged[hit["id"]] = hit
+        else:
+            entry["segment"] = hit["segment"]
+            entry["similarity"] = max(entry["similarity"], hit["similarity"])
+    ranked = sorted(merged.values(), key=lambda entry: entry["similarity"], reverse=True)
+    return ranked[:limit]
@@ -0,0 +1,91 @@
+"""
+Offline similarity graph computation over exported entry embeddings
+"""
+
+import numpy as np
+from typing import Iterator, List, Tuple
+
+
+def normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    """Scale each row to unit length so dot products are cosine similarities"""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def top_k_neighbours(
+    vectors: np.ndarray,
+    k: int = 10,
+    threshold: float = 0.85,
+    block_size: int = 1024
+) -> Iterator[Tuple[int, np.ndarray, np.ndarray]]:
+    """
+    Find each row's k most similar rows above the threshold
+
+    Similarities are computed in (block_size x block_size) matrix multiplies,
+    keeping a running top-k per row, so memory stays bounded by the block size
+    rather than growing with N^2.
+
+    Yields (row, neighbour_rows, scores) for rows with at least one neighbour.
+    """
+    matrix = normalize_rows(vectors)
+    n = matrix.shape[0]
+    k = min(k, n - 1)
+    if k <= 0:
+        return
+
+    for row_start in range(0, n, block_size):
+        rows = matrix[row_start:row_start + block_size]
+        b = rows.shape[0]
+        best_scores = np.full((b, k), -np.inf, dtype=np.float32)
+        best_index = np.full((b, k), -1, dtype=np.int64)
+
+        for col_start in range(0, n, block_size):
+            cols = matrix[col_start:col_start + block_size]
+            scores = rows @ cols.T
+
+            # Never link an entry to itself
+            overlap_start = max(row_start, col_start)
+            overlap_end = min(row_start + b, col_start + cols.shape[0])
+            if overlap_start < overlap_end:
+                diag = np.arange(overlap_start, overlap_end)
+                scores[diag - row_start, diag - col_start] = -np.inf
+
+            # Merge this block's candidates into the running top-k
+            col_index = np.broadcast_to(
+                np.arange(col_start, col_start + cols.shape[0]), scores.shape
+            )
+            merged_scores = np.concatenate([best_scores, scores], axis=1)
+            merged_index = np.concatenate([best_index, col_index], axis=1)
+            top = np.argpartition(-merged_scores, k - 1, axis=1)[:, :k]
+            best_scores = np.take_along_axis(merged_scores, top, axis=1)
+            best_index = np.take_along_axis(merged_index, top, axis=1)
+
+        for i in range(b):
+            keep = best_scores[i] > threshold
+            if keep.any():
+                order = np.argsort(-best_scores[i][keep])
+                yield row_start + i, best_index[i][keep][order], best_scores[i][keep][order]
+
+
+def similarity_edges(
+    ids: List[str],
+    vectors: np.ndarray,
+    k: int = 10,
+    threshold: float = 0.85,
+    block_size: int = 1024
+) -> List[Tuple[str, str, float]]:
+    """
+    Build the undirected SIMILAR_TO edge list for a set of entries
+
+    An edge is kept when either endpoint has the other in its top-k, matching
+    what incremental linking on insert produces. Each pair appears once.
+    """
+    edges = {}
+    for row, neighbours, scores in top_k_neighbours(vectors, k, threshold, block_size):
+        for col, score in zip(neighbours, scores):
+            key = (row, int(col)) if row < col else (int(col), row)
+            edges[key] = float(score)
+
+    return [(ids[a], ids[b], score) for (a, b), score in edges.items()]
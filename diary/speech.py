@@ -2,103 +2,352 @@
 Speech-to-text processing using OpenAI Whisper
 """
 
+import hashlib
+import importlib.util
+import json
 import os
-from typing import Optional
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
 
-# Try to import whisper, but handle gracefully if not available
-try:
-    import whisper
-    WHISPER_AVAILABLE = True
-except (ImportError, TypeError, AttributeError, Exception) as e:
-    WHISPER_AVAILABLE = False
-    whisper = None  # Set to None if import fails
+import numpy as np
+
+from diary.executors import ModelNotReady, transcription_stage
+from diary.media import is_content_addressed
+
+# Whisper pulls in torch, so it is only imported when the first recording
+# is transcribed rather than at startup
+WHISPER_AVAILABLE = importlib.util.find_spec("whisper") is not None
+whisper = None
+_whisper_lock = threading.Lock()
+
+
+def _import_whisper():
+    """Import whisper on first use; None if it is missing or fails to import"""
+    global whisper, WHISPER_AVAILABLE
+    with _whisper_lock:
+        if whisper is None and WHISPER_AVAILABLE:
+            try:
+                import whisper as module
+                whisper = module
+            except Exception as e:
+                print(f"[WARN] Could not import Whisper: {e}")
+                WHISPER_AVAILABLE = False
+    return whisper
+
+SAMPLE_RATE = 16000
+FRAME_SECONDS = 0.03
+MODEL_SIZES = ("tiny", "base", "small", "medium", "large")
+
+
+def parse_model_rules(rules: str) -> List[Tuple[float, str]]:
+    """
+    Parse "60:tiny,900:base,small" into [(60, "tiny"), (900, "base"), (inf, "small")]
+
+    Audio up to each duration (in seconds) uses that model; the last rule,
+    without a duration, covers everything longer.
+    """
+    parsed = []
+    for rule in rules.split(","):
+        rule = rule.strip()
+        if not rule:
+            continue
+        limit, _, size = rule.rpartition(":")
+        if size not in MODEL_SIZES:
+            raise ValueError(f"Unknown Whisper model size: {size}")
+        parsed.append((float(limit) if limit else float("inf"), size))
+    return parsed
+
+
+def split_on_silence(
+    audio: np.ndarray,
+    max_chunk_seconds: float = 60.0,
+    min_silence_seconds: float = 0.5,
+    threshold_db: float = -40.0
+) -> List[Tuple[int, int]]:
+    """
+    Split 16 kHz audio into (start, end) sample ranges of at most max_chunk_seconds
+
+    Cuts are placed in the middle of the latest pause (a run of 30 ms frames
+    quieter than threshold_db for at least min_silence_seconds) that keeps the
+    chunk under the limit, so words are not cut in half. Audio without a usable
+    pause is cut at the limit.
+    """
+    max_chunk = int(max_chunk_seconds * SAMPLE_RATE)
+    if len(audio) <= max_chunk:
+        return [(0, len(audio))]
+
+    frame = int(FRAME_SECONDS * SAMPLE_RATE)
+    frames = len(audio) // frame
+    rms = np.sqrt(np.mean(np.square(audio[:frames * frame].reshape(frames, frame)), axis=1))
+    silent = np.concatenate(([False], rms < 10 ** (threshold_db / 20), [False]))
+    edges = np.flatnonzero(np.diff(silent.astype(np.int8)))
+    starts, ends = edges[::2], edges[1::2]
+    long_enough = ends - starts >= int(min_silence_seconds / FRAME_SECONDS)
+    cut_points = (starts[long_enough] + ends[long_enough]) // 2 * frame
+
+    chunks = []
+    start = 0
+    while len(audio) - start > max_chunk:
+        limit = start + max_chunk
+        candidates = cut_points[(cut_points > start + max_chunk // 4) & (cut_points <= limit)]
+        end = int(candidates[-1]) if len(candidates) else limit
+        chunks.append((start, end))
+        start = end
+    chunks.append((start, len(audio)))
+    return chunks
 
 
 class SpeechProcessor:
-    """Service for processing audio to text"""
-    
+    """
+    Service for processing audio to text
+
+    Long recordings are split at pauses and the chunks are transcribed in a
+    bounded thread pool (TRANSCRIBE_CHUNK_WORKERS, one Whisper model per
+    thread), then stitched back together with their timestamps. Results are
+    cached on disk by audio content hash and model size.
+
+    Without Whisper installed transcription is off for good. A model that
+    fails to load (out of memory, a download error) is retried after
+    WHISPER_LOAD_RETRY_SECONDS; until then calls raise ModelNotReady, so
+    enrichment jobs are put back rather than stored without a transcript.
+    """
+
     def __init__(self):
-        self.model = None
-        self.model_size = "base"  # Options: tiny, base, small, medium, large
-    
-    def _load_model(self):
-        """Load Whisper model (called lazily)"""
-        if not WHISPER_AVAILABLE or whisper is None:
+        self.model_size = os.getenv("WHISPER_MODEL_SIZE", "base")  # Options: tiny, base, small, medium, large
+        self.model_rules = parse_model_rules(os.getenv("WHISPER_MODEL_RULES", ""))
+        self.chunk_seconds = float(os.getenv("TRANSCRIBE_CHUNK_SECONDS", 60))
+        self.silence_db = float(os.getenv("TRANSCRIBE_SILENCE_DB", -40))
+        self.chunk_workers = int(os.getenv("TRANSCRIBE_CHUNK_WORKERS", 2))
+        self.cache_dir = os.getenv("TRANSCRIPT_CACHE_DIR", "./data/transcripts") or None
+        self._local = threading.local()
+        self._pool = None
+        self._load_lock = threading.Lock()
+        self._disabled = False
+        self.load_retry_seconds = float(os.getenv("WHISPER_LOAD_RETRY_SECONDS", 60))
+        self._load_failed_at = None
+        self._load_error = None
+
+    def _load_model(self, model_size: str):
+        """Load a Whisper model for the calling thread (called lazily)"""
+        models = getattr(self._local, "models", None)
+        if models is None:
+            models = self._local.models = {}
+        if model_size in models:
+            return models[model_size]
+
+        if self._disabled:
+            return None
+        if _import_whisper() is None:
             print("[WARN] Whisper not available (not installed or unsupported Python version)")
             print("Speech-to-text will be disabled")
-            self.model = None
-            return
-            
-        if self.model is None:
-            print(f"Loading Whisper model ({self.model_size})...")
+            self._disabled = True
+            return None
+
+        # whisper.load_model is not safe to call from several threads at once
+        with self._load_lock:
+            self._check_load_backoff()
+            print(f"Loading Whisper model ({model_size})...")
             try:
-                self.model = whisper.load_model(self.model_size)
+                models[model_size] = whisper.load_model(model_size)
                 print("[OK] Whisper model loaded")
             except Exception as e:
                 print(f"[WARN] Could not load Whisper model: {e}")
-                print("Speech-to-text will be disabled")
-                self.model = None
-    
-    async def transcribe(self, audio_path: str) -> str:
+                print(f"Speech-to-text will retry the load in {self.load_retry_seconds:.0f}s")
+                self._load_failed_at = time.monotonic()
+                self._load_error = str(e)
+                raise ModelNotReady(
+                    "transcribe", f"The Whisper model could not be loaded ({e})", self.load_retry_seconds
+                )
+            self._load_failed_at = None
+        return models[model_size]
+
+    def _check_load_backoff(self):
+        """Raise ModelNotReady while a failed model load is waiting to be retried"""
+        if self._load_failed_at is None:
+            return
+        remaining = self.load_retry_seconds - (time.monotonic() - self._load_failed_at)
+        if remaining > 0:
+            raise ModelNotReady(
+                "transcribe", f"The Whisper model could not be loaded ({self._load_error})", remaining
+            )
+
+    def _get_pool(self) -> ThreadPoolExecutor:
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(
+                max_workers=max(1, self.chunk_workers),
+                thread_name_prefix="diary-whisper"
+            )
+        return self._pool
+
+    def close(self):
+        """Shut down the chunk pool"""
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    def choose_model_size(self, duration: float) -> str:
+        """Model size for audio of `duration` seconds under WHISPER_MODEL_RULES"""
+        for limit, size in self.model_rules:
+            if duration <= limit:
+                return size
+        return self.model_size
+
+    async def transcribe(self, audio_path: str, model_size: Optional[str] = None) -> str:
         """
         Transcribe audio file to text
-        
+
         Args:
             audio_path: Path to audio file
-            
+            model_size: Whisper model to use; by default chosen from the duration
+
         Returns:
             Transcribed text
         """
-        if not os.path.exists(audio_path):
-            raise FileNotFoundError(f"Audio file not found: {audio_path}")
-        
-        # Load model if not already loaded
-        if self.model is None:
-            self._load_model()
-        
-        if self.model is None:
-            return "Speech transcription unavailable"
-        
-        try:
-            # Transcribe audio
-            result = self.model.transcribe(
-                audio_path,
-                language="en",  # Can be auto-detected
-                task="transcribe"
-            )
-            
-            return result["text"].strip()
-        
-        except Exception as e:
-            print(f"Error transcribing audio: {e}")
-            return "Error: Could not transcribe audio"
-    
-    async def transcribe_with_timestamps(self, audio_path: str):
+        result = await self.transcribe_with_timestamps(audio_path, model_size)
+        return result.get("error") or result["text"]
+
+    async def transcribe_with_timestamps(self, audio_path: str, model_size: Optional[str] = None) -> Dict:
         """
-        Transcribe audio with word-level timestamps
-        
+        Transcribe audio with segment-level timestamps
+
         Returns:
-            Dict with segments containing text and timestamps
+            Dict with text, segments ({start, end, text} in seconds), duration
+            and model_size; failures carry an "error" message and no segments
         """
         if not os.path.exists(audio_path):
             raise FileNotFoundError(f"Audio file not found: {audio_path}")
-        
-        if self.model is None:
-            self._load_model()
-        
-        if self.model is None:
-            return {"segments": []}
-        
+        if model_size is not None and model_size not in MODEL_SIZES:
+            raise ValueError(f"Unknown Whisper model size: {model_size}")
+
+        # Decoding and running Whisper both block, so do it on the transcription stage
+        return await transcription_stage.run(self._transcribe_sync, audio_path, model_size)
+
+    def _transcribe_sync(self, audio_path: str, model_size: Optional[str]) -> Dict:
+        """Blocking transcription, run on the transcription executor"""
+        audio_hash = self._audio_hash(audio_path)
+
+        if model_size is None:
+            # The model depends on the duration; a cached result records it,
+            # which saves decoding the audio just to measure it
+            duration = self._cached_duration(audio_hash)
+            if duration is not None:
+                model_size = self.choose_model_size(duration)
+        if model_size is not None:
+            cached = self._read_cache(audio_hash, model_size)
+            if cached is not None:
+                return cached
+
+        if self._disabled or _import_whisper() is None:
+            return self._failure("Speech transcription unavailable", model_size)
+        self._check_load_backoff()
+
         try:
-            result = self.model.transcribe(
-                audio_path,
-                word_timestamps=True
-            )
-            
-            return result
-        
+            audio = whisper.load_audio(audio_path)
+            duration = len(audio) / SAMPLE_RATE
+            if model_size is None:
+                model_size = self.choose_model_size(duration)
+                cached = self._read_cache(audio_hash, model_size)
+                if cached is not None:
+                    return cached
+
+            chunks = split_on_silence(audio, self.chunk_seconds, threshold_db=self.silence_db)
+            pieces = list(self._get_pool().map(
+                lambda bounds: self._transcribe_chunk(audio, bounds, model_size), chunks
+            ))
+        except ModelNotReady:
+            raise
         except Exception as e:
             print(f"Error transcribing audio: {e}")
-            return {"segments": []}
+            return self._failure("Error: Could not transcribe audio", model_size)
+
+        if any(piece is None for piece in pieces):
+            return self._failure("Speech transcription unavailable", model_size)
+
+        segments = [segment for piece in pieces for segment in piece]
+        result = {
+            "text": " ".join(segment["text"] for segment in segments if segment["text"]),
+            "segments": segments,
+            "duration": duration,
+            "model_size": model_size
+        }
+        self._write_cache(audio_hash, result)
+        return result
+
+    def _transcribe_chunk(self, audio: np.ndarray, bounds: Tuple[int, int], model_size: str) -> Optional[List[Dict]]:
+        """Transcribe one chunk on a pool thread; timestamps are shifted to the whole recording"""
+        model = self._load_model(model_size)
+        if model is None:
+            return None
+
+        start, end = bounds
+        offset = start / SAMPLE_RATE
+        result = model.transcribe(
+            audio[start:end],
+            language="en",  # Can be auto-detected
+            task="transcribe"
+        )
+        return [
+            {
+                "start": round(offset + segment["start"], 2),
+                "end": round(offset + segment["end"], 2),
+                "text": segment["text"].strip()
+            }
+            for segment in result["segments"]
+        ]
 
+    @staticmethod
+    def _failure(message: str, model_size: Optional[str]) -> Dict:
+        return {"text": "", "segments": [], "duration": None, "model_size": model_size, "error": message}
 
+    @staticmethod
+    def _audio_hash(audio_path: str) -> str:
+        """SHA-256 of the audio file; uploads are already named after it"""
+        if is_content_addressed(audio_path):
+            return os.path.splitext(os.path.basename(audio_path))[0]
+        digest = hashlib.sha256()
+        with open(audio_path, "rb") as f:
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(block)
+        return digest.hexdigest()
+
+    def _cache_path(self, audio_hash: str, model_size: str) -> str:
+        return os.path.join(self.cache_dir, audio_hash[:2], f"{audio_hash}.{model_size}.json")
+
+    def _read_cache(self, audio_hash: str, model_size: str) -> Optional[Dict]:
+        if not self.cache_dir:
+            return None
+        try:
+            with open(self._cache_path(audio_hash, model_size), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _cached_duration(self, audio_hash: str) -> Optional[float]:
+        """Duration recorded by any cached transcript of this audio"""
+        for size in MODEL_SIZES:
+            cached = self._read_cache(audio_hash, size)
+            if cached is not None:
+                return cached["duration"]
+        return None
+
+    def _write_cache(self, audio_hash: str, result: Dict):
+        """Store a transcript; failures are never cached, so a later upload of the same audio retries"""
+        if not self.cache_dir or result.get("error"):
+            return
+        path = self._cache_path(audio_hash, result["model_size"])
+        tmp_path = None
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # A temp file of its own: another process may be caching the same audio
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(result, f)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            # The transcript itself is fine; only the next upload misses the cache
+            print(f"[WARN] Could not cache transcript: {e}")
+            if tmp_path is not None and os.path.exists(tmp_path):
+                os.remove(tmp_path)
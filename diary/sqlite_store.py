@@ -0,0 +1,672 @@
+"""
+Embedded storage backend: SQLite for entries and graph, NumPy for embeddings
+"""
+
+import asyncio
+import os
+import sqlite3
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from diary.graph_processor import GraphProcessor
+from diary.locking import LockHeld
+from diary.metrics import timed
+from diary.segments import segment_id
+from diary.storage import DiaryStorage, encode_cursor, decode_cursor
+from diary.text_index import InvertedIndex
+from diary.vector_store import EmbeddingMatrix
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    id TEXT PRIMARY KEY,
+    title TEXT,
+    text TEXT,
+    timestamp TEXT NOT NULL,
+    audio_path TEXT,
+    image_path TEXT,
+    embedding_row INTEGER,
+    enrichment_status TEXT NOT NULL DEFAULT 'ready'
+);
+CREATE INDEX IF NOT EXISTS entry_timestamp ON entries (timestamp, id);
+
+CREATE TABLE IF NOT EXISTS tags (
+    entry_id TEXT NOT NULL REFERENCES entries(id) ON DELETE CASCADE,
+    name TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS tags_entry ON tags (entry_id);
+
+-- Concept, Entity, Keyword and RELATES_TO links extracted from entry text
+CREATE TABLE IF NOT EXISTS mentions (
+    entry_id TEXT NOT NULL REFERENCES entries(id) ON DELETE CASCADE,
+    kind TEXT NOT NULL,
+    name TEXT NOT NULL,
+    relation TEXT
+);
+CREATE INDEX IF NOT EXISTS mentions_name ON mentions (kind, name);
+CREATE INDEX IF NOT EXISTS mentions_entry ON mentions (entry_id);
+
+-- Entry-to-entry links: SHARES_CONCEPT, SHARES_KEYWORD, SHARES_ENTITY, SIMILAR_TO
+CREATE TABLE IF NOT EXISTS edges (
+    source TEXT NOT NULL REFERENCES entries(id) ON DELETE CASCADE,
+    target TEXT NOT NULL REFERENCES entries(id) ON DELETE CASCADE,
+    type TEXT NOT NULL,
+    weight REAL,
+    PRIMARY KEY (source, target, type)
+);
+CREATE INDEX IF NOT EXISTS edges_target ON edges (target);
+
+-- Searchable segments of long entries; embeddings live in the segment matrix
+CREATE TABLE IF NOT EXISTS segments (
+    id TEXT PRIMARY KEY,
+    entry_id TEXT NOT NULL REFERENCES entries(id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    text TEXT NOT NULL,
+    start_time REAL,
+    end_time REAL,
+    embedding_row INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS segments_entry ON segments (entry_id);
+"""
+
+ENTRY_COLUMNS = "id, title, text, timestamp, audio_path, image_path, enrichment_status"
+
+# (mention kind, edge type, minimum shared count) - same rules as the Neo4j backend
+SHARED_LINKS = [
+    ("concept", "SHARES_CONCEPT", 1),
+    ("keyword", "SHARES_KEYWORD", 2),
+    ("entity", "SHARES_ENTITY", 1),
+]
+
+
+class SQLiteDiaryDatabase(DiaryStorage):
+    """
+    Embedded diary store that needs no database server
+
+    Entries, tags and graph edges live in SQLite (WAL mode); embeddings live
+    in a memory-mapped NumPy matrix next to the database file (segment
+    embeddings in a second one). All SQLite work runs on one dedicated thread
+    so the event loop never blocks on disk.
+    """
+
+    def __init__(self):
+        self.path = os.getenv("SQLITE_PATH", "./data/diary.db")
+        self.conn: Optional[sqlite3.Connection] = None
+        self.graph_processor = GraphProcessor()
+        self.matrix = EmbeddingMatrix(self.path + ".embeddings")
+        self.segment_matrix = EmbeddingMatrix(self.path + ".segments")
+        self.fts_available = False
+        self.text_index: Optional[InvertedIndex] = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="diary-sqlite")
+
+        self.min_similarity = float(os.getenv("VECTOR_SEARCH_MIN_SIMILARITY", 0.5))
+        self.segment_overfetch = int(os.getenv("SEGMENT_SEARCH_OVERFETCH", 3))
+        self.similarity_top_k = int(os.getenv("SIMILARITY_TOP_K", 10))
+        self.similarity_threshold = float(os.getenv("SIMILARITY_THRESHOLD", 0.85))
+
+    async def _run(self, fn, *args):
+        """Run a blocking call on the SQLite thread"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, fn, *args)
+
+    async def connect(self):
+        """Open the database and embedding matrix"""
+        await self._run(self._connect_sync)
+        print(f"[OK] Opened SQLite diary store at {self.path}")
+
+    def _connect_sync(self):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("PRAGMA foreign_keys=ON")
+        self.conn.executescript(SCHEMA)
+
+        # Databases created before enrichment tracking lack the status column
+        columns = {row["name"] for row in self.conn.execute("PRAGMA table_info(entries)")}
+        if "enrichment_status" not in columns:
+            self.conn.execute(
+                "ALTER TABLE entries ADD COLUMN enrichment_status TEXT NOT NULL DEFAULT 'ready'"
+            )
+
+        # FTS5 gives persistent BM25 ranking; otherwise use the in-process index
+        try:
+            self.conn.execute(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS entries_fts USING fts5(id UNINDEXED, title, text)"
+            )
+            self.fts_available = True
+        except sqlite3.OperationalError:
+            self.fts_available = False
+            self.text_index = InvertedIndex()
+            for row in self.conn.execute("SELECT id, title, text FROM entries"):
+                self.text_index.add(row["id"], row["title"], row["text"])
+        self.conn.commit()
+
+        try:
+            self.matrix.open()
+            self.segment_matrix.open()
+        except LockHeld as e:
+            self.matrix.close()
+            self.conn.close()
+            self.conn = None
+            raise LockHeld(
+                f"{e}. The embedding matrix belongs to one process: stop the server before running "
+                "import or migration scripts, or import through POST /api/entries/bulk"
+            ) from e
+        self.matrix.load_ids([
+            (row["id"], row["embedding_row"])
+            for row in self.conn.execute(
+                "SELECT id, embedding_row FROM entries WHERE embedding_row IS NOT NULL"
+            )
+        ])
+        self.segment_matrix.load_ids([
+            (row["id"], row["embedding_row"])
+            for row in self.conn.execute("SELECT id, embedding_row FROM segments")
+        ])
+
+    async def close(self):
+        """Flush embeddings and close the database"""
+        if self.conn is not None:
+            await self._run(self._close_sync)
+        self._executor.shutdown(wait=True)
+
+    def _close_sync(self):
+        self.matrix.close()
+        self.segment_matrix.close()
+        self.conn.close()
+        self.conn = None
+
+    @timed("sqlite.create_entries")
+    async def create_entries(self, entries: List[Dict]) -> List[Dict]:
+        """Create a batch of entries in one SQLite transaction"""
+        rows = [self._entry_row(entry_data) for entry_data in entries]
+        if not rows:
+            return []
+        await self._run(self._create_entries_sync, rows)
+        return [
+            {
+                "id": row["id"],
+                "title": row["title"],
+                "text": row["text"],
+                "timestamp": row["timestamp"],
+                "audio_path": row["audio_path"],
+                "image_path": row["image_path"],
+                "tags": row["tags"],
+                "enrichment_status": row["enrichment_status"]
+            }
+            for row in rows
+        ]
+
+    @timed("sqlite.enrich_entry")
+    async def enrich_entry(self, entry_id: str, entry_data: Dict) -> bool:
+        """Store the enrichment results for a pending entry and mark it ready"""
+        row = self._entry_row({**entry_data, "id": entry_id})
+        return await self._run(self._enrich_entry_sync, row)
+
+    def _enrich_entry_sync(self, row: Dict) -> bool:
+        current = None
+        embedding_row = None
+        replaced_segments = []
+        try:
+            with self.conn:
+                current = self.conn.execute(
+                    "SELECT title, embedding_row FROM entries WHERE id = ?", (row["id"],)
+                ).fetchone()
+                if current is None:
+                    return False
+
+                embedding_row = current["embedding_row"]
+                if row["embedding"] is not None:
+                    if embedding_row is None:
+                        embedding_row = self.matrix.allocate()
+                    self.matrix.set(embedding_row, row["id"], row["embedding"])
+                row["embedding_row"] = embedding_row
+
+                self.conn.execute(
+                    "UPDATE entries SET text = ?, embedding_row = ?, enrichment_status = 'ready' WHERE id = ?",
+                    (row["text"], embedding_row, row["id"])
+                )
+                # Replace the graph so a retried enrichment does not duplicate it
+                self.conn.execute("DELETE FROM mentions WHERE entry_id = ?", (row["id"],))
+                self.conn.executemany(
+                    "INSERT INTO mentions (entry_id, kind, name, relation) VALUES (?, ?, ?, ?)",
+                    [(row["id"], kind, name, relation) for kind, name, relation in row["mentions"]]
+                )
+                if self.fts_available:
+                    self.conn.execute("DELETE FROM entries_fts WHERE id = ?", (row["id"],))
+                    self.conn.execute(
+                        "INSERT INTO entries_fts (id, title, text) VALUES (?, ?, ?)",
+                        (row["id"], current["title"], row["text"])
+                    )
+                replaced_segments = [
+                    segment["embedding_row"]
+                    for segment in self.conn.execute(
+                        "SELECT embedding_row FROM segments WHERE entry_id = ?", (row["id"],)
+                    )
+                ]
+                self.conn.execute("DELETE FROM segments WHERE entry_id = ?", (row["id"],))
+                self._insert_segments([row])
+
+                self._link_shared_concepts([row["id"]])
+                self._create_similarity_relationships([row])
+        except Exception:
+            if embedding_row is not None and current is not None and current["embedding_row"] is None:
+                self.matrix.release(embedding_row)
+            self._release_segments([row])
+            raise
+
+        for old_row in replaced_segments:
+            self.segment_matrix.release(old_row)
+
+        if self.text_index is not None:
+            self.text_index.remove(row["id"])
+            self.text_index.add(row["id"], current["title"], row["text"])
+        return True
+
+    @timed("sqlite.set_enrichment_status")
+    async def set_enrichment_status(self, entry_id: str, status: str) -> bool:
+        """Record an entry's enrichment status (e.g. "failed")"""
+        def update():
+            with self.conn:
+                cursor = self.conn.execute(
+                    "UPDATE entries SET enrichment_status = ? WHERE id = ?", (status, entry_id)
+                )
+            return cursor.rowcount > 0
+        return await self._run(update)
+
+    def _entry_row(self, entry_data: Dict) -> Dict:
+        """Normalise entry data and extract its graph (same limits as Neo4j)"""
+        embedding = entry_data.get("embedding")
+        if embedding is not None:
+            embedding = np.asarray(embedding, dtype=np.float32)
+            if not embedding.any():
+                embedding = None
+
+        entry_text = entry_data.get("text", "") or entry_data.get("title", "")
+        graph_data = entry_data.get("graph_data")
+        if graph_data is None:
+            graph_data = self.graph_processor.process_entry(entry_text)
+
+        mentions = (
+            [("concept", name, None) for name in graph_data.get("concepts", [])[:20]]
+            + [("entity", name, None) for name in graph_data.get("entities", [])[:10]]
+            + [("keyword", name, None) for name in graph_data.get("keywords", [])[:15]]
+            + [
+                ("relates_to", rel.get("object", "")[:50], rel.get("relation", "relates"))
+                for rel in graph_data.get("relationships", [])[:10]
+                if rel.get("object")
+            ]
+        )
+
+        entry_id = entry_data.get("id") or str(uuid.uuid4())
+        segments = [
+            {
+                "id": segment_id(entry_id, index),
+                "position": index,
+                "text": segment["text"],
+                "start": segment.get("start"),
+                "end": segment.get("end"),
+                "embedding": np.asarray(segment["embedding"], dtype=np.float32)
+            }
+            for index, segment in enumerate(entry_data.get("segments") or [])
+            if segment.get("embedding") is not None and np.any(segment["embedding"])
+        ]
+
+        return {
+            "id": entry_id,
+            "title": entry_data.get("title", "Untitled"),
+            "text": entry_data.get("text"),
+            "timestamp": entry_data.get("timestamp") or datetime.utcnow().isoformat(),
+            "audio_path": entry_data.get("audio_path"),
+            "image_path": entry_data.get("image_path"),
+            "tags": entry_data.get("tags", []),
+            "enrichment_status": entry_data.get("enrichment_status", "ready"),
+            "embedding": embedding,
+            "mentions": mentions,
+            "segments": segments
+        }
+
+    def _create_entries_sync(self, rows: List[Dict]):
+        allocated = []
+        try:
+            with self.conn:
+                for row in rows:
+                    embedding_row = None
+                    if row["embedding"] is not None:
+                        embedding_row = self.matrix.allocate()
+                        allocated.append(embedding_row)
+                        self.matrix.set(embedding_row, row["id"], row["embedding"])
+                    row["embedding_row"] = embedding_row
+
+                self.conn.executemany(
+                    f"INSERT INTO entries ({ENTRY_COLUMNS}, embedding_row) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    [
+                        (row["id"], row["title"], row["text"], row["timestamp"],
+                         row["audio_path"], row["image_path"], row["enrichment_status"],
+                         row["embedding_row"])
+                        for row in rows
+                    ]
+                )
+                self.conn.executemany(
+                    "INSERT INTO tags (entry_id, name) VALUES (?, ?)",
+                    [(row["id"], tag) for row in rows for tag in row["tags"]]
+                )
+                self.conn.executemany(
+                    "INSERT INTO mentions (entry_id, kind, name, relation) VALUES (?, ?, ?, ?)",
+                    [(row["id"], kind, name, relation) for row in rows for kind, name, relation in row["mentions"]]
+                )
+                if self.fts_available:
+                    self.conn.executemany(
+                        "INSERT INTO entries_fts (id, title, text) VALUES (?, ?, ?)",
+                        [(row["id"], row["title"], row["text"]) for row in rows]
+                    )
+                self._insert_segments(rows)
+
+                self._link_shared_concepts([row["id"] for row in rows])
+                self._create_similarity_relationships(rows)
+        except Exception:
+            for embedding_row in allocated:
+                self.matrix.release(embedding_row)
+            self._release_segments(rows)
+            raise
+
+        if self.text_index is not None:
+            for row in rows:
+                self.text_index.add(row["id"], row["title"], row["text"])
+
+    def _insert_segments(self, rows: List[Dict]):
+        """Store the rows' segments and their embeddings"""
+        for row in rows:
+            for segment in row["segments"]:
+                segment["embedding_row"] = self.segment_matrix.allocate()
+                self.segment_matrix.set(segment["embedding_row"], segment["id"], segment["embedding"])
+        self.conn.executemany(
+            "INSERT INTO segments (id, entry_id, position, text, start_time, end_time, embedding_row) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            [
+                (segment["id"], row["id"], segment["position"], segment["text"],
+                 segment["start"], segment["end"], segment["embedding_row"])
+                for row in rows for segment in row["segments"]
+            ]
+        )
+
+    def _release_segments(self, rows: List[Dict]):
+        """Free the segment matrix rows allocated for a failed write"""
+        for row in rows:
+            for segment in row["segments"]:
+                self.segment_matrix.release(segment.pop("embedding_row", None))
+
+    def _link_shared_concepts(self, entry_ids: List[str]):
+        """Link entries to other entries that share concepts, keywords, or entities"""
+        placeholders = ", ".join("?" * len(entry_ids))
+        for kind, edge_type, minimum in SHARED_LINKS:
+            self.conn.execute(
+                f"""
+                INSERT OR REPLACE INTO edges (source, target, type, weight)
+                SELECT m1.entry_id, m2.entry_id, ?, COUNT(*)
+                FROM mentions m1
+                JOIN mentions m2
+                  ON m2.kind = m1.kind AND m2.name = m1.name AND m2.entry_id <> m1.entry_id
+                WHERE m1.kind = ? AND m1.entry_id IN ({placeholders})
+                GROUP BY m1.entry_id, m2.entry_id
+                HAVING COUNT(*) >= ?
+                """,
+                [edge_type, kind, *entry_ids, minimum]
+            )
+
+    def _create_similarity_relationships(self, rows: List[Dict]):
+        """Symmetric SIMILAR_TO links to each new entry's top-k neighbours"""
+        if self.similarity_top_k <= 0:
+            return
+        edges = []
+        for row in rows:
+            if row["embedding_row"] is None:
+                continue
+            neighbours = self.matrix.search(
+                row["embedding"],
+                self.similarity_top_k,
+                self.similarity_threshold,
+                exclude_row=row["embedding_row"]
+            )
+            for neighbour_id, score, _ in neighbours:
+                edges.append((row["id"], neighbour_id, "SIMILAR_TO", score))
+                edges.append((neighbour_id, row["id"], "SIMILAR_TO", score))
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO edges (source, target, type, weight) VALUES (?, ?, ?, ?)",
+            edges
+        )
+
+    @timed("sqlite.delete_entry")
+    async def delete_entry(self, entry_id: str) -> bool:
+        """Delete an entry and its relationships"""
+        return await self._run(self._delete_entry_sync, entry_id)
+
+    def _delete_entry_sync(self, entry_id: str) -> bool:
+        with self.conn:
+            row = self.conn.execute(
+                "SELECT embedding_row FROM entries WHERE id = ?", (entry_id,)
+            ).fetchone()
+            if row is None:
+                return False
+            segment_rows = [
+                segment["embedding_row"]
+                for segment in self.conn.execute(
+                    "SELECT embedding_row FROM segments WHERE entry_id = ?", (entry_id,)
+                )
+            ]
+            self.conn.execute("DELETE FROM entries WHERE id = ?", (entry_id,))
+            if self.fts_available:
+                self.conn.execute("DELETE FROM entries_fts WHERE id = ?", (entry_id,))
+
+        self.matrix.release(row["embedding_row"])
+        for segment_row in segment_rows:
+            self.segment_matrix.release(segment_row)
+        if self.text_index is not None:
+            self.text_index.remove(entry_id)
+        return True
+
+    def _with_tags(self, rows: List[sqlite3.Row]) -> List[Dict]:
+        """Turn entry rows into dicts with their tags, keeping row order"""
+        entries = [dict(row) for row in rows]
+        if not entries:
+            return entries
+        tags = {entry["id"]: [] for entry in entries}
+        placeholders = ", ".join("?" * len(tags))
+        for tag in self.conn.execute(
+            f"SELECT entry_id, name FROM tags WHERE entry_id IN ({placeholders}) ORDER BY rowid",
+            list(tags)
+        ):
+            tags[tag["entry_id"]].append(tag["name"])
+        for entry in entries:
+            entry["tags"] = tags[entry["id"]]
+        return entries
+
+    async def get_all_entries(self, skip: int = 0, limit: int = 100) -> List[Dict]:
+        """Get all diary entries ordered by timestamp"""
+        def query():
+            rows = self.conn.execute(
+                f"SELECT {ENTRY_COLUMNS} FROM entries "
+                "ORDER BY timestamp DESC, id DESC LIMIT ? OFFSET ?",
+                (limit, skip)
+            ).fetchall()
+            return self._with_tags(rows)
+        return await self._run(query)
+
+    @timed("sqlite.get_entries_page")
+    async def get_entries_page(
+        self,
+        limit: int = 100,
+        cursor: Optional[str] = None,
+        start: Optional[str] = None,
+        end: Optional[str] = None,
+        status: Optional[str] = None
+    ) -> Tuple[List[Dict], Optional[str]]:
+        """Keyset-paginated entries on the (timestamp, id) index, newest first"""
+        conditions = []
+        params = []
+        if cursor:
+            cursor_ts, cursor_id = decode_cursor(cursor)
+            conditions.append("(timestamp < ? OR (timestamp = ? AND id < ?))")
+            params.extend([cursor_ts, cursor_ts, cursor_id])
+        if start:
+            conditions.append("timestamp >= ?")
+            params.append(start)
+        if end:
+            conditions.append("timestamp < ?")
+            params.append(end)
+        if status:
+            conditions.append("enrichment_status = ?")
+            params.append(status)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+        def query():
+            rows = self.conn.execute(
+                f"SELECT {ENTRY_COLUMNS} FROM entries {where} "
+                "ORDER BY timestamp DESC, id DESC LIMIT ?",
+                params + [limit]
+            ).fetchall()
+            return self._with_tags(rows)
+
+        entries = await self._run(query)
+        next_cursor = None
+        if len(entries) == limit:
+            next_cursor = encode_cursor(entries[-1]["timestamp"], entries[-1]["id"])
+        return entries, next_cursor
+
+    @timed("sqlite.get_entry")
+    async def get_entry_by_id(self, entry_id: str) -> Optional[Dict]:
+        """Get a specific entry by ID"""
+        entries = await self.get_entries_by_ids([entry_id])
+        return entries[0] if entries else None
+
+    @timed("sqlite.get_entries_by_ids")
+    async def get_entries_by_ids(self, entry_ids: List[str]) -> List[Dict]:
+        """Fetch entries by id, preserving the order of `entry_ids`"""
+        if not entry_ids:
+            return []
+        return await self._run(self._entries_by_ids_sync, entry_ids)
+
+    def _entries_by_ids_sync(self, entry_ids: List[str]) -> List[Dict]:
+        placeholders = ", ".join("?" * len(entry_ids))
+        rows = self.conn.execute(
+            f"SELECT {ENTRY_COLUMNS} FROM entries WHERE id IN ({placeholders})",
+            list(entry_ids)
+        ).fetchall()
+        position = {entry_id: i for i, entry_id in enumerate(entry_ids)}
+        rows.sort(key=lambda row: position[row["id"]])
+        return self._with_tags(rows)
+
+    @timed("sqlite.vector_search")
+    async def vector_search(self, query_embedding: np.ndarray, limit: int = 10) -> Tuple[List[Dict], str]:
+        """
+        Cosine similarity as one matrix-vector product over each embedding matrix
+
+        Entries matched through one of their segments carry it as "segment"
+        ({text, start, end, similarity}).
+        """
+        return await self._run(self._vector_search_sync, query_embedding, limit), "matrix"
+
+    def _vector_search_sync(self, query_embedding: np.ndarray, limit: int) -> List[Dict]:
+        scores = {
+            entry_id: score
+            for entry_id, score, _ in self.matrix.search(query_embedding, limit, self.min_similarity)
+        }
+
+        # Best segment per entry (hits come best first)
+        best_segments = {}
+        for seg_id, score, _ in self.segment_matrix.search(
+            query_embedding, limit * self.segment_overfetch, self.min_similarity
+        ):
+            entry_id = seg_id.rpartition(":")[0]
+            if entry_id not in best_segments:
+                best_segments[entry_id] = (seg_id, score)
+                scores[entry_id] = max(scores.get(entry_id, -1.0), score)
+        if not scores:
+            return []
+
+        ranked = sorted(scores, key=scores.get, reverse=True)[:limit]
+        segments = {}
+        seg_ids = [best_segments[entry_id][0] for entry_id in ranked if entry_id in best_segments]
+        if seg_ids:
+            placeholders = ", ".join("?" * len(seg_ids))
+            for segment in self.conn.execute(
+                f"SELECT entry_id, text, start_time, end_time FROM segments WHERE id IN ({placeholders})",
+                seg_ids
+            ):
+                segments[segment["entry_id"]] = {
+                    "text": segment["text"],
+                    "start": segment["start_time"],
+                    "end": segment["end_time"],
+                    "similarity": best_segments[segment["entry_id"]][1]
+                }
+
+        entries = self._entries_by_ids_sync(ranked)
+        for entry in entries:
+            entry["similarity"] = scores[entry["id"]]
+            entry["segment"] = segments.get(entry["id"])
+        return entries
+
+    @timed("sqlite.text_search")
+    async def text_search(self, query_text: str, limit: int = 10) -> List[Dict]:
+        """BM25-ranked keyword search through FTS5 or the in-process index"""
+        if not query_text or not query_text.strip():
+            return []
+
+        if self.fts_available:
+            # Quote each word so user input is never parsed as FTS syntax
+            match = " OR ".join('"' + word.replace('"', '""') + '"' for word in query_text.split())
+
+            def query():
+                return self.conn.execute(
+                    "SELECT id, bm25(entries_fts) AS rank FROM entries_fts "
+                    "WHERE entries_fts MATCH ? ORDER BY rank LIMIT ?",
+                    (match, limit)
+                ).fetchall()
+
+            # bm25() is lower-is-better; flip it so higher scores rank first
+            hits = [(row["id"], -row["rank"]) for row in await self._run(query)]
+        else:
+            hits = self.text_index.search(query_text, limit)
+
+        scores = dict(hits)
+        entries = await self.get_entries_by_ids([doc_id for doc_id, _ in hits])
+        for entry in entries:
+            entry["score"] = scores[entry["id"]]
+        return entries
+
+    def keyword_search_path(self) -> str:
+        """Name of the mechanism text_search currently uses"""
+        return "fts5" if self.fts_available else "bm25"
+
+    async def export_embeddings(self, batch_size: int = 5000):
+        """Stream (ids, embedding matrix) batches for every embedded entry"""
+        rows = await self._run(self.matrix.valid_rows)
+        for start in range(0, len(rows), batch_size):
+            batch = rows[start:start + batch_size]
+            ids = [self.matrix.ids[row] for row in batch]
+            yield ids, np.array(self.matrix.vectors[batch], dtype=np.float32)
+
+    async def replace_similarity_edges(self, edges: Iterable[Tuple[str, str, float]], batch_size: int = 5000) -> int:
+        """Replace all SIMILAR_TO links with the given undirected edges"""
+        edges = list(edges)
+
+        def write():
+            with self.conn:
+                self.conn.execute("DELETE FROM edges WHERE type = 'SIMILAR_TO'")
+                for start in range(0, len(edges), batch_size):
+                    batch = edges[start:start + batch_size]
+                    self.conn.executemany(
+                        "INSERT OR REPLACE INTO edges (source, target, type, weight) "
+                        "VALUES (?, ?, 'SIMILAR_TO', ?)",
+                        [(a, b, score) for a, b, score in batch] + [(b, a, score) for a, b, score in batch]
+                    )
+            return len(edges)
+
+        return await self._run(write)
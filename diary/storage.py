@@ -0,0 +1,139 @@
+"""
+Storage backend interface for diary entries
+"""
+
+import base64
+import json
+import os
+from abc import ABC, abstractmethod
+from typing import AsyncIterator, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+
+ENRICHMENT_STATUSES = ("pending", "ready", "failed")
+
+
+class DiaryStorage(ABC):
+    """
+    Interface implemented by every diary storage backend
+
+    Backends store entries with their tags, extracted graph (concepts,
+    entities, keywords, relationships), embeddings and SIMILAR_TO links.
+    Entry dicts use the EntryResponse fields.
+    """
+
+    @abstractmethod
+    async def connect(self):
+        """Open the store and set up its schema"""
+
+    @abstractmethod
+    async def close(self):
+        """Release connections and flush pending writes"""
+
+    async def create_entry(self, entry_data: Dict) -> Dict:
+        """Create a single entry (see create_entries)"""
+        entries = await self.create_entries([entry_data])
+        return entries[0]
+
+    @abstractmethod
+    async def create_entries(self, entries: List[Dict]) -> List[Dict]:
+        """
+        Create a batch of entries atomically
+
+        Each entry dict may carry an "embedding", a precomputed "graph_data",
+        an "id" chosen by the caller and an "enrichment_status" (default "ready").
+        """
+
+    @abstractmethod
+    async def enrich_entry(self, entry_id: str, entry_data: Dict) -> bool:
+        """
+        Complete an entry created as "pending"
+
+        entry_data carries the final "text", "embedding" and "graph_data". The
+        graph and SHARES_* / SIMILAR_TO links are written and the entry is marked
+        "ready". Returns False if the entry does not exist.
+        """
+
+    @abstractmethod
+    async def set_enrichment_status(self, entry_id: str, status: str) -> bool:
+        """Set an entry's enrichment status; False if it does not exist"""
+
+    @abstractmethod
+    async def get_all_entries(self, skip: int = 0, limit: int = 100) -> List[Dict]:
+        """Entries ordered newest first, offset-paginated"""
+
+    @abstractmethod
+    async def get_entries_page(
+        self,
+        limit: int = 100,
+        cursor: Optional[str] = None,
+        start: Optional[str] = None,
+        end: Optional[str] = None,
+        status: Optional[str] = None
+    ) -> Tuple[List[Dict], Optional[str]]:
+        """Keyset-paginated entries, newest first, and the next page's cursor"""
+
+    @abstractmethod
+    async def get_entry_by_id(self, entry_id: str) -> Optional[Dict]:
+        """A single entry, or None"""
+
+    @abstractmethod
+    async def get_entries_by_ids(self, entry_ids: List[str]) -> List[Dict]:
+        """Entries by id, in the order given"""
+
+    async def semantic_search(self, query_embedding: np.ndarray, limit: int = 10) -> List[Dict]:
+        """Entries most similar to the query embedding"""
+        entries, _ = await self.vector_search(query_embedding, limit)
+        return entries
+
+    @abstractmethod
+    async def vector_search(self, query_embedding: np.ndarray, limit: int = 10) -> Tuple[List[Dict], str]:
+        """Semantic search returning entries (with "similarity") and the path used"""
+
+    @abstractmethod
+    async def text_search(self, query_text: str, limit: int = 10) -> List[Dict]:
+        """Relevance-ranked keyword search; entries carry a "score\""""
+
+    def keyword_search_path(self) -> str:
+        """Name of the mechanism text_search currently uses"""
+        return "keyword"
+
+    @abstractmethod
+    async def delete_entry(self, entry_id: str) -> bool:
+        """Delete an entry and its links; False if it did not exist"""
+
+    @abstractmethod
+    def export_embeddings(self, batch_size: int = 5000) -> AsyncIterator[Tuple[List[str], np.ndarray]]:
+        """Stream (ids, embedding matrix) batches for every embedded entry"""
+
+    @abstractmethod
+    async def replace_similarity_edges(self, edges: Iterable[Tuple[str, str, float]], batch_size: int = 5000) -> int:
+        """Replace all SIMILAR_TO links with the given undirected edges"""
+
+
+def create_database() -> DiaryStorage:
+    """Build the storage backend selected by the DIARY_BACKEND env var"""
+    backend = os.getenv("DIARY_BACKEND", "neo4j").lower()
+    if backend == "neo4j":
+        from diary.database import DiaryDatabase
+        return DiaryDatabase()
+    if backend == "sqlite":
+        from diary.sqlite_store import SQLiteDiaryDatabase
+        return SQLiteDiaryDatabase()
+    raise ValueError(f"Unknown DIARY_BACKEND '{backend}' (expected 'neo4j' or 'sqlite')")
+
+
+def encode_cursor(timestamp: str, entry_id: str) -> str:
+    """Opaque pagination cursor for the (timestamp, id) position"""
+    raw = json.dumps([timestamp, entry_id]).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii")
+
+
+def decode_cursor(cursor: str) -> Tuple[str, str]:
+    """Inverse of encode_cursor; raises ValueError on malformed cursors"""
+    try:
+        timestamp, entry_id = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        return str(timestamp), str(entry_id)
+    except Exception:
+        raise ValueError("Invalid pagination cursor")
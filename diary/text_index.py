@@ -0,0 +1,82 @@
+"""
+In-process inverted index with BM25 ranking for keyword search
+"""
+
+import heapq
+import math
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+from diary.graph_processor import GraphProcessor, tokenize
+
+
+class InvertedIndex:
+    """
+    BM25-ranked keyword index over entry titles and text
+
+    Used when the database has no full-text index. Documents are added and
+    removed incrementally, and a query only touches the posting lists of its
+    own terms, so latency does not grow with the number of entries.
+    """
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.postings: Dict[str, Dict[str, int]] = {}
+        self.doc_terms: Dict[str, Counter] = {}
+        self.doc_lengths: Dict[str, int] = {}
+        self.total_length = 0
+
+    @staticmethod
+    def analyze(text: Optional[str]) -> List[str]:
+        """Tokenize with the GraphProcessor tokenizer, dropping stop words"""
+        return [token for token in tokenize(text) if token not in GraphProcessor.STOP_WORDS]
+
+    def add(self, doc_id: str, title: Optional[str], text: Optional[str]):
+        """Index (or re-index) a document"""
+        if doc_id in self.doc_terms:
+            self.remove(doc_id)
+
+        tokens = self.analyze(title) + self.analyze(text)
+        terms = Counter(tokens)
+        self.doc_terms[doc_id] = terms
+        self.doc_lengths[doc_id] = len(tokens)
+        self.total_length += len(tokens)
+        for term, frequency in terms.items():
+            self.postings.setdefault(term, {})[doc_id] = frequency
+
+    def remove(self, doc_id: str):
+        """Drop a document from the index"""
+        terms = self.doc_terms.pop(doc_id, None)
+        if terms is None:
+            return
+        self.total_length -= self.doc_lengths.pop(doc_id)
+        for term in terms:
+            posting = self.postings.get(term)
+            if posting is not None:
+                posting.pop(doc_id, None)
+                if not posting:
+                    del self.postings[term]
+
+    def search(self, query: str, limit: int = 10) -> List[Tuple[str, float]]:
+        """Return (doc_id, BM25 score) pairs for the best matching documents"""
+        query_terms = set(self.analyze(query))
+        n = len(self.doc_terms)
+        if not query_terms or n == 0:
+            return []
+
+        avg_length = self.total_length / n if self.total_length else 1.0
+        scores: Dict[str, float] = {}
+        for term in query_terms:
+            posting = self.postings.get(term)
+            if not posting:
+                continue
+            idf = math.log(1 + (n - len(posting) + 0.5) / (len(posting) + 0.5))
+            for doc_id, frequency in posting.items():
+                norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[doc_id] / avg_length)
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * frequency * (self.k1 + 1) / (frequency + norm)
+
+        return heapq.nlargest(limit, scores.items(), key=lambda item: item[1])
+
+    def __len__(self):
+        return len(self.doc_terms)
@@ -0,0 +1,142 @@
+"""
+Memory-mapped embedding matrix for the embedded storage backend
+"""
+
+import os
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from diary.locking import OwnerLock
+
+
+class EmbeddingMatrix:
+    """
+    Unit-normalised float32 embeddings in a growable memory-mapped file
+
+    Each embedded entry owns one row; rows freed by deletes are reused.
+    Similarity search is a single matrix-vector product over the used rows.
+    The row -> entry id mapping is owned by the caller (it lives in the
+    database) and handed over with load_ids(). Free rows are tracked in
+    memory, so open() takes an owner lock (`<path>.lock`) and raises
+    LockHeld if another process has the matrix open.
+    """
+
+    def __init__(self, path: str, dim: int = 384, initial_capacity: int = 1024):
+        self.path = path
+        self.dim = dim
+        self.initial_capacity = initial_capacity
+        self.vectors = None
+        self.capacity = 0
+        self.size = 0  # high-water mark of used rows
+        self.ids: List[Optional[str]] = []
+        self.valid = np.zeros(0, dtype=bool)
+        self.free_rows: List[int] = []
+        self.lock = OwnerLock(path + ".lock")
+
+    def open(self):
+        """Open the matrix file, creating it if needed"""
+        self.lock.acquire()
+        row_bytes = self.dim * 4
+        if os.path.exists(self.path) and os.path.getsize(self.path) >= row_bytes:
+            capacity = os.path.getsize(self.path) // row_bytes
+        else:
+            capacity = self.initial_capacity
+            with open(self.path, "wb") as f:
+                f.truncate(capacity * row_bytes)
+        self._map(capacity)
+
+    def _map(self, capacity: int):
+        self.vectors = np.memmap(self.path, dtype=np.float32, mode="r+", shape=(capacity, self.dim))
+        self.capacity = capacity
+        self.ids.extend([None] * (capacity - len(self.ids)))
+        valid = np.zeros(capacity, dtype=bool)
+        valid[:len(self.valid)] = self.valid
+        self.valid = valid
+
+    def _grow(self):
+        """Double the file size and remap it"""
+        self.vectors.flush()
+        new_capacity = max(self.capacity * 2, self.initial_capacity)
+        self.vectors = None
+        with open(self.path, "r+b") as f:
+            f.truncate(new_capacity * self.dim * 4)
+        self._map(new_capacity)
+
+    def load_ids(self, rows: List[Tuple[str, int]]):
+        """Register the (entry_id, row) pairs stored in the database"""
+        for entry_id, row in rows:
+            while row >= self.capacity:
+                self._grow()
+            self.ids[row] = entry_id
+            self.valid[row] = True
+        self.size = max((row + 1 for _, row in rows), default=0)
+        self.free_rows = [row for row in range(self.size) if not self.valid[row]]
+
+    def allocate(self) -> int:
+        """Reserve a row for a new embedding"""
+        if self.free_rows:
+            return self.free_rows.pop()
+        if self.size >= self.capacity:
+            self._grow()
+        self.size += 1
+        return self.size - 1
+
+    def set(self, row: int, entry_id: str, vector: np.ndarray):
+        """Store the normalised vector in row"""
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        self.vectors[row] = vector / norm if norm > 0 else vector
+        self.ids[row] = entry_id
+        self.valid[row] = True
+
+    def release(self, row: int):
+        """Free a row (on delete or failed write)"""
+        if row is None or row >= self.size or row in self.free_rows:
+            return
+        self.vectors[row] = 0
+        self.ids[row] = None
+        self.valid[row] = False
+        self.free_rows.append(row)
+
+    def search(
+        self,
+        query: np.ndarray,
+        limit: int,
+        min_similarity: float = -1.0,
+        exclude_row: Optional[int] = None
+    ) -> List[Tuple[str, float, int]]:
+        """(entry_id, cosine similarity, row) for the most similar rows, best first"""
+        if self.size == 0 or limit <= 0:
+            return []
+        query = np.asarray(query, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if norm == 0:
+            return []
+
+        scores = self.vectors[:self.size] @ (query / norm)
+        scores[~self.valid[:self.size]] = -np.inf
+        if exclude_row is not None and exclude_row < self.size:
+            scores[exclude_row] = -np.inf
+
+        k = min(limit, self.size)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [
+            (self.ids[row], float(scores[row]), int(row))
+            for row in top
+            if scores[row] > min_similarity and np.isfinite(scores[row])
+        ]
+
+    def valid_rows(self) -> np.ndarray:
+        """Indices of rows holding an embedding"""
+        return np.flatnonzero(self.valid[:self.size])
+
+    def flush(self):
+        if self.vectors is not None:
+            self.vectors.flush()
+
+    def close(self):
+        """Flush and give up ownership of the matrix"""
+        self.flush()
+        self.lock.release()
@@ -0,0 +1,107 @@
+"""
+Export the bundled embedding model to ONNX and verify it against torch
+
+Writes <bundle>/onnx/model.onnx (and model.int8.onnx with --quantize), then
+embeds sample texts with both the torch model and each ONNX model and
+checks that every pair of vectors agrees to within --tolerance cosine
+similarity. Stored embeddings were made by the torch model, so passing the
+check means the ONNX backend can search them. --entries adds the text of
+that many stored entries to the samples. The bundle manifest is rewritten to
+include the exported files. --verify-only skips the export.
+
+Usage: python export_onnx.py --model-dir ./models/all-MiniLM-L6-v2 [--quantize] [--entries 200]
+"""
+import argparse
+import asyncio
+import os
+import sys
+from dotenv import load_dotenv
+
+load_dotenv()
+
+import numpy as np
+
+from diary.model_bundle import read_manifest, write_manifest
+from diary.onnx_encoder import OnnxEncoder, export_onnx, onnx_model_path, quantize_onnx
+
+SAMPLES = [
+    "Went hiking with Sarah this morning, the view from the ridge was incredible.",
+    "Feeling anxious about the project deadline at work.",
+    "Dinner with my parents. Dad told the story about his first car again.",
+    "short",
+    "I finally finished reading the book my sister gave me for my birthday, and I "
+    "keep thinking about the ending and what it says about forgiveness and family. " * 6,
+]
+
+
+async def entry_texts(limit: int) -> list:
+    """Text of up to `limit` stored entries"""
+    from diary.storage import create_database
+
+    db = create_database()
+    await db.connect()
+    try:
+        texts = []
+        cursor = None
+        while len(texts) < limit:
+            entries, cursor = await db.get_entries_page(min(500, limit), cursor, None, None, None)
+            texts.extend(entry["text"] for entry in entries if entry.get("text"))
+            if not cursor:
+                break
+        return texts[:limit]
+    finally:
+        await db.close()
+
+
+def agreement(reference: np.ndarray, candidate: np.ndarray) -> np.ndarray:
+    """Cosine similarity of each pair of rows"""
+    dot = np.sum(reference * candidate, axis=1)
+    norms = np.linalg.norm(reference, axis=1) * np.linalg.norm(candidate, axis=1)
+    return dot / np.maximum(norms, 1e-12)
+
+
+def run(args) -> bool:
+    if not args.verify_only:
+        print(f"[OK] Exported {export_onnx(args.model_dir, args.opset)}")
+        if args.quantize:
+            print(f"[OK] Quantized {quantize_onnx(args.model_dir)}")
+        write_manifest(args.model_dir, read_manifest(args.model_dir)["model_name"])
+        print("[OK] Bundle manifest updated")
+
+    texts = list(SAMPLES)
+    if args.entries:
+        texts.extend(asyncio.run(entry_texts(args.entries)))
+
+    from sentence_transformers import SentenceTransformer
+    reference = SentenceTransformer(args.model_dir, device="cpu").encode(texts, convert_to_numpy=True)
+
+    passed = True
+    for quantized in (False, True):
+        if not os.path.exists(onnx_model_path(args.model_dir, quantized)):
+            continue
+        label = "int8" if quantized else "float32"
+        tolerance = args.tolerance if args.tolerance is not None else (0.98 if quantized else 0.9999)
+        candidate = OnnxEncoder(args.model_dir, quantized=quantized).encode(texts)
+        cosine = agreement(reference, candidate)
+        ok = bool(cosine.min() >= tolerance)
+        passed &= ok
+        print(
+            f"[{'OK' if ok else 'ERROR'}] ONNX {label}: cosine to torch min {cosine.min():.5f}, "
+            f"mean {cosine.mean():.5f} over {len(texts)} texts (tolerance {tolerance})"
+        )
+    return passed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export the embedding model to ONNX and verify it")
+    parser.add_argument("--model-dir", default=os.getenv("EMBED_MODEL_DIR"), help="Model bundle (see bundle_model.py)")
+    parser.add_argument("--quantize", action="store_true", help="Also write an int8 dynamically quantized model")
+    parser.add_argument("--verify-only", action="store_true", help="Compare existing exports without re-exporting")
+    parser.add_argument("--entries", type=int, default=0, help="Also compare on the text of this many stored entries")
+    parser.add_argument("--tolerance", type=float, default=None,
+                        help="Minimum cosine similarity to torch (default 0.9999 float32, 0.98 int8)")
+    parser.add_argument("--opset", type=int, default=14, help="ONNX opset version")
+    args = parser.parse_args()
+    if not args.model_dir:
+        parser.error("--model-dir (or EMBED_MODEL_DIR) is required")
+    sys.exit(0 if run(args) else 1)
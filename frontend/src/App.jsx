@@ -7,9 +7,11 @@ import SearchPanel from './components/SearchPanel'
 import './App.css'
 
 const API_URL = '/api'
+const PAGE_SIZE = 50
 
 function App() {
   const [entries, setEntries] = useState([])
+  const [nextCursor, setNextCursor] = useState(null)
   const [loading, setLoading] = useState(false)
   const [showForm, setShowForm] = useState(false)
   const [showSearch, setShowSearch] = useState(false)
@@ -19,11 +21,19 @@ function App() {
     loadEntries()
   }, [])
 
+  useEffect(() => {
+    // Saved entries are transcribed and linked in the background; refresh until they are ready
+    if (!entries.some(entry => entry.enrichment_status === 'pending')) return
+    const timer = setTimeout(loadEntries, 3000)
+    return () => clearTimeout(timer)
+  }, [entries])
+
   const loadEntries = async () => {
     try {
       setLoading(true)
-      const response = await axios.get(`${API_URL}/entries`)
-      setEntries(response.data)
+      const response = await axios.get(`${API_URL}/entries`, { params: { limit: PAGE_SIZE } })
+      setEntries(response.data.entries)
+      setNextCursor(response.data.next_cursor)
     } catch (error) {
       console.error('Error loading entries:', error)
     } finally {
@@ -31,6 +41,19 @@ function App() {
     }
   }
 
+  const loadMoreEntries = async () => {
+    if (!nextCursor) return
+    try {
+      const response = await axios.get(`${API_URL}/entries`, {
+        params: { limit: PAGE_SIZE, cursor: nextCursor }
+      })
+      setEntries(current => [...current, ...response.data.entries])
+      setNextCursor(response.data.next_cursor)
+    } catch (error) {
+      console.error('Error loading more entries:', error)
+    }
+  }
+
   const handleNewEntry = async (formData) => {
     try {
       setLoading(true)
@@ -129,11 +152,20 @@ function App() {
             {loading ? (
               <div className="loading">Loading...</div>
             ) : (
-              <EntryList 
-                entries={entries} 
-                onDelete={handleDelete}
-                onRefresh={loadEntries}
-              />
+              <>
+                <EntryList 
+                  entries={entries} 
+                  onDelete={handleDelete}
+                  onRefresh={loadEntries}
+                />
+                {nextCursor && (
+                  <div className="nav-buttons" style={{ justifyContent: 'center', marginTop: '1.5rem' }}>
+                    <button className="btn btn-secondary" onClick={loadMoreEntries}>
+                      Load more
+                    </button>
+                  </div>
+                )}
+              </>
             )}
           </>
         )}
@@ -2,8 +2,15 @@ import React from 'react'
 import { format } from 'date-fns'
 import { Trash2, Clock, Image, Mic } from 'lucide-react'
 
+function formatTime(seconds) {
+  const minutes = Math.floor(seconds / 60)
+  return `${minutes}:${String(Math.floor(seconds % 60)).padStart(2, '0')}`
+}
+
 function EntryCard({ entry, onDelete }) {
   const hasMedia = entry.image_path || entry.audio_path
+  const segment = entry.segment
+  const timed = segment && segment.start != null
 
   return (
     <div className="card entry-card">
@@ -32,16 +39,26 @@ function EntryCard({ entry, onDelete }) {
         <p className="entry-text">{entry.text}</p>
       )}
 
+      {segment && (
+        <p className="entry-segment">
+          {timed && <span className="segment-time">{formatTime(segment.start)}–{formatTime(segment.end)}</span>}
+          “{segment.text}”
+        </p>
+      )}
+
       {hasMedia && (
         <div className="entry-media">
           {entry.image_path && (
             <div className="media-item">
               <Image size={20} />
-              <img 
-                src={`http://localhost:8000/${entry.image_path}`} 
-                alt="Entry image"
-                style={{ maxWidth: '200px', borderRadius: '0.5rem', marginTop: '0.5rem' }}
-              />
+              <a href={`http://localhost:8000/${entry.image_path}`} target="_blank" rel="noreferrer">
+                <img 
+                  src={`http://localhost:8000/${entry.image_path}?variant=thumb`} 
+                  alt="Entry image"
+                  loading="lazy"
+                  style={{ maxWidth: '200px', borderRadius: '0.5rem', marginTop: '0.5rem' }}
+                />
+              </a>
             </div>
           )}
           
@@ -50,7 +67,7 @@ function EntryCard({ entry, onDelete }) {
               <Mic size={20} />
               <audio 
                 controls 
-                src={`http://localhost:8000/${entry.audio_path}`}
+                src={`http://localhost:8000/${entry.audio_path}${timed ? `#t=${segment.start}` : ''}`}
                 style={{ marginTop: '0.5rem', width: '100%' }}
               />
             </div>
@@ -61,6 +78,12 @@ function EntryCard({ entry, onDelete }) {
       <div className="entry-footer">
         <Clock size={14} />
         <span>{format(new Date(entry.timestamp), 'PPp')}</span>
+        {entry.enrichment_status === 'pending' && (
+          <span className="enrichment-status">Processing…</span>
+        )}
+        {entry.enrichment_status === 'failed' && (
+          <span className="enrichment-status">Processing failed</span>
+        )}
         {entry.similarity_score && (
           <span className="similarity">
             Match: {(entry.similarity_score * 100).toFixed(1)}%
@@ -0,0 +1,144 @@
+"""
+Import existing journals into the diary
+
+Walks a directory of text files (.txt, .md), photos and voice memos and
+imports each file as an entry. Entries are embedded and written in batches,
+and progress is checkpointed so an interrupted import can be resumed by
+running the same command again.
+
+Usage: python import_entries.py <directory> [--batch-size 100] [--tags journal]
+"""
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import time
+from datetime import datetime
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from diary.storage import create_database
+from diary.embeddings import EmbeddingService
+from diary.speech import SpeechProcessor
+from diary.image import ImageProcessor
+from diary.ingest import BulkIngestor
+
+TEXT_EXTENSIONS = {".txt", ".md"}
+AUDIO_EXTENSIONS = {".mp3", ".wav", ".m4a", ".ogg"}
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".gif", ".webp"}
+
+
+def load_checkpoint(path: str) -> set:
+    """Return the set of files already imported"""
+    if not os.path.exists(path):
+        return set()
+    with open(path, "r", encoding="utf-8") as f:
+        return set(json.load(f).get("done", []))
+
+
+def save_checkpoint(path: str, done: set):
+    """Atomically write the checkpoint file"""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"done": sorted(done)}, f)
+    os.replace(tmp_path, path)
+
+
+def find_files(root: str) -> list:
+    """List importable files under root, relative to it, in a stable order"""
+    supported = TEXT_EXTENSIONS | AUDIO_EXTENSIONS | IMAGE_EXTENSIONS
+    files = []
+    for dirpath, _, filenames in os.walk(root):
+        for filename in filenames:
+            if os.path.splitext(filename)[1].lower() in supported:
+                files.append(os.path.relpath(os.path.join(dirpath, filename), root))
+    return sorted(files)
+
+
+def build_item(root: str, rel_path: str, tags: list) -> dict:
+    """Build an import item for one file, copying media into uploads/"""
+    path = os.path.join(root, rel_path)
+    ext = os.path.splitext(rel_path)[1].lower()
+    item = {
+        "source": rel_path,
+        "title": os.path.splitext(os.path.basename(rel_path))[0],
+        "timestamp": datetime.utcfromtimestamp(os.path.getmtime(path)).isoformat(),
+        "tags": tags
+    }
+
+    if ext in TEXT_EXTENSIONS:
+        with open(path, "r", encoding="utf-8", errors="replace") as f:
+            item["text"] = f.read()
+    else:
+        media_path = os.path.join("uploads", "imported", rel_path)
+        os.makedirs(os.path.dirname(media_path), exist_ok=True)
+        shutil.copy2(path, media_path)
+        key = "audio_path" if ext in AUDIO_EXTENSIONS else "image_path"
+        item[key] = media_path
+
+    return item
+
+
+async def run_import(args):
+    checkpoint = args.checkpoint or os.path.join(args.directory, ".diary_import.json")
+    done = load_checkpoint(checkpoint)
+    files = find_files(args.directory)
+    pending = [f for f in files if f not in done]
+    tags = [tag.strip() for tag in args.tags.split(",")] if args.tags else []
+
+    print(f"Found {len(files)} files, {len(done)} already imported, {len(pending)} to go")
+    if not pending:
+        return
+
+    db = create_database()
+    await db.connect()
+    embeddings = EmbeddingService()
+    await embeddings.load_model()
+    ingestor = BulkIngestor(
+        db,
+        embeddings,
+        SpeechProcessor(),
+        ImageProcessor(),
+        batch_size=args.batch_size,
+        workers=args.workers
+    )
+
+    started = time.time()
+
+    def on_batch(items, created):
+        done.update(item["source"] for item in items)
+        save_checkpoint(checkpoint, done)
+        imported = len(done) - (len(files) - len(pending))
+        rate = imported / max(time.time() - started, 1e-6)
+        print(f"[INFO] {imported}/{len(pending)} files imported ({rate:.1f} files/s)")
+
+    def items():
+        for rel_path in pending:
+            try:
+                yield build_item(args.directory, rel_path, tags)
+            except Exception as e:
+                print(f"[WARN] Skipping {rel_path}: {e}")
+
+    try:
+        stats = await ingestor.ingest(items(), on_batch=on_batch)
+    finally:
+        ingestor.close()
+        await db.close()
+
+    print(f"[OK] Imported {stats['created']} entries in {time.time() - started:.1f}s")
+    if stats["failed"]:
+        print(f"[WARN] {stats['failed']} entries failed, re-run to retry them")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bulk import journal files into the diary")
+    parser.add_argument("directory", help="Directory containing text files, photos and voice memos")
+    parser.add_argument("--batch-size", type=int, default=int(os.getenv("INGEST_BATCH_SIZE", 100)),
+                        help="Entries per embedding batch and database transaction")
+    parser.add_argument("--workers", type=int, default=None, help="Graph extraction processes")
+    parser.add_argument("--tags", default="", help="Comma-separated tags added to every entry")
+    parser.add_argument("--checkpoint", default=None,
+                        help="Checkpoint file (default: <directory>/.diary_import.json)")
+    asyncio.run(run_import(parser.parse_args()))
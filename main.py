@@ -3,26 +3,41 @@ Personal Semantic Diary - Main Application
 FastAPI backend for multi-modal diary entries with semantic search
 """
 
-from fastapi import FastAPI, File, UploadFile, HTTPException, Form
+from fastapi import FastAPI, File, UploadFile, HTTPException, Form, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse, FileResponse
-from fastapi.staticfiles import StaticFiles
+from fastapi.responses import JSONResponse, FileResponse, Response, StreamingResponse
+import aiofiles
 import uvicorn
 from datetime import datetime
 from typing import List, Optional
 import os
-import aiofiles
+import time
+import json
+import mimetypes
 from dotenv import load_dotenv
 
 # Load environment variables
 load_dotenv()
 
-from diary.database import DiaryDatabase
-from diary.models import EntryCreate, EntryResponse, SearchQuery
+from diary.storage import create_database, ENRICHMENT_STATUSES
+from diary.models import EntryCreate, EntryResponse, EntryPage, SearchQuery
 from diary.embeddings import EmbeddingService
-from diary.speech import SpeechProcessor
+from diary.speech import MODEL_SIZES, SpeechProcessor
 from diary.image import ImageProcessor
 from diary.graph_processor import GraphProcessor
+from diary.ingest import BulkIngestor
+from diary.enrichment import EnrichmentWorker
+from diary.media import (
+    IMAGE_EXTENSIONS, MediaPathCache, MediaStore, UploadTooLarge,
+    is_content_addressed, not_modified, parse_range, validators
+)
+from diary.derived import VARIANTS, DerivedMediaCache
+from diary.retrieval import HybridRetriever
+from diary import metrics
+from diary.executors import Overloaded, request_deadline, request_priority, stage_stats, shutdown_stages
+from diary.model_server import (
+    ModelClient, ModelServerError, RemoteEmbeddingService, RemoteImageProcessor, RemoteSpeechProcessor
+)
 
 # Initialize FastAPI app
 app = FastAPI(
@@ -40,32 +55,128 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Initialize services
-db = DiaryDatabase()
-embeddings = EmbeddingService()
-speech_processor = SpeechProcessor()
-image_processor = ImageProcessor()
+# Requests without an X-Request-Deadline-Ms header get this much time
+REQUEST_DEADLINE_MS = int(os.getenv("REQUEST_DEADLINE_MS", 10000))
+BULK_PATHS = ("/api/entries/bulk",)
+
 
-# Mount uploads directory
-os.makedirs("uploads", exist_ok=True)
-app.mount("/uploads", StaticFiles(directory="uploads"), name="uploads")
+@app.middleware("http")
+async def admission_context(request: Request, call_next):
+    """
+    Set the priority lane and deadline the stage executors admit this request by
+
+    Bulk imports go in the bulk lane with no deadline; everything else is
+    interactive and gets the client's deadline, or REQUEST_DEADLINE_MS.
+    """
+    if request.url.path in BULK_PATHS:
+        request_priority.set("bulk")
+        request_deadline.set(None)
+    else:
+        request_priority.set("interactive")
+        header = request.headers.get("x-request-deadline-ms")
+        try:
+            budget_ms = int(header) if header else REQUEST_DEADLINE_MS
+        except ValueError:
+            budget_ms = REQUEST_DEADLINE_MS
+        request_deadline.set(time.monotonic() + budget_ms / 1000 if budget_ms > 0 else None)
+    return await call_next(request)
+
+
+# Per-request span times in a Server-Timing header (browser dev tools show them)
+SERVER_TIMING = os.getenv("SERVER_TIMING", "1") == "1"
+HTTP_SECONDS = metrics.REGISTRY.histogram(
+    "diary_http_request_seconds", "HTTP request duration", ("method", "handler", "status")
+)
+HTTP_IN_FLIGHT = metrics.REGISTRY.gauge("diary_http_requests_in_flight", "HTTP requests being handled")
+
+
+@app.middleware("http")
+async def instrument_requests(request: Request, call_next):
+    """
+    Time each request and collect the spans it runs for Server-Timing
+    
+    Requests are labelled by handler function rather than path, so entry
+    ids do not multiply the series. Registered after admission_context, so
+    it wraps it and times the whole request.
+    """
+    if not metrics.ENABLED:
+        return await call_next(request)
+    timings = {}
+    metrics.request_timings.set(timings)
+    HTTP_IN_FLIGHT.inc()
+    started = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+    finally:
+        elapsed = time.perf_counter() - started
+        HTTP_IN_FLIGHT.dec()
+        endpoint = request.scope.get("endpoint")
+        handler = endpoint.__name__ if endpoint is not None else "unmatched"
+        HTTP_SECONDS.observe((request.method, handler, str(status)), elapsed)
+    if SERVER_TIMING:
+        response.headers["Server-Timing"] = metrics.server_timing(timings, elapsed * 1000)
+    return response
+
+
+@app.exception_handler(Overloaded)
+async def overloaded_handler(request: Request, exc: Overloaded):
+    """429 for a full stage queue, 503 for a deadline that cannot be met"""
+    return JSONResponse(
+        status_code=exc.status_code,
+        content={"detail": str(exc), "stage": exc.stage},
+        headers={"Retry-After": str(exc.retry_after)}
+    )
+
+
+# Initialize services
+db = create_database()
+model_client = None
+if os.getenv("MODEL_SERVER_SOCKET"):
+    # Started by serve.py: the models live in the shared model-server process
+    model_client = ModelClient(os.getenv("MODEL_SERVER_SOCKET"))
+    embeddings = RemoteEmbeddingService(model_client)
+    speech_processor = RemoteSpeechProcessor(model_client)
+    image_processor = RemoteImageProcessor(model_client)
+else:
+    embeddings = EmbeddingService()
+    speech_processor = SpeechProcessor()
+    image_processor = ImageProcessor()
+ingestor = BulkIngestor(db, embeddings, speech_processor, image_processor)
+enrichment = EnrichmentWorker(db, ingestor)
+media_store = MediaStore("uploads")
+derived_media = DerivedMediaCache()
+media_paths = MediaPathCache(int(os.getenv("MEDIA_PATH_CACHE_SIZE", 1024)))
+retriever = HybridRetriever(db, embeddings)
 
 
 @app.on_event("startup")
 async def startup_event():
-    """Initialize database connection and embeddings"""
+    """
+    Initialize database connection and start warming the embedding model
+    
+    The model loads in the background, so list, keyword and media requests
+    are served straight away; /ready reports when it is warm.
+    """
     await db.connect()
-    try:
-        await embeddings.load_model()
-    except Exception as e:
-        print(f"[WARN] Could not load embedding model: {e}")
-        print("[INFO] App will start but semantic search will use basic keyword matching")
+    embeddings.start_warmup()
+    await enrichment.start()
     print("[OK] Backend services initialized")
 
 
 @app.on_event("shutdown")
 async def shutdown_event():
     """Clean up on shutdown"""
+    await enrichment.close()
+    ingestor.close()
+    if model_client is not None:
+        await embeddings.close()
+    else:
+        speech_processor.close()
+    shutdown_stages()
+    if embeddings.cache is not None:
+        embeddings.cache.flush()
     await db.close()
 
 
@@ -79,59 +190,123 @@ async def root():
     }
 
 
+@app.get("/health")
+async def liveness():
+    """Liveness: the process is up and serving requests"""
+    return {"status": "alive"}
+
+
+@app.get("/ready")
+async def readiness():
+    """
+    Readiness: 200 once the embedding model is loaded and warm, 503 before
+    
+    The model state is reported either way, separately from liveness.
+    """
+    model = embeddings.status()
+    body = {"status": "ready" if embeddings.ready else "warming", "embedding_model": model}
+    if not embeddings.ready:
+        return JSONResponse(status_code=503, content=body, headers={"Retry-After": "5"})
+    return body
+
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    """
+    Span latency histograms, counters and gauges in the Prometheus text format
+    
+    Under serve.py the model server's metrics are included, labelled
+    process="model_server". Each scrape reaches one API worker, so worker
+    metrics are labelled process="api-<pid>" there, which keeps every
+    counter series monotonic.
+    """
+    if not metrics.ENABLED:
+        raise HTTPException(status_code=404, detail="Metrics are disabled (METRICS_ENABLED=0)")
+    jobs = await enrichment.stats()
+    process = "api" if model_client is None else f"api-{os.getpid()}"
+    snapshots = {
+        process: metrics.REGISTRY.snapshot() + [
+            metrics.family("diary_enrich_jobs", "gauge", "Enrichment jobs by status", (
+                ({"status": "queued"}, jobs["queued"]),
+                ({"status": "running"}, jobs["running"]),
+                ({"status": "failed"}, jobs["failed_jobs"])
+            )),
+            metrics.family("diary_enrich_results_total", "counter", "Enrichment jobs finished by this worker", (
+                ({"result": "completed"}, jobs["completed"]),
+                ({"result": "failed"}, jobs["failed"]),
+                ({"result": "deferred"}, jobs["deferred"])
+            ))
+        ]
+    }
+    if model_client is not None:
+        try:
+            snapshots["model_server"] = await model_client.call("metrics")
+        except ModelServerError as e:
+            print(f"[WARN] Could not read model server metrics: {e}")
+    return Response(metrics.render(snapshots), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+@app.get("/api/stats")
+async def service_stats():
+    """Queue depth and throughput of the model stages"""
+    stats = {
+        "stages": stage_stats(),
+        "embedding": embeddings.batch_stats(),
+        "embedding_cache": embeddings.cache.stats() if embeddings.cache is not None else None,
+        "derived_media": derived_media.stats(),
+        "enrichment": await enrichment.stats()
+    }
+    if model_client is not None:
+        try:
+            stats["model_server"] = await model_client.call("stats")
+        except ModelServerError as e:
+            stats["model_server"] = {"error": str(e)}
+    return stats
+
+
 @app.post("/api/entries", response_model=EntryResponse)
 async def create_entry(
     title: str = Form(None),
     text: str = Form(None),
     audio: Optional[UploadFile] = File(None),
     image: Optional[UploadFile] = File(None),
-    tags: Optional[str] = Form(None)
+    tags: Optional[str] = Form(None),
+    transcription_model: Optional[str] = Form(None)
 ):
     """
     Create a new diary entry with text, audio, or image
+    
+    Only the raw entry and its media are saved before responding; it is
+    returned with enrichment_status "pending" while transcription, OCR,
+    embedding and graph linking run in the background. `transcription_model`
+    picks the Whisper model size; by default it follows the audio's duration.
     """
+    if transcription_model and transcription_model not in MODEL_SIZES:
+        raise HTTPException(status_code=400, detail=f"transcription_model must be one of {', '.join(MODEL_SIZES)}")
     try:
         entry_data = {
             "title": title or "Untitled",
-            "timestamp": datetime.utcnow().isoformat()
+            "text": text or None,
+            "timestamp": datetime.utcnow().isoformat(),
+            "tags": tags.split(",") if tags else []
         }
         
-        # Process text input
-        if text:
-            entry_data["text"] = text
+        # Refuse before storing any media if enrichment is too far behind
+        await enrichment.check_backlog()
         
-        # Process audio input
         if audio:
-            audio_filename = await save_file(audio, "audio")
-            transcription = await speech_processor.transcribe(audio_filename)
-            entry_data["audio_path"] = audio_filename
-            entry_data["text"] = (entry_data.get("text", "") + " " + transcription).strip()
-        
-        # Process image input
+            entry_data["audio_path"] = await save_file(audio, "audio")
+            if transcription_model:
+                entry_data["transcription_model"] = transcription_model
         if image:
-            image_filename = await save_file(image, "image")
-            # Extract text from image (OCR if needed)
-            image_text = await image_processor.process_image(image_filename)
-            entry_data["image_path"] = image_filename
-            entry_data["text"] = (entry_data.get("text", "") + " " + image_text).strip()
+            entry_data["image_path"] = await save_file(image, "image")
         
-        # Create embeddings
-        if entry_data.get("text"):
-            try:
-                entry_data["embedding"] = await embeddings.embed_text(entry_data["text"])
-            except Exception as emb_error:
-                print(f"[WARN] Could not generate embedding: {emb_error}")
-                # Continue without embedding - entry will still be saved
-                entry_data["embedding"] = None
-        
-        # Parse tags
-        entry_data["tags"] = tags.split(",") if tags else []
-        
-        # Save to database
-        entry = await db.create_entry(entry_data)
+        entry = await enrichment.submit(entry_data)
         
         return EntryResponse(**entry)
     
+    except (HTTPException, Overloaded):
+        raise
     except Exception as e:
         print(f"[ERROR] Failed to create entry: {e}")
         import traceback
@@ -139,12 +314,106 @@ async def create_entry(
         raise HTTPException(status_code=500, detail=f"Failed to create entry: {str(e)}")
 
 
-@app.get("/api/entries", response_model=List[EntryResponse])
-async def list_entries(skip: int = 0, limit: int = 100):
-    """Get all diary entries"""
+@app.post("/api/entries/bulk")
+async def create_entries_bulk(request: Request):
+    """
+    Import many entries at once
+    
+    The body is streamed as newline-delimited JSON (one EntryCreate object per
+    line) or sent as a JSON array. Entries are embedded and written in batches
+    of INGEST_BATCH_SIZE. Media paths must point inside the uploads directory.
+    """
+    rejected = []
+    
+    async def parse_items():
+        if request.headers.get("content-type", "").startswith("application/json"):
+            body = await request.json()
+            lines = body if isinstance(body, list) else [body]
+            for number, obj in enumerate(lines, start=1):
+                item = _bulk_item(number, obj, rejected)
+                if item:
+                    yield item
+            return
+        
+        # Newline-delimited JSON, parsed as the body streams in
+        buffer = b""
+        number = 0
+        async for chunk in request.stream():
+            buffer += chunk
+            *lines, buffer = buffer.split(b"\n")
+            for line in lines:
+                number += 1
+                item = _bulk_item(number, line, rejected)
+                if item:
+                    yield item
+        if buffer.strip():
+            item = _bulk_item(number + 1, buffer, rejected)
+            if item:
+                yield item
+    
     try:
-        entries = await db.get_all_entries(skip, limit)
-        return [EntryResponse(**entry) for entry in entries]
+        stats = await ingestor.ingest(parse_items())
+    except Exception as e:
+        print(f"[ERROR] Bulk import failed: {e}")
+        raise HTTPException(status_code=500, detail=f"Bulk import failed: {str(e)}")
+    
+    return {
+        "created": stats["created"],
+        "failed": stats["failed"] + len(rejected),
+        "ids": stats["ids"],
+        "errors": stats["errors"] + rejected
+    }
+
+
+def _bulk_item(number: int, line, rejected: List[str]) -> Optional[dict]:
+    """Validate one bulk import line, recording why it was rejected"""
+    try:
+        if isinstance(line, (bytes, str)):
+            if not line.strip():
+                return None
+            line = json.loads(line)
+        item = EntryCreate(**line).model_dump()
+        uploads_dir = os.path.realpath("uploads")
+        for key in ("audio_path", "image_path"):
+            path = item.get(key)
+            if path and os.path.commonpath([uploads_dir, os.path.realpath(path)]) != uploads_dir:
+                raise ValueError(f"{key} must be inside the uploads directory")
+        if item.get("transcription_model") and item["transcription_model"] not in MODEL_SIZES:
+            raise ValueError(f"transcription_model must be one of {', '.join(MODEL_SIZES)}")
+        item["source"] = f"line {number}"  # names the item if it fails later
+        return item
+    except Exception as e:
+        rejected.append(f"line {number}: {e}")
+        return None
+
+
+@app.get("/api/entries", response_model=EntryPage)
+async def list_entries(
+    limit: int = 100,
+    cursor: Optional[str] = None,
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    status: Optional[str] = None
+):
+    """
+    Get diary entries, newest first
+    
+    Pass the returned next_cursor to fetch the following page. start/end
+    (ISO timestamps) restrict the range; status (pending, ready or failed)
+    filters on enrichment status.
+    """
+    try:
+        if status and status not in ENRICHMENT_STATUSES:
+            raise ValueError(f"status must be one of {', '.join(ENRICHMENT_STATUSES)}")
+        entries, next_cursor = await db.get_entries_page(
+            min(max(limit, 1), 500), cursor, start, end, status
+        )
+        return EntryPage(
+            entries=[EntryResponse(**entry) for entry in entries],
+            next_cursor=next_cursor
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -169,22 +438,31 @@ async def semantic_search(query: SearchQuery):
     Perform semantic search on diary entries
     Returns relevant entries with similarity scores
     """
+    if not embeddings.ready and embeddings.state != "failed":
+        raise HTTPException(
+            status_code=503,
+            detail=f"Embedding model is not ready ({embeddings.state})",
+            headers={"Retry-After": "5"}
+        )
     try:
         # Generate query embedding
         query_embedding = await embeddings.embed_text(query.text)
         
         # Search in database
-        results = await db.semantic_search(query_embedding, query.limit or 10)
+        results, search_path = await db.vector_search(query_embedding, query.limit or 10)
         
         # Format results
         response = {
             "query": query.text,
             "results": results,
-            "total": len(results)
+            "total": len(results),
+            "search_path": search_path
         }
         
         return response
     
+    except Overloaded:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -196,19 +474,9 @@ async def answer_question(query: SearchQuery):
     Example: "Tell me about the happiest moments in my life"
     """
     try:
-        # Try semantic search first
-        try:
-            query_embedding = await embeddings.embed_text(query.text)
-            if embeddings.model is not None and query_embedding is not None and query_embedding.sum() != 0:
-                # Search relevant entries using embeddings
-                results = await db.semantic_search(query_embedding, query.limit or 20)
-            else:
-                # Fallback to text search if embeddings unavailable
-                results = await db.text_search(query.text, query.limit or 20)
-        except Exception as emb_error:
-            print(f"[WARN] Embedding search failed, using text search: {emb_error}")
-            # Fallback to text-based search
-            results = await db.text_search(query.text, query.limit or 20)
+        # Vector and keyword search run concurrently and are fused by rank
+        retrieval = await retriever.search(query.text, query.limit or 20)
+        results = retrieval["results"]
         
         # Generate summary
         summary = await embeddings.generate_summary(query.text, results) if results else "No results found."
@@ -226,30 +494,44 @@ async def answer_question(query: SearchQuery):
             "summary": summary,
             "relevant_entries": results[:10] if results else [],
             "media": media,
-            "count": len(results) if results else 0
+            "count": len(results) if results else 0,
+            "search_path": "hybrid",
+            "retrieval": retrieval["legs"]
         }
     
+    except Overloaded:
+        raise
     except Exception as e:
         print(f"[ERROR] Query failed: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @app.get("/api/media/{entry_id}")
-async def get_media(entry_id: str):
-    """Serve media files for an entry"""
+async def get_media(entry_id: str, request: Request, variant: Optional[str] = None):
+    """
+    Serve media files for an entry
+    
+    `variant` (thumb or medium) returns a resized copy of the entry's image.
+    Entry media paths are remembered, so repeat requests skip the database.
+    """
     try:
-        entry = await db.get_entry_by_id(entry_id)
-        if not entry:
-            raise HTTPException(status_code=404, detail="Entry not found")
+        paths = media_paths.get(entry_id)
+        if paths is None:
+            entry = await db.get_entry_by_id(entry_id)
+            if not entry:
+                raise HTTPException(status_code=404, detail="Entry not found")
+            paths = (entry.get("image_path"), entry.get("audio_path"))
+            media_paths.put(entry_id, *paths)
+        image_path, audio_path = paths
         
-        if entry.get("image_path") and os.path.exists(entry["image_path"]):
-            return FileResponse(entry["image_path"])
-        elif entry.get("audio_path") and os.path.exists(entry["audio_path"]):
-            return FileResponse(entry["audio_path"], media_type="audio/mpeg")
+        if image_path and os.path.exists(image_path):
+            return await serve_media(request, image_path, variant)
+        elif audio_path and os.path.exists(audio_path):
+            return await serve_media(request, audio_path, variant)
         else:
             raise HTTPException(status_code=404, detail="No media found")
     
-    except HTTPException:
+    except (HTTPException, Overloaded):
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -260,6 +542,7 @@ async def delete_entry(entry_id: str):
     """Delete a diary entry"""
     try:
         success = await db.delete_entry(entry_id)
+        media_paths.discard(entry_id)
         if not success:
             raise HTTPException(status_code=404, detail="Entry not found")
         return {"status": "deleted", "id": entry_id}
@@ -269,28 +552,89 @@ async def delete_entry(entry_id: str):
         raise HTTPException(status_code=500, detail=str(e))
 
 
-async def save_file(file: UploadFile, file_type: str) -> str:
-    """Save uploaded file and return path"""
-    timestamp = datetime.utcnow().strftime("%Y%m%d_%H%M%S")
-    
-    # Determine file extension
-    ext = os.path.splitext(file.filename)[1] if file.filename else ".tmp"
+@app.get("/uploads/{file_path:path}")
+async def get_upload(file_path: str, request: Request, variant: Optional[str] = None):
+    """Serve an uploaded file, or a resized variant of an uploaded image"""
+    uploads_dir = os.path.realpath("uploads")
+    incoming_dir = os.path.realpath(media_store.incoming)
+    path = os.path.realpath(os.path.join(uploads_dir, file_path))
+    if (
+        os.path.commonpath([uploads_dir, path]) != uploads_dir
+        or os.path.commonpath([incoming_dir, path]) == incoming_dir
+        or not os.path.isfile(path)
+    ):
+        raise HTTPException(status_code=404, detail="File not found")
+    return await serve_media(request, path, variant)
+
+
+async def serve_media(request: Request, path: str, variant: Optional[str] = None):
+    """Serve a media file or one of its derived variants"""
+    # Content-addressed files never change, and neither do variants of them
+    immutable = is_content_addressed(path)
+    if variant:
+        if variant not in VARIANTS:
+            raise HTTPException(status_code=400, detail=f"variant must be one of {', '.join(VARIANTS)}")
+        if os.path.splitext(path)[1].lower() not in IMAGE_EXTENSIONS:
+            raise HTTPException(status_code=400, detail="Variants are only available for images")
+        path = await derived_media.get(path, variant)
+    return media_response(request, path, immutable)
+
+
+def media_response(request: Request, path: str, immutable: bool = False) -> Response:
+    """
+    Response for a file with ETag/Last-Modified validators and byte ranges
     
-    # Create filename
-    if file_type == "audio":
-        ext = ext if ext in [".mp3", ".wav", ".m4a", ".ogg"] else ".mp3"
-    elif file_type == "image":
-        ext = ext if ext in [".jpg", ".jpeg", ".png", ".gif", ".webp"] else ".png"
+    Conditional requests get 304, and a single `Range` (honouring `If-Range`)
+    gets 206 so audio can be seeked without downloading the whole file.
+    """
+    stat = os.stat(path)
+    media_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+    headers = validators(path, stat)
+    headers["Accept-Ranges"] = "bytes"
+    headers["Cache-Control"] = "public, max-age=31536000, immutable" if immutable else "no-cache"
     
-    filename = f"{file_type}_{timestamp}{ext}"
-    filepath = os.path.join("uploads", filename)
+    if not_modified(request.headers, headers["ETag"], stat.st_mtime):
+        return Response(status_code=304, headers=headers)
     
-    # Save file
-    async with aiofiles.open(filepath, 'wb') as f:
-        content = await file.read()
-        await f.write(content)
+    byte_range = None
+    if_range = request.headers.get("if-range")
+    if if_range is None or if_range in (headers["ETag"], headers["Last-Modified"]):
+        try:
+            byte_range = parse_range(request.headers.get("range"), stat.st_size)
+        except ValueError:
+            headers["Content-Range"] = f"bytes */{stat.st_size}"
+            return Response(status_code=416, headers=headers)
+    if byte_range is None:
+        return FileResponse(path, media_type=media_type, headers=headers, stat_result=stat)
     
-    return filepath
+    start, end = byte_range
+    headers["Content-Range"] = f"bytes {start}-{end}/{stat.st_size}"
+    headers["Content-Length"] = str(end - start + 1)
+    return StreamingResponse(
+        read_range(path, start, end), status_code=206, media_type=media_type, headers=headers
+    )
+
+
+async def read_range(path: str, start: int, end: int, chunk_size: int = 64 * 1024):
+    """Yield bytes start..end (inclusive) of a file"""
+    remaining = end - start + 1
+    async with aiofiles.open(path, "rb") as f:
+        await f.seek(start)
+        while remaining > 0:
+            chunk = await f.read(min(chunk_size, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+async def save_file(file: UploadFile, file_type: str) -> str:
+    """Stream an upload to its content-addressed path and return that path"""
+    try:
+        with metrics.span("save_media"):
+            return await media_store.save_upload(file, file_type)
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
 
 
 if __name__ == "__main__":
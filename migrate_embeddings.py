@@ -0,0 +1,45 @@
+"""
+Convert stored entry embeddings to another precision
+
+Rewrites every entry's embedding as float32 (the indexable `embedding`
+property), float16, or int8 with a per-vector scale, in batches. Entries
+already in the target precision are skipped, so the command can be re-run
+after an interruption. Set EMBEDDING_PRECISION to the same value afterwards.
+
+Usage: python migrate_embeddings.py --precision int8 [--batch-size 1000]
+"""
+import argparse
+import asyncio
+import os
+import time
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from diary.quantization import PRECISIONS
+
+
+async def migrate(args):
+    # The backend (and its ANN index) pick the target precision up from the environment
+    os.environ["EMBEDDING_PRECISION"] = args.precision
+    from diary.storage import create_database
+
+    db = create_database()
+    if not hasattr(db, "convert_embeddings"):
+        print("[ERROR] This storage backend keeps float32 embeddings and has nothing to migrate")
+        return
+    await db.connect()
+
+    try:
+        started = time.time()
+        converted = await db.convert_embeddings(args.batch_size)
+        print(f"[OK] Converted {converted} embeddings to {args.precision} in {time.time() - started:.1f}s")
+    finally:
+        await db.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert stored embeddings to another precision")
+    parser.add_argument("--precision", choices=PRECISIONS, required=True, help="Target storage precision")
+    parser.add_argument("--batch-size", type=int, default=1000, help="Entries per read/write batch")
+    asyncio.run(migrate(parser.parse_args()))
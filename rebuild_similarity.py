@@ -0,0 +1,59 @@
+"""
+Rebuild the SIMILAR_TO graph offline
+
+Exports all entry embeddings, recomputes each entry's top-k neighbours with
+blocked NumPy matrix multiplies and rewrites every SIMILAR_TO relationship in
+UNWIND batches.
+
+Usage: python rebuild_similarity.py [--top-k 10] [--threshold 0.85]
+"""
+import argparse
+import asyncio
+import os
+import time
+import numpy as np
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from diary.storage import create_database
+from diary.similarity import similarity_edges
+
+
+async def rebuild(args):
+    db = create_database()
+    await db.connect()
+
+    try:
+        started = time.time()
+        print("Exporting embeddings...")
+        ids = []
+        blocks = []
+        async for batch_ids, batch_vectors in db.export_embeddings(args.batch_size):
+            ids.extend(batch_ids)
+            blocks.append(batch_vectors)
+            print(f"  {len(ids)} entries exported")
+
+        if not ids:
+            print("[INFO] No embedded entries found, nothing to rebuild")
+            return
+
+        vectors = np.vstack(blocks)
+        print(f"Computing top-{args.top_k} neighbours for {len(ids)} entries...")
+        edges = similarity_edges(ids, vectors, args.top_k, args.threshold, args.block_size)
+        print(f"  {len(edges)} edges above threshold {args.threshold}")
+
+        print("Writing SIMILAR_TO relationships...")
+        written = await db.replace_similarity_edges(edges, args.batch_size)
+        print(f"[OK] Rebuilt {written} similarity edges in {time.time() - started:.1f}s")
+    finally:
+        await db.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rebuild the SIMILAR_TO similarity graph")
+    parser.add_argument("--top-k", type=int, default=int(os.getenv("SIMILARITY_TOP_K", 10)), help="Neighbours kept per entry")
+    parser.add_argument("--threshold", type=float, default=float(os.getenv("SIMILARITY_THRESHOLD", 0.85)), help="Minimum cosine similarity")
+    parser.add_argument("--block-size", type=int, default=1024, help="Rows per matrix multiply block")
+    parser.add_argument("--batch-size", type=int, default=5000, help="Rows per export/write batch")
+    asyncio.run(rebuild(parser.parse_args()))
@@ -0,0 +1,137 @@
+"""
+Production server: several API workers sharing one model-server process
+
+Starts the model server (embedding, Whisper and OCR models, loaded once),
+then N uvicorn workers running main.py that reach it over a Unix socket and
+import none of the ML libraries. Interrupted enrichment jobs are re-queued
+once here, before the workers start. On SIGINT/SIGTERM the workers finish
+their requests first; the model server is stopped last.
+
+Several workers need a storage configuration without per-process indexes:
+the Neo4j backend with float32 embeddings. The local ANN index is turned off
+(searches use the Neo4j vector index), keyword search uses the Neo4j
+full-text index, or scans entries if it is unavailable, never the in-process
+BM25 index, and the media path cache is turned off. Unix sockets are
+required, so this does not run on Windows.
+
+Usage: python serve.py [--workers 4] [--model-concurrency 64] [--host 0.0.0.0] [--port 8000]
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import time
+from typing import Optional
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+import uvicorn
+
+from diary.enrichment import JobStore
+from diary.model_server import run_model_server
+
+
+def shared_state_problem() -> Optional[str]:
+    """Why several API workers cannot share the configured storage, if they cannot"""
+    backend = os.getenv("DIARY_BACKEND", "neo4j").lower()
+    if backend != "neo4j":
+        return f"DIARY_BACKEND={backend} keeps its vector matrix in process memory"
+    precision = os.getenv("EMBEDDING_PRECISION", "float32")
+    if precision != "float32":
+        return (f"EMBEDDING_PRECISION={precision} needs the local ANN index, which is held in each process; "
+                "use float32 embeddings to search with the Neo4j vector index")
+    return None
+
+
+async def requeue_interrupted_jobs() -> int:
+    store = JobStore(os.getenv("ENRICH_JOBS_PATH", "./data/jobs.db"))
+    try:
+        return await store.open(requeue=True)
+    finally:
+        await store.close()
+
+
+def wait_for_socket(path: str, process, timeout: float) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if os.path.exists(path):
+            return True
+        if not process.is_alive():
+            return False
+        time.sleep(0.1)
+    return False
+
+
+def serve(args):
+    if args.workers > 1:
+        problem = shared_state_problem()
+        if problem:
+            print(f"[ERROR] {args.workers} API workers cannot share this storage configuration: {problem}")
+            print("[INFO] Run with --workers 1, or change the configuration")
+            sys.exit(2)
+
+    resumed = asyncio.run(requeue_interrupted_jobs())
+    if resumed:
+        print(f"[INFO] Resuming {resumed} interrupted enrichment jobs")
+
+    # mkdtemp creates the directory with mode 0700
+    socket_dir = tempfile.mkdtemp(prefix="diary-model-")
+    socket_path = os.path.join(socket_dir, "model.sock")
+    context = multiprocessing.get_context("spawn")
+    model_server = context.Process(
+        target=run_model_server, args=(socket_path, args.model_concurrency), name="diary-model-server"
+    )
+    model_server.start()
+    try:
+        if not wait_for_socket(socket_path, model_server, 60):
+            print("[ERROR] The model server did not start")
+            sys.exit(1)
+
+        # Inherited by the uvicorn workers
+        os.environ["MODEL_SERVER_SOCKET"] = socket_path
+        os.environ["ENRICH_REQUEUE_ON_START"] = "0"
+        if args.workers > 1:
+            # Each worker would keep its own copy of the local ANN index, and
+            # only one process may own it; the Neo4j vector index is shared
+            if os.getenv("ANN_INDEX_DIR", "./data/ann_index"):
+                print("[INFO] Local ANN index disabled with several workers; searches use the Neo4j vector index")
+            os.environ["ANN_INDEX_DIR"] = ""
+            # Without a Neo4j full-text index, keyword search must not use an
+            # index that only sees the writes one worker handled
+            os.environ["IN_PROCESS_TEXT_INDEX"] = "0"
+            # A delete only clears the media path cache of the worker that
+            # handled it, so the others would keep serving the entry's media
+            os.environ["MEDIA_PATH_CACHE_SIZE"] = "0"
+        uvicorn.run(
+            "main:app",
+            host=args.host,
+            port=args.port,
+            workers=args.workers,
+            timeout_graceful_shutdown=args.graceful_timeout
+        )
+    finally:
+        # The workers have finished their requests; now stop the model server
+        model_server.terminate()
+        model_server.join(args.graceful_timeout + 5)
+        if model_server.is_alive():
+            print("[WARN] Model server did not stop in time; killing it")
+            model_server.kill()
+            model_server.join()
+        shutil.rmtree(socket_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run API workers sharing one model-server process")
+    parser.add_argument("--workers", type=int, default=int(os.getenv("WEB_WORKERS", 2)), help="API worker processes")
+    parser.add_argument("--model-concurrency", type=int, default=int(os.getenv("MODEL_SERVER_CONCURRENCY", 64)),
+                        help="Model-server requests handled at once, across all workers")
+    parser.add_argument("--host", default=os.getenv("HOST", "0.0.0.0"), help="Bind address")
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", 8000)), help="Bind port")
+    parser.add_argument("--graceful-timeout", type=int, default=30,
+                        help="Seconds workers get to finish requests on shutdown")
+    serve(parser.parse_args())